@@ -16,8 +16,11 @@ def create_app(reg: System = None):
     return _app
 
 
-pipeman_init(extra_files=[".pipeman.app.toml"])
-app = create_app()
+# Worker processes started with "spawn" import the main script again as __mp_main__; they set themselves up separately
+# (see pipeman.workflow.process_pool), so only build the application when imported by the WSGI server or run directly
+if __name__ != "__mp_main__":
+    pipeman_init(extra_files=[".pipeman.app.toml"])
+    app = create_app()
 
 if __name__ == "__main__":
     app.run()
@@ -16,6 +16,8 @@ def create_cli(reg: System = None):
     return reg.init_cli(_app)
 
 
-pipeman_init(extra_files=[".pipeman.cli.toml"])
-app2 = create_cli()
-app2()
+# Worker processes started with "spawn" import this module again, so only run the CLI when it is the entry point
+if __name__ == "__main__":
+    pipeman_init(extra_files=[".pipeman.cli.toml"])
+    app2 = create_cli()
+    app2()
@@ -10,6 +10,7 @@ def create_cli(reg: System = None):
     return reg.init_cli(_app)
 
 
-pipeman_init(extra_files=[".pipeman.cli.toml"])
-app2 = create_cli()
-app2()
+if __name__ == "__main__":
+    pipeman_init(extra_files=[".pipeman.cli.toml"])
+    app2 = create_cli()
+    app2()
@@ -9,10 +9,12 @@ def iso19115():
 
 
 @iso19115.command
-def update():
-    do_update()
+@click.option("--codelists", default=None, help="Local copy of the ISO-19115 codelist catalogue (XML)")
+@click.option("--link-properties", default=None, help="Local copy of the link property lookup table (CSV)")
+def update(codelists, link_properties):
+    do_update(codelists, link_properties)
 
 
 @injector.inject
-def do_update(vm: ISO19115VocabularyManager = None):
-    vm.fetch()
+def do_update(codelists=None, link_properties=None, vm: ISO19115VocabularyManager = None):
+    vm.fetch(codelists, link_properties)
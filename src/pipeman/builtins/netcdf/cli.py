@@ -9,10 +9,13 @@ def netcdf():
 
 
 @netcdf.command
-def update():
-    do_update()
+@click.option("--cf-standard-names", default=None, help="Local copy of the CF standard name table (XML)")
+@click.option("--ud-prefixes", multiple=True, help="Local copy of a UDUNITS prefix file (XML)")
+@click.option("--ud-units", multiple=True, help="Local copy of a UDUNITS unit file (XML)")
+def update(cf_standard_names, ud_prefixes, ud_units):
+    do_update(cf_standard_names, list(ud_prefixes) or None, list(ud_units) or None)
 
 
 @injector.inject
-def do_update(vm: CFVocabularyManager = None):
-    vm.fetch()
+def do_update(cf_standard_names=None, ud_prefixes=None, ud_units=None, vm: CFVocabularyManager = None):
+    vm.fetch(cf_standard_names, ud_prefixes, ud_units)
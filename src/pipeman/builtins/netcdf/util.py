@@ -2,11 +2,11 @@ import json
 
 import netCDF4._netCDF4
 import numpy
-import requests
 
 from pipeman.entity.entity_field import EntityReferenceField
 from pipeman.util.flask import ActionList
 from pipeman.vocab import VocabularyTermController
+from pipeman.vocab.ingest import VocabularyIngester, open_source, iter_xml_elements
 from pipeman.dataset.dataset import Dataset
 from pipeman.util import load_object
 from pipeman.entity.fields import Field, VocabularyTerm, TextField
@@ -15,9 +15,7 @@ from pipeman.entity.entity import Entity, FieldContainer
 from pipeman.i18n import TranslationManager
 from autoinject import injector
 import zirconium as zr
-import xml.etree.ElementTree as ET
 import logging
-import bs4
 import zrlog
 import datetime
 import functools
@@ -589,111 +587,90 @@ def _variable_attributes(var: Entity):
 @injector.injectable
 class CFVocabularyManager:
 
-    vtc: VocabularyTermController = None
+    CF_STANDARD_NAMES_SOURCE = "https://cfconventions.org/Data/cf-standard-names/current/src/cf-standard-name-table.xml"
+    UD_PREFIX_SOURCES = [
+        "https://docs.unidata.ucar.edu/udunits/current/udunits2-prefixes.xml",
+    ]
+    UD_UNIT_SOURCES = [
+        "https://docs.unidata.ucar.edu/udunits/current/udunits2-base.xml",
+        "https://docs.unidata.ucar.edu/udunits/current/udunits2-derived.xml",
+        "https://docs.unidata.ucar.edu/udunits/current/udunits2-accepted.xml",
+    ]
+
+    ingester: VocabularyIngester = None
 
     @injector.construct
     def __init__(self):
         self.log = logging.getLogger("pipeman.netcdf")
 
-    def fetch(self):
-        self.fetch_cf_standard_names()
-        self.fetch_ud_prefixes()
-        self.fetch_ud_units()
+    def fetch(self, cf_standard_names: str = None, ud_prefixes: list[str] = None, ud_units: list[str] = None):
+        """Load the vocabularies; each source can be replaced by a local copy of the file."""
+        self.fetch_cf_standard_names(cf_standard_names)
+        self.fetch_ud_prefixes(ud_prefixes)
+        self.fetch_ud_units(ud_units)
 
-    def fetch_cf_standard_names(self):
+    def fetch_cf_standard_names(self, source: str = None):
         self.log.info(f"Loading CF standard names")
         try:
-            # TODO convert to http://cfconventions.org/Data/cf-standard-names/current/src/cf-standard-name-table.xml
-            terms = {}
-            link = "https://cfconventions.org/Data/cf-standard-names/current/build/cf-standard-name-table.html"
-            resp = requests.get(link)
-            resp.raise_for_status()
-            soup = bs4.BeautifulSoup(resp.text, 'html.parser')
-            sn_table = soup.find('table', id="standard_name_table")
-            for sn_tr in sn_table.find_all("tr"):
-                base = sn_tr.find("td")
-                var_name = base.find("div", attrs={"class": "standard-name-summary"}).find("span").text
-                var_desc = sn_tr.find("div", attrs={"class": "standard-name-description"}).text
-                terms[var_name] = {
-                    "display": {
-                        "en": var_name,
-                    },
-                    "description": {
-                        "en": var_desc,
-                    }
-                }
+            terms = self.ingester.stage("cf_standard_names")
+            with open_source(source or self.CF_STANDARD_NAMES_SOURCE) as h:
+                for entry in iter_xml_elements(h, "entry"):
+                    var_name = entry.get("id")
+                    terms.add(
+                        var_name,
+                        {"en": var_name},
+                        {"en": (entry.findtext("description") or "").strip()}
+                    )
             self.log.info(f"Found {len(terms)} standard names")
-            self.vtc.save_terms_from_dict("cf_standard_names", terms)
+            self.ingester.apply(terms)
         except Exception as ex:
             self.log.exception(ex)
 
-    def fetch_ud_prefixes(self):
+    def fetch_ud_prefixes(self, sources: list[str] = None):
         self.log.info("Loading UDUnit prefixes")
-        terms = {}
-        links = [
-            "https://docs.unidata.ucar.edu/udunits/current/udunits2-prefixes.xml",
-        ]
-        for link in links:
+        terms = self.ingester.stage("udunit_prefixes")
+        for link in sources or self.UD_PREFIX_SOURCES:
             try:
-                resp = requests.get(link)
-                tree = ET.fromstring(resp.text)
-                for prefix in tree.findall("prefix"):
-                    name = prefix.find("name").text
-                    value = prefix.find("value").text
-                    symbol = prefix.find("symbol").text
-                    terms[symbol] = {
-                        "display": {
-                            "und": name,
-                        },
-                        "description": {
-                            "en": f"Multiplied by {value}",
-                            "fr": f"Multiplié par {value}"
-                        }
-                    }
+                with open_source(link) as h:
+                    for prefix in iter_xml_elements(h, "prefix"):
+                        name = prefix.find("name").text
+                        value = prefix.find("value").text
+                        symbol = prefix.find("symbol").text
+                        terms.add(
+                            symbol,
+                            {"und": name},
+                            {"en": f"Multiplied by {value}", "fr": f"Multiplié par {value}"}
+                        )
             except Exception as ex:
                 self.log.exception(ex)
         self.log.info(f"Found {len(terms)} udunit prefixes")
-        self.vtc.save_terms_from_dict("udunit_prefixes", terms)
+        self.ingester.apply(terms)
 
-    def fetch_ud_units(self):
+    def fetch_ud_units(self, sources: list[str] = None):
         self.log.info(f"Loading UDUnit units")
-        links = [
-            "https://docs.unidata.ucar.edu/udunits/current/udunits2-base.xml",
-            "https://docs.unidata.ucar.edu/udunits/current/udunits2-derived.xml",
-            "https://docs.unidata.ucar.edu/udunits/current/udunits2-derived.xml",
-            "https://docs.unidata.ucar.edu/udunits/current/udunits2-accepted.xml",
-        ]
-        terms = {}
-        for link in links:
+        terms = self.ingester.stage("udunit_units")
+        for link in sources or self.UD_UNIT_SOURCES:
             try:
-                resp = requests.get(link)
-                tree = ET.fromstring(resp.text)
-                for unit in tree.findall("unit"):
-                    n = unit.find("name")
-                    if n is None:
-                        n = unit.find("aliases").find("name")
-                    name = n.find("singular").text
-                    desc = unit.find("definition").text
-                    sym = unit.find("symbol")
-                    if sym is None:
-                        sym = unit.find("aliases").find("symbol")
-                    symbol = sym.text if sym is not None else name
-                    if symbol in terms and terms[symbol]["description"]["en"] != desc:
-                        logging.getLogger("pipeman.netcdf").warning(f"Duplicate unit name detected: {symbol}")
-                        continue
-
-                    terms[symbol] = {
-                        "display": {
-                            "und": f"{name} [{symbol}]" if symbol != name else name,
-                        },
-                        "description": {
-                            "en": desc,
-                        }
-                    }
+                with open_source(link) as h:
+                    for unit in iter_xml_elements(h, "unit"):
+                        n = unit.find("name")
+                        if n is None:
+                            n = unit.find("aliases").find("name")
+                        name = n.find("singular").text
+                        desc = unit.find("definition").text
+                        sym = unit.find("symbol")
+                        if sym is None:
+                            sym = unit.find("aliases").find("symbol")
+                        symbol = sym.text if sym is not None else name
+                        if symbol in terms and terms.get(symbol)[1].get("en") != desc:
+                            self.log.warning(f"Duplicate unit name detected: {symbol}")
+                            continue
+                        terms.add(
+                            symbol,
+                            {"und": f"{name} [{symbol}]" if symbol != name else name},
+                            {"en": desc}
+                        )
             except Exception as ex:
                 self.log.exception(ex)
         self.log.info(f"Found {len(terms)} udunit units")
-        self.vtc.save_terms_from_dict("udunit_units", terms)
-
-
-
+        self.ingester.apply(terms)
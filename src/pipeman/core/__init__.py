@@ -21,6 +21,7 @@ def init(system):
     system.register_cli("pipeman.core.cli", "core")
     system.register_cli("pipeman.core.cli", "test")
     system.register_cli("pipeman.core.cli", "datasets")
+    system.register_cli("pipeman.core.cli", "vocab")
     system.register_blueprint("pipeman.core.app", "base")
     system.register_blueprint("pipeman.core.app", "core")
     system.on_app_init(core_init_app)
@@ -143,3 +144,8 @@ def core_init_app(app, system: System = None):
     if 'csrf' in app.extensions:
         app.extensions['csrf'].exempt('pipeman.core.app.create_dataset_from_api_call')
         app.extensions['csrf'].exempt('pipeman.core.app.upsert_dataset_from_api_call')
+        app.extensions['csrf'].exempt('pipeman.core.app.pop_remote_item')
+        app.extensions['csrf'].exempt('pipeman.core.app.release_remote_item')
+        app.extensions['csrf'].exempt('pipeman.core.app.renew_remote_item')
+        app.extensions['csrf'].exempt('pipeman.core.app.item_completed')
+        app.extensions['csrf'].exempt('pipeman.core.app.item_cancelled')
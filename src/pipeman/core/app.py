@@ -487,6 +487,9 @@ def generate_metadata_format_long(dataset_id, revision_no, profile_name, format_
     try:
         if not con.metadata_format_exists(profile_name, format_name):
             return flask.abort(404)
+        not_modified = con.metadata_file_not_modified(dataset_id, revision_no, profile_name, format_name, environment)
+        if not_modified is not None:
+            return not_modified
         dataset = con.load_dataset(dataset_id, revision_no)
         if not con.has_access(dataset, "view", is_attempt=True):
             return flask.abort(403)
@@ -507,6 +510,9 @@ def generate_metadata_format_api(dataset_id, revision_no, profile_name, format_n
     try:
         if not con.metadata_format_exists(profile_name, format_name):
             return flask.abort(404)
+        not_modified = con.metadata_file_not_modified(dataset_id, revision_no, profile_name, format_name, environment)
+        if not_modified is not None:
+            return not_modified
         dataset = con.load_dataset(dataset_id, revision_no)
         if not con.has_access(dataset, "view", is_attempt=True):
             return flask.abort(403)
@@ -583,41 +589,41 @@ def api_entity_select_field_list(entity_types, by_revision: int):
         return flask.abort(404)
     return EntitySelectField.results_list(entity_types.split("|"), flask.request.args.get("term"), by_revision == 1)
 
-"""""
-@core.i18n_route("/api/pop-remote-item/<pipeline_name>")
-@require_permission("remote_items.access")
+
+@core.i18n_route("/api/pop-remote-item/<pipeline_name>", methods=["POST"])
+@require_permission("remote_items.access", check_referrer=False)
 @injector.inject
 def pop_remote_item(pipeline_name, wfc: WorkflowController = None):
     return wfc.pop_remote_pipeline(pipeline_name)
 
 
-@core.i18n_route("/api/release-remote-item/<int:item_id>")
-@require_permission("remote_items.access")
+@core.i18n_route("/api/release-remote-item/<int:item_id>", methods=["POST"])
+@require_permission("remote_items.access", check_referrer=False)
 @injector.inject
 def release_remote_item(item_id, wfc: WorkflowController = None):
     return wfc.release_remote_lock(item_id)
 
 
-@core.i18n_route("/api/renew-remote-item/<int:item_id>")
-@require_permission("remote_items.access")
+@core.i18n_route("/api/renew-remote-item/<int:item_id>", methods=["POST"])
+@require_permission("remote_items.access", check_referrer=False)
 @injector.inject
 def renew_remote_item(item_id, wfc: WorkflowController = None):
     return wfc.renew_remote_lock(item_id)
 
 
-@core.i18n_route("/api/complete-remote-item/<int:item_id>")
-@require_permission("remote_items.access")
+@core.i18n_route("/api/complete-remote-item/<int:item_id>", methods=["POST"])
+@require_permission("remote_items.access", check_referrer=False)
 @injector.inject
 def item_completed(item_id, wfc: WorkflowController = None):
     return wfc.remote_work_complete(item_id, True)
 
 
-@core.i18n_route("/api/cancel-remote-item/<int:item_id>")
-@require_permission("remote_items.access")
+@core.i18n_route("/api/cancel-remote-item/<int:item_id>", methods=["POST"])
+@require_permission("remote_items.access", check_referrer=False)
 @injector.inject
 def item_cancelled(item_id, wfc: WorkflowController = None):
     return wfc.remote_work_complete(item_id, False)
-"""
+
 
 @core.i18n_route("/organizations")
 @require_permission("organizations.view")
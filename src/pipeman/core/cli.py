@@ -10,11 +10,14 @@ from pipeman.smtpout import EmailController
 from pipeman.workflow import WorkflowController
 from pipeman.util import System
 from pipeman.dataset import MetadataRegistry, DatasetController
+from pipeman.dataset.republish import BulkRepublisher
 from pipeman.vocab import VocabularyTermController, VocabularyRegistry
+from pipeman.vocab.importer import VocabularyImporter
 from pipeman.entity import EntityRegistry
 from pipeman.workflow import WorkflowRegistry
 import asyncio
 import csv
+import threading
 
 
 @click.group
@@ -23,9 +26,44 @@ def datasets(): ...
 
 @datasets.command
 @click.option("--dataset", default=-1, type=int)
+@click.option("--profile", default=None, help="Only datasets using this profile")
+@click.option("--organization", default=None, help="Only datasets owned by this organization (short name or ID)")
+@click.option("--modified-since", default=None, type=click.DateTime(), help="Only datasets modified since this time")
+@click.option("--workers", default=None, type=int, help="Number of datasets to republish at once")
+@click.option("--mode", default=None, type=click.Choice(["thread", "process"]))
+@click.option("--chunk-size", default=None, type=int, help="Number of dataset IDs to read at once")
+@click.option("--resume", is_flag=True, default=False, help="Continue an interrupted run with the same filters")
+def republish(dataset: int, profile, organization, modified_since, workers, mode, chunk_size, resume):
+    report = BulkRepublisher(workers, mode, chunk_size).run(
+        dataset_id=dataset if dataset > 0 else None,
+        profile=profile,
+        organization=organization,
+        modified_since=modified_since,
+        resume=resume
+    )
+    if report.resumed_after is not None:
+        print(f"Resumed after dataset {report.resumed_after}")
+    for ds_id, error in report.failures:
+        print(f"{ds_id}: {error}")
+    print(report.summary())
+
+
+@click.group
+def vocab(): ...
+
+
+@vocab.command("import")
+@click.argument("vocab_name")
+@click.argument("term_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--replace", is_flag=True, default=False, help="Replace existing terms and remove terms not in the file")
+@click.option("--chunk-size", default=None, type=int, help="Number of terms to write at once")
 @injector.inject
-def republish(dataset: int, ds_controller: DatasetController):
-    ds_controller.republish(dataset)
+def import_terms(vocab_name, term_file, replace, chunk_size, vreg: VocabularyRegistry = None):
+    """Import terms from a CSV file (short_name, display__LANG, description__LANG) or a YAML file."""
+    if vocab_name not in vreg:
+        raise click.BadParameter(f"No vocabulary named {vocab_name}", param_hint="vocab_name")
+    report = VocabularyImporter(chunk_size).import_file(vocab_name, term_file, replace)
+    print(report.summary())
 
 
 @click.group
@@ -51,9 +89,9 @@ def batch(wfc: WorkflowController):
 
 
 @workflow.command
-@injector.inject
-def async_batch(wfs: WorkflowController):
-    asyncio.run(wfs.async_batch_process_items())
+def async_batch():
+    from pipeman.workflow.async_engine import AsyncWorkflowEngine
+    asyncio.run(AsyncWorkflowEngine(threading.Event()).run(until_idle=True))
 
 
 @click.group
@@ -4,11 +4,13 @@ from pipeman.db.db import Database, SessionWrapper
 import pipeman.db.orm as orm
 from pipeman.util.errors import DatasetNotFoundError, APIInputError
 from .dataset import MetadataRegistry
+from .render_cache import RenderedMetadataCache
 import json
 import datetime
 from sqlalchemy.exc import IntegrityError
 import flask_login
 import flask
+import werkzeug.http
 import sqlalchemy as sa
 import wtforms as wtf
 import zrlog
@@ -43,6 +45,7 @@ class DatasetController:
     workflow: WorkflowController = None
     acontroller: AttachmentController = None
     config: zr.ApplicationConfig = None
+    render_cache: RenderedMetadataCache = None
 
     @injector.construct
     def __init__(self, view_template="view_dataset.html", edit_template="form.html", meta_edit_template="metadata_form.html"):
@@ -52,18 +55,24 @@ class DatasetController:
         self.log = zrlog.get_logger("pipeman.dataset")
 
     def republish(self, dataset_id: int):
+        from .republish import BulkRepublisher
+        BulkRepublisher().run(dataset_id=dataset_id if dataset_id > 0 else None)
+
+    def republish_dataset(self, dataset_id: int, priority: int = -10, lane: str = "bulk") -> t.Optional[str]:
+        """Start a publication workflow for the latest published revision of a dataset.
+
+        The workflow runs behind interactive work by default. Returns the workflow status, or None if the dataset
+        has never been published.
+        """
         with self.db as session:
-            q = session.query(orm.Dataset).filter(orm.Dataset.is_deprecated == False)
-            if dataset_id > 0:
-                q = q.filter(orm.Dataset.id == dataset_id)
-            for dataset in q:
-                ds_data = dataset.latest_published_revision()
-                if ds_data is not None:
-                    ds = self.load_dataset(dataset.id, ds_data.revision_no)
-                    result = self.publish_dataset(ds, with_messages=False, auto_approve=True)
-                    print(f"{dataset.display_name("en")}: {result}")
-                else:
-                    print(f"{dataset.display_name("en")}: not published")
+            dataset = session.query(orm.Dataset).filter_by(id=dataset_id).first()
+            if dataset is None:
+                raise DatasetNotFoundError(dataset_id)
+            ds_data = dataset.latest_published_revision()
+            if ds_data is None:
+                return None
+            ds = self._build_dataset(dataset, ds_data)
+        return self.publish_dataset(ds, with_messages=False, auto_approve=True, priority=priority, lane=lane)
 
     def metadata_format_exists(self, profile_name, format_name):
         return self.reg.metadata_format_exists(profile_name, format_name)
@@ -314,7 +323,7 @@ class DatasetController:
     def _build_extra_view_values(self, dataset, session):
         ds = session.query(orm.Dataset).filter_by(id=dataset.container_id).first()
         return {
-            "pubs": self._build_pub_list(ds),
+            "pubs": self._build_pub_list(ds, session),
             "atts": self._build_att_list(ds)
         }
 
@@ -324,16 +333,26 @@ class DatasetController:
             display = markupsafe.escape(f"{att.file_name} [{format_datetime(att.created_date)}]")
             yield link, display
 
-    def _build_pub_list(self, ds):
-        for rev in ds.data:
-            if rev.is_published:
-                link = flask.url_for("core.view_dataset_revision",
-                                     dataset_id=rev.dataset_id,
-                                     revision_no=rev.revision_no)
-                app_link = None
-                if rev.approval_item_id:
-                    app_link = flask.url_for('core.view_item', item_id=rev.approval_item_id)
-                yield link, rev.published_date, app_link
+    def _build_pub_list(self, ds, session):
+        # Only the columns needed here, so the (potentially large) revision content is not loaded
+        query = (
+            session.query(
+                orm.MetadataEdition.revision_no,
+                orm.MetadataEdition.published_date,
+                orm.MetadataEdition.approval_item_id
+            )
+            .filter(orm.MetadataEdition.dataset_id == ds.id)
+            .filter(orm.MetadataEdition.is_published == True)
+            .order_by(orm.MetadataEdition.revision_no)
+        )
+        for revision_no, published_date, approval_item_id in query:
+            link = flask.url_for("core.view_dataset_revision",
+                                 dataset_id=ds.id,
+                                 revision_no=revision_no)
+            app_link = None
+            if approval_item_id:
+                app_link = flask.url_for('core.view_item', item_id=approval_item_id)
+            yield link, published_date, app_link
 
     def dataset_validation_page(self, dataset):
         return flask.render_template(
@@ -529,7 +548,8 @@ class DatasetController:
                 object_type='dataset'
             )
 
-    def publish_dataset(self, dataset: Dataset, with_messages: bool = True, auto_approve: bool = False) -> str:
+    def publish_dataset(self, dataset: Dataset, with_messages: bool = True, auto_approve: bool = False,
+                        priority: t.Optional[int] = None, lane: t.Optional[str] = None) -> str:
         self.log.info(f"Publishing dataset {dataset.dataset_id}")
         status, _ = self.workflow.start_workflow(
             "dataset_publication",
@@ -540,7 +560,9 @@ class DatasetController:
                 "revision_no": dataset.revision_no,
                 "auto_approve": auto_approve,
             },
-            dataset.dataset_id
+            dataset.dataset_id,
+            priority=priority,
+            lane=lane
         )
         if with_messages:
             if status == "COMPLETE":
@@ -552,6 +574,76 @@ class DatasetController:
         return status
 
     def generate_metadata_content(self, dataset, profile_name, format_name, environment="live"):
+        if self.render_cache.enabled and dataset.metadata_id:
+            return self.render_cache.get_or_render(
+                dataset,
+                self._metadata_render_key(
+                    dataset.dataset_id,
+                    dataset.metadata_id,
+                    dataset.modified_date(),
+                    dataset.metadata_modified_date(),
+                    profile_name,
+                    format_name,
+                    environment
+                ),
+                functools.partial(self._render_metadata_content, dataset, profile_name, format_name, environment)
+            )
+        return self._render_metadata_content(dataset, profile_name, format_name, environment)
+
+    def _metadata_render_key(self, dataset_id, metadata_id, modified_date, metadata_modified_date, profile_name, format_name, environment):
+        return self.render_cache.build_key(
+            dataset_id,
+            metadata_id,
+            modified_date,
+            metadata_modified_date,
+            profile_name,
+            format_name,
+            environment,
+            self.reg.metadata_formatter_config(profile_name, format_name),
+            self.reg.metadata_format_template(profile_name, format_name)
+        )
+
+    def _metadata_last_modified(self, *dates) -> t.Optional[datetime.datetime]:
+        dates = [x if x.tzinfo else x.astimezone() for x in dates if x is not None]
+        entity_change = self.render_cache.entity_changes.changed_date()
+        if entity_change is not None:
+            dates.append(entity_change)
+        return max(dates) if dates else None
+
+    def metadata_file_not_modified(self, dataset_id, revision_no, profile_name, format_name, environment="live") -> t.Optional[flask.Response]:
+        """Check a conditional request against the stored dates, without loading the dataset or rendering anything.
+
+        Returns a 304 response if the client's copy is current, otherwise None so that the document is generated
+        (and access is checked) as usual.
+        """
+        if not (flask.request.if_none_match or flask.request.if_modified_since):
+            return None
+        with self.db as session:
+            ds = session.query(orm.Dataset).filter_by(id=dataset_id).first()
+            if ds is None or not self.has_access(ds, "view"):
+                return None
+            revision_no = revision_no or ds.latest_revision_no
+            if revision_no is None:
+                return None
+            md = (
+                session.query(orm.MetadataEdition.id, orm.MetadataEdition.modified_date)
+                .filter(orm.MetadataEdition.dataset_id == ds.id)
+                .filter(orm.MetadataEdition.revision_no == revision_no)
+                .first()
+            )
+            if md is None:
+                return None
+            etag = self._metadata_render_key(ds.id, md.id, ds.modified_date, md.modified_date, profile_name, format_name, environment)
+            last_modified = self._metadata_last_modified(ds.modified_date, md.modified_date)
+        if werkzeug.http.is_resource_modified(flask.request.environ, etag=etag, last_modified=last_modified):
+            return None
+        response = flask.Response(status=304)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        return response
+
+    def _render_metadata_content(self, dataset, profile_name, format_name, environment="live"):
         args = {
             "dataset": dataset,
             "environment": environment,
@@ -581,6 +673,19 @@ class DatasetController:
             mimetype=mime_type
         )
         response.headers['Content-Type'] = f"{mime_type}; charset={encoding}"
+        if dataset.metadata_id:
+            response.set_etag(self._metadata_render_key(
+                dataset.dataset_id,
+                dataset.metadata_id,
+                dataset.modified_date(),
+                dataset.metadata_modified_date(),
+                profile_name,
+                format_name,
+                environment
+            ))
+            last_modified = self._metadata_last_modified(dataset.modified_date(), dataset.metadata_modified_date())
+            if last_modified:
+                response.last_modified = last_modified
         return response
 
     def remove_dataset(self, dataset):
@@ -630,7 +735,7 @@ class DatasetController:
         with BlockTimer("pipeman_dataset_load_dataset_build", "Time to build a dataset object itself"):
             return self.reg.build_dataset(
                 profiles=ds.profiles.replace("\r", "").split("\n"),
-                field_values=json.loads(ds_data.data) if ds_data else {},
+                field_values_json=ds_data.data if ds_data else None,
                 dataset_id=ds.id,
                 ds_data_id=ds_data.id if ds_data else None,
                 revision_no=ds_data.revision_no if ds_data else None,
@@ -666,6 +771,7 @@ class DatasetController:
                     if save_metadata:
                         self._create_metadata(dataset, session, ds)
                     session.commit()
+                    self.render_cache.invalidate_dataset(dataset.dataset_id)
                 else:
                     ds = self._create_dataset(dataset, session)
                     # If creating a new dataset works but saving a copy of the metadata or user list doesn't,
@@ -736,6 +842,7 @@ class DatasetController:
         with self.db as session:
             if self._create_metadata(dataset, session):
                 session.commit()
+                self.render_cache.invalidate_dataset(dataset.dataset_id)
 
     def _create_metadata(self, dataset, session, ds = None):
         ds = ds if ds is not None else session.query(orm.Dataset).filter_by(id=dataset.dataset_id).first()
@@ -744,8 +851,7 @@ class DatasetController:
             retries -= 1
             try:
                 self.log.debug(f"Attempting to save metadata")
-                rev_nos = [dd.revision_no for dd in ds.data]
-                next_rev = 1 if not rev_nos else max(rev_nos) + 1
+                next_rev = ds.next_revision_no()
                 ds_data = orm.MetadataEdition(
                     dataset_id=ds.id,
                     revision_no=next_rev,
@@ -754,6 +860,7 @@ class DatasetController:
                     created_by=flask_login.current_user.user_id if flask_login.current_user else None
                 )
                 session.add(ds_data)
+                ds.latest_revision_no = next_rev
                 return True
             except IntegrityError:
                 self.log.exception(f"Error saving metadata, retries {retries}")
@@ -7,18 +7,22 @@ from autoinject import injector
 from pipeman.util import deep_update, load_object
 from pipeman.entity import FieldContainer
 from pipeman.entity.entity import CustomValidator, RecommendedFieldValidator, RequiredFieldValidator
+from pipeman.entity.schema import ContainerSchema, SchemaCache
 from pipeman.db import BaseObjectRegistry
+from pipeman.db.obj_registry import RegistryFileTracker
 from pipeman.i18n import MultiLanguageString, gettext, MultiLanguageLink
 import copy
 from pipeman.workflow import WorkflowRegistry
 import logging
 import flask
-import yaml
 
 
 @injector.injectable_global
 class MetadataRegistry:
 
+    schemas: SchemaCache = None
+
+    @injector.construct
     def __init__(self):
         self._fields = BaseObjectRegistry("field")
         self._profiles = BaseObjectRegistry("profile")
@@ -98,19 +102,24 @@ class MetadataRegistry:
         self._fields.register(field_name, **config)
 
     def register_metadata_from_dict(self, d: dict):
+        self._display_groups.register_from_dict({dg_name: {**d[dg_name], "name": dg_name} for dg_name in d or []})
+        fields = {}
         for dg_name in d or []:
-            self.register_display_group(
-                dg_name,
-                **d[dg_name]
-            )
             if "fields" in d[dg_name]:
                 for fn in d[dg_name]["fields"]:
                     d[dg_name]["fields"][fn]["display_group"] = dg_name
-                    self.register_field(fn, **d[dg_name]["fields"][fn])
+                    if fn in fields:
+                        deep_update(fields[fn], d[dg_name]["fields"][fn])
+                    else:
+                        fields[fn] = d[dg_name]["fields"][fn]
+        self._fields.register_from_dict(fields)
 
-    def register_metadata_from_yaml(self, yaml_file):
-        with open(yaml_file, "r", encoding="utf-8") as h:
-            self.register_metadata_from_dict(yaml.safe_load(h))
+    @injector.inject
+    def register_metadata_from_yaml(self, yaml_file, tracker: RegistryFileTracker = None):
+        rf = tracker.load(yaml_file, ["display_group", "field"])
+        if rf is not None:
+            self.register_metadata_from_dict(rf.content)
+            tracker.mark_imported(rf)
 
     def register_profile(self, profile_name, **config):
         self._profiles.register(profile_name, **config)
@@ -173,6 +182,9 @@ class MetadataRegistry:
             return set((profile_name, x) for x in self._profiles[profile_name]['formatters'].keys()) if profile_name in self._profiles else set()
         return set()
 
+    def metadata_formatter_config(self, profile_name, format_name) -> dict:
+        return self._profiles[profile_name]["formatters"][format_name]
+
     def metadata_format_template(self, profile_name, format_name):
         return self._profiles[profile_name]["formatters"][format_name]["template"]
 
@@ -251,6 +263,14 @@ class MetadataRegistry:
     def build_dataset(self, profiles, **kwargs):
         if isinstance(profiles, str):
             profiles = [profiles]
+        schema = self.dataset_schema(profiles)
+        return Dataset(schema=schema, profiles=set(schema.profiles), base_profiles=profiles, **kwargs)
+
+    def dataset_schema(self, profiles) -> ContainerSchema:
+        key = ("dataset", tuple(sorted(set(profiles))), self._fields.version, self._profiles.version)
+        return self.schemas.get(key, lambda: self._compile_schema(profiles))
+
+    def _compile_schema(self, profiles) -> ContainerSchema:
         fields = set()
         ext_profiles = self.build_extended_profile_list(profiles)
         for profile in ext_profiles:
@@ -262,25 +282,27 @@ class MetadataRegistry:
                 logging.getLogger("pipeman.fields").error(f"Field {fn} not defined, skipping")
             else:
                 field_list[fn] = self._fields[fn]
-        ds = Dataset(field_list=field_list, profiles=ext_profiles, base_profiles=profiles, **kwargs)
+        derived_fields = []
+        field_validators = []
+        self_validators = []
         for profile in ext_profiles:
             if "derived_fields" in self._profiles[profile] and self._profiles[profile]["derived_fields"]:
                 dfns = self._profiles[profile]["derived_fields"]
                 for dfn in dfns:
-                    ds.add_derived_field(dfn, dfns[dfn]["label"], dfns[dfn]["value_function"])
+                    derived_fields.append((dfn, dfns[dfn]["label"], dfns[dfn]["value_function"]))
             pn = MultiLanguageString(self._profiles[profile]["display"])
             if "validation" in self._profiles[profile] and self._profiles[profile]["validation"]:
                 validation = self._profiles[profile]["validation"]
                 if 'required' in validation and validation['required']:
                     for fn in validation['required']:
-                        ds.add_field_validator(fn, RequiredFieldValidator(pn))
+                        field_validators.append((fn, RequiredFieldValidator(pn)))
                 if 'recommended' in validation and validation['recommended']:
                     for fn in validation['recommended']:
-                        ds.add_field_validator(fn, RecommendedFieldValidator(pn))
+                        field_validators.append((fn, RecommendedFieldValidator(pn)))
                 if 'custom' in validation and validation['custom']:
                     for call in validation['custom']:
-                        ds.add_self_validator(CustomValidator(call, pn))
-        return ds
+                        self_validators.append(CustomValidator(call, pn))
+        return ContainerSchema(field_list, derived_fields, field_validators, self_validators, ext_profiles)
 
 
 class Dataset(FieldContainer):
@@ -0,0 +1,287 @@
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import typing as t
+
+import flask
+import prometheus_client as pc
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+from pipeman.db.obj_registry import GlobalObjectRegistry
+from pipeman.entity.changes import EntityChangeTracker
+from pipeman.util.metrics import PromMetrics
+from pipeman.vocab.cache import VocabularyTermCache
+
+
+RenderedMetadata = tuple[str, str, str, str]
+"""The content, MIME type, encoding and extension of a rendered metadata document."""
+
+
+class RenderCacheBackend:
+    """Storage for rendered metadata documents.
+
+    Entries are grouped by dataset so that everything rendered for a dataset can be dropped at once.
+    """
+
+    def get(self, dataset_id: int, key: str) -> t.Optional[RenderedMetadata]:
+        raise NotImplementedError
+
+    def put(self, dataset_id: int, key: str, value: RenderedMetadata):
+        raise NotImplementedError
+
+    def invalidate_dataset(self, dataset_id: int):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryRenderCache(RenderCacheBackend):
+    """Least-recently-used cache held in the memory of the current process."""
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries = max_entries
+        self._entries: collections.OrderedDict[tuple[int, str], RenderedMetadata] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, dataset_id, key):
+        with self._lock:
+            value = self._entries.get((dataset_id, key))
+            if value is not None:
+                self._entries.move_to_end((dataset_id, key))
+            return value
+
+    def put(self, dataset_id, key, value):
+        with self._lock:
+            self._entries[(dataset_id, key)] = value
+            self._entries.move_to_end((dataset_id, key))
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_dataset(self, dataset_id):
+        with self._lock:
+            for entry_key in [x for x in self._entries if x[0] == dataset_id]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskRenderCache(RenderCacheBackend):
+    """Cache stored as files in a directory, so that it can be shared by every worker on the same host."""
+
+    def __init__(self, directory: pathlib.Path, max_age_seconds: float = 86400):
+        self._directory = directory
+        self._max_age = max_age_seconds
+        self._log = zrlog.get_logger("pipeman.dataset.render_cache")
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, dataset_id, key) -> pathlib.Path:
+        return self._directory / str(dataset_id) / f"{key}.json"
+
+    def get(self, dataset_id, key):
+        path = self._path(dataset_id, key)
+        try:
+            if self._max_age and (time.time() - path.stat().st_mtime) > self._max_age:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as h:
+                entry = json.load(h)
+            return entry["content"], entry["mime_type"], entry["encoding"], entry["extension"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as ex:
+            self._log.warning(f"Could not read cached metadata from {path}: {ex}")
+            return None
+
+    def put(self, dataset_id, key, value):
+        path = self._path(dataset_id, key)
+        content, mime_type, encoding, extension = value
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that other workers never see a partial entry
+            handle, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(handle, "w", encoding="utf-8") as h:
+                    json.dump({
+                        "content": content,
+                        "mime_type": mime_type,
+                        "encoding": encoding,
+                        "extension": extension
+                    }, h)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as ex:
+            self._log.warning(f"Could not write cached metadata to {path}: {ex}")
+
+    def invalidate_dataset(self, dataset_id):
+        shutil.rmtree(self._directory / str(dataset_id), ignore_errors=True)
+
+    def clear(self):
+        for path in self._directory.iterdir():
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class TieredRenderCache(RenderCacheBackend):
+    """In-memory cache in front of a shared cache."""
+
+    def __init__(self, front: RenderCacheBackend, back: RenderCacheBackend):
+        self._front = front
+        self._back = back
+
+    def get(self, dataset_id, key):
+        value = self._front.get(dataset_id, key)
+        if value is None:
+            value = self._back.get(dataset_id, key)
+            if value is not None:
+                self._front.put(dataset_id, key, value)
+        return value
+
+    def put(self, dataset_id, key, value):
+        self._front.put(dataset_id, key, value)
+        self._back.put(dataset_id, key, value)
+
+    def invalidate_dataset(self, dataset_id):
+        self._front.invalidate_dataset(dataset_id)
+        self._back.invalidate_dataset(dataset_id)
+
+    def clear(self):
+        self._front.clear()
+        self._back.clear()
+
+
+@injector.injectable_global
+class RenderedMetadataCache:
+    """Process-wide cache of rendered metadata documents.
+
+    Keys are built from the metadata edition, the profile, format and environment, the version of the template and
+    the current entity and vocabulary versions, so a new revision, a publication (which updates the modification
+    date of the edition and dataset) or a change to any entity or vocabulary term produces a new key. Old entries are
+    also removed explicitly when the dataset changes to free up space.
+
+    The backend is chosen with ``pipeman.metadata_cache.backend``: ``memory`` (the default), ``disk``, ``tiered``
+    (memory in front of disk) or ``none``.
+    """
+
+    config: zr.ApplicationConfig = None
+    gor: GlobalObjectRegistry = None
+    entity_changes: EntityChangeTracker = None
+    term_cache: VocabularyTermCache = None
+    prom_metrics: PromMetrics = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.dataset.render_cache")
+        self._lock = threading.Lock()
+        self._template_versions: dict[str, tuple[t.Callable, str]] = {}
+        self._generation = None
+        self.backend = self._build_backend()
+        self.gor.register(self)
+
+    def _build_backend(self) -> t.Optional[RenderCacheBackend]:
+        backend = self.config.as_str(("pipeman", "metadata_cache", "backend"), default="memory").lower()
+        if backend == "none":
+            return None
+        memory = MemoryRenderCache(self.config.as_int(("pipeman", "metadata_cache", "max_entries"), default=256))
+        if backend == "memory":
+            return memory
+        directory = self.config.as_path(("pipeman", "metadata_cache", "directory"), default=None)
+        if directory is None:
+            self._log.warning(f"No directory configured for the {backend} metadata cache, using memory instead")
+            return memory
+        disk = DiskRenderCache(directory, self.config.as_float(("pipeman", "metadata_cache", "max_age_seconds"), default=86400))
+        if backend == "disk":
+            return disk
+        if backend == "tiered":
+            return TieredRenderCache(memory, disk)
+        self._log.warning(f"Unknown metadata cache backend [{backend}], using memory instead")
+        return memory
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def generation(self) -> tuple[str, str]:
+        """Versions of the shared content (entities and vocabulary terms) that rendered documents depend on."""
+        generation = (self.entity_changes.version(), self.term_cache.version())
+        if self._generation is not None and generation != self._generation and self.backend is not None:
+            self._log.debug("Entity or vocabulary content changed, clearing rendered metadata")
+            self.backend.clear()
+        self._generation = generation
+        return generation
+
+    def template_version(self, template_name: str) -> str:
+        """Hash of the template source, recomputed only when the loader reports the file has changed."""
+        entry = self._template_versions.get(template_name)
+        if entry is not None and (entry[0] is None or entry[0]()):
+            return entry[1]
+        app = flask.current_app
+        source, _, uptodate = app.jinja_env.loader.get_source(app.jinja_env, template_name)
+        version = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._template_versions[template_name] = (uptodate, version)
+        return version
+
+    def build_key(self,
+                  dataset_id: int,
+                  metadata_id: int,
+                  modified_date,
+                  metadata_modified_date,
+                  profile_name: str,
+                  format_name: str,
+                  environment: str,
+                  formatter: dict,
+                  template_name: str) -> str:
+        """Build the key for a rendered document; it is also suitable for use as a strong ETag."""
+        return hashlib.sha256(json.dumps([
+            dataset_id,
+            metadata_id,
+            str(modified_date),
+            str(metadata_modified_date),
+            profile_name,
+            format_name,
+            environment,
+            self.config.as_str(("pipeman", "authority")),
+            self.config.as_str(("pipeman", "metadata_cache", "template_version"), default=""),
+            self.template_version(template_name),
+            formatter,
+            self.generation(),
+        ], default=str, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_or_render(self, dataset, key: str, renderer: t.Callable[[], RenderedMetadata]) -> RenderedMetadata:
+        result = self.backend.get(dataset.dataset_id, key)
+        self._metric().labels(result="miss" if result is None else "hit").inc()
+        if result is None:
+            result = renderer()
+            self.backend.put(dataset.dataset_id, key, result)
+        return result
+
+    def invalidate_dataset(self, dataset_id: int):
+        if self.backend is not None and dataset_id is not None:
+            self.backend.invalidate_dataset(dataset_id)
+
+    def reload_types(self):
+        with self._lock:
+            self._template_versions.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _metric(self):
+        return self.prom_metrics.get_stat(
+            "pipeman_metadata_render_cache",
+            "Rendered metadata cache lookups",
+            pc.Counter,
+            labelnames=["result"]
+        )
@@ -0,0 +1,227 @@
+import collections
+import concurrent.futures
+import datetime
+import multiprocessing
+import time
+import typing as t
+
+import flask
+import sqlalchemy as sa
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+from pipeman.dbconfig import ValueController
+from pipeman.workflow.process_pool import init_worker_process, worker_app
+from pipeman.workflow.steps import StepStatus
+from .controller import DatasetController
+
+
+CHECKPOINT_KEY = "dataset_republish_checkpoint"
+
+
+@injector.inject
+def _republish_one(dataset_id: int, dc: DatasetController = None) -> t.Optional[str]:
+    return dc.republish_dataset(dataset_id)
+
+
+@injector.as_thread_run
+def _thread_task(app, dataset_id: int) -> t.Optional[str]:
+    with app.app_context():
+        with app.test_request_context():
+            return _republish_one(dataset_id)
+
+
+def _process_task(dataset_id: int) -> t.Optional[str]:
+    app = worker_app()
+    with app.app_context():
+        with app.test_request_context():
+            return _republish_one(dataset_id)
+
+
+class RepublishReport:
+    """Counts and timing for a bulk republish run."""
+
+    def __init__(self):
+        self.processed = 0
+        self.published = 0
+        self.in_progress = 0
+        self.not_published = 0
+        self.failures: list[tuple[int, str]] = []
+        self.resumed_after: t.Optional[int] = None
+        self._start = time.monotonic()
+        self.elapsed = 0.0
+
+    def record(self, dataset_id: int, status: t.Optional[str], error: t.Optional[str] = None):
+        self.processed += 1
+        if error is not None or status == StepStatus.FAILURE.value:
+            self.failures.append((dataset_id, error or "publication workflow failed"))
+        elif status is None:
+            self.not_published += 1
+        elif status == StepStatus.COMPLETED.value:
+            self.published += 1
+        else:
+            self.in_progress += 1
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self._start
+
+    @property
+    def items_per_second(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Republished {self.processed} datasets in {self.elapsed:.1f}s ({self.items_per_second:.2f}/s): "
+            f"{self.published} complete, {self.in_progress} in progress, {self.not_published} not published, "
+            f"{len(self.failures)} failed"
+        )
+
+
+class BulkRepublisher:
+    """Starts publication workflows for many datasets at once.
+
+    Dataset IDs are read from the database in chunks (in ID order) and handed to a pool of threads or worker
+    processes. After each chunk, the highest ID below which every dataset has been handled is saved so that an
+    interrupted run can be resumed with the same filters.
+    """
+
+    db: Database = None
+    config: zr.ApplicationConfig = None
+    vc: ValueController = None
+
+    @injector.construct
+    def __init__(self, workers: t.Optional[int] = None, mode: t.Optional[str] = None, chunk_size: t.Optional[int] = None):
+        self._log = zrlog.get_logger("pipeman.dataset.republish")
+        self.workers = max(1, workers or self.config.as_int(("pipeman", "republish", "workers"), default=4))
+        self.mode = mode or self.config.as_str(("pipeman", "republish", "mode"), default="thread")
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"Invalid republish mode [{self.mode}], expected thread or process")
+        self.chunk_size = max(1, chunk_size or self.config.as_int(("pipeman", "republish", "chunk_size"), default=200))
+
+    def run(self,
+            dataset_id: t.Optional[int] = None,
+            profile: t.Optional[str] = None,
+            organization: t.Optional[str] = None,
+            modified_since: t.Optional[datetime.datetime] = None,
+            resume: bool = False) -> RepublishReport:
+        if modified_since is not None and modified_since.tzinfo is None:
+            modified_since = modified_since.astimezone()
+        filters = {
+            "dataset_id": dataset_id,
+            "profile": profile,
+            "organization": organization,
+            "modified_since": modified_since.isoformat() if modified_since else None,
+        }
+        report = RepublishReport()
+        after_id = 0
+        if resume:
+            checkpoint = self.vc.get_value(CHECKPOINT_KEY)
+            if checkpoint and checkpoint.get("filters") == filters:
+                after_id = checkpoint["last_id"]
+                report.resumed_after = after_id
+                self._log.notice(f"Resuming republish after dataset {after_id}")
+            else:
+                self._log.warning("No republish checkpoint found for these filters, starting from the beginning")
+        self._log.notice(f"Republishing datasets with {self.workers} {self.mode} workers")
+        with self._executor() as executor:
+            submit = self._submit_function(executor)
+            pending: dict[concurrent.futures.Future, int] = {}
+            submitted = collections.deque()
+            done_ids = set()
+            for chunk in self._chunks(after_id, filters, modified_since):
+                for ds_id in chunk:
+                    pending[submit(ds_id)] = ds_id
+                    submitted.append(ds_id)
+                    # Keep enough work queued to stay busy without reading every dataset into memory
+                    while len(pending) >= self.workers * 2:
+                        self._collect(pending, done_ids, report, concurrent.futures.FIRST_COMPLETED)
+                checkpoint_id = self._advance(submitted, done_ids)
+                if checkpoint_id is not None:
+                    self.vc.set_value(CHECKPOINT_KEY, {"filters": filters, "last_id": checkpoint_id})
+            while pending:
+                self._collect(pending, done_ids, report, concurrent.futures.ALL_COMPLETED)
+        self.vc.set_value(CHECKPOINT_KEY, None)
+        report.finish()
+        self._log.notice(report.summary())
+        return report
+
+    def _executor(self) -> concurrent.futures.Executor:
+        if self.mode == "process":
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker_process,
+                initargs=(self.config.as_list(
+                    ("pipeman", "workflow", "process_pool_config_files"),
+                    default=[".pipeman.cli.toml"]
+                ),)
+            )
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="republish")
+
+    def _submit_function(self, executor: concurrent.futures.Executor) -> t.Callable[[int], concurrent.futures.Future]:
+        if self.mode == "process":
+            return lambda ds_id: executor.submit(_process_task, ds_id)
+        app = flask.current_app._get_current_object()
+        return lambda ds_id: executor.submit(_thread_task, app, ds_id)
+
+    def _collect(self, pending: dict, done_ids: set, report: RepublishReport, return_when: str):
+        done, _ = concurrent.futures.wait(pending, return_when=return_when)
+        for future in done:
+            ds_id = pending.pop(future)
+            done_ids.add(ds_id)
+            try:
+                status = future.result()
+            except Exception as ex:
+                self._log.exception(f"Error republishing dataset {ds_id}")
+                report.record(ds_id, None, f"{type(ex).__name__}: {ex}")
+                continue
+            self._log.info(f"Dataset {ds_id}: {status or 'not published'}")
+            report.record(ds_id, status)
+
+    @staticmethod
+    def _advance(submitted: collections.deque, done_ids: set) -> t.Optional[int]:
+        """Find the highest ID that, along with all IDs before it, has been handled."""
+        last_id = None
+        while submitted and submitted[0] in done_ids:
+            last_id = submitted.popleft()
+            done_ids.discard(last_id)
+        return last_id
+
+    def _chunks(self, after_id: int, filters: dict, modified_since: t.Optional[datetime.datetime]) -> t.Iterable[list[int]]:
+        while True:
+            with self.db as session:
+                q = (
+                    sa.select(orm.Dataset.id, orm.Dataset.profiles)
+                    .where(orm.Dataset.is_deprecated == False)
+                    .where(orm.Dataset.id > after_id)
+                    .order_by(orm.Dataset.id)
+                    .limit(self.chunk_size)
+                )
+                if filters["dataset_id"]:
+                    q = q.where(orm.Dataset.id == filters["dataset_id"])
+                if filters["profile"]:
+                    q = q.where(orm.Dataset.profiles.contains(filters["profile"]))
+                if filters["organization"]:
+                    org_q = sa.select(orm.Organization.id).where(orm.Organization.short_name == filters["organization"])
+                    if filters["organization"].isdigit():
+                        org_q = sa.select(orm.Organization.id).where(sa.or_(
+                            orm.Organization.short_name == filters["organization"],
+                            orm.Organization.id == int(filters["organization"])
+                        ))
+                    q = q.where(orm.Dataset.organization_id.in_(org_q))
+                if modified_since:
+                    q = q.where(orm.Dataset.modified_date >= modified_since)
+                rows = session.execute(q).all()
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            chunk = [
+                row[0] for row in rows
+                # profiles is newline-separated, so the LIKE above can match on part of a name
+                if not filters["profile"] or filters["profile"] in (row[1] or "").replace("\r", "").split("\n")
+            ]
+            if chunk:
+                yield chunk
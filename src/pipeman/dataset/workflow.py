@@ -8,6 +8,7 @@ import datetime
 import zrlog
 from pipeman.smtpout import EmailController
 from pipeman.dataset import DatasetController
+from pipeman.dataset.render_cache import RenderedMetadataCache
 import typing as t
 import sqlalchemy as sa
 
@@ -15,7 +16,7 @@ from pipeman.workflow.steps import WorkflowStep
 
 
 @injector.inject
-def publish_dataset(step, context, db: Database = None):
+def publish_dataset(step, context, db: Database = None, render_cache: RenderedMetadataCache = None):
     log = zrlog.get_logger("pipeman.dataset")
     with db as session:
         ds = session.query(orm.Dataset).filter_by(id=context["dataset_id"]).first()
@@ -31,7 +32,9 @@ def publish_dataset(step, context, db: Database = None):
         md.is_published = True
         md.published_date = datetime.datetime.now()
         md.approval_item_id = step.item.id
+        ds.mark_published(md)
         session.commit()
+        render_cache.invalidate_dataset(ds.id)
         log.info(f"Dataset [{context['dataset_id']}] publish status updated successfully")
         return ItemResult.SUCCESS
 
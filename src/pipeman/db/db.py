@@ -7,10 +7,12 @@ import zirconium as zr
 from autoinject import injector
 import zrlog
 import gc
+import threading
 
 from sqlalchemy.exc import DisconnectionError, TimeoutError, InvalidRequestError
 
 from .orm import Base
+from .instrumentation import instrument_engine
 import typing as t
 
 from ..util.errors import RecoverableError
@@ -71,6 +73,34 @@ class SessionWrapper:
         return self._session.execute(statement, *args, **kwargs)
 
 
+class _NestedBlock:
+    """Tracks the savepoint for a nested block in shared session mode."""
+
+    def __init__(self, savepoint: orm.SessionTransaction):
+        self.savepoint = savepoint
+
+
+class NestedSessionWrapper(SessionWrapper):
+    """Wrapper for a block nested inside another in shared session mode.
+    commit() and rollback() apply to the block's savepoint rather than the whole session; work committed here
+    is made permanent when the outermost block exits without an error.
+    """
+
+    def __init__(self, db, session: orm.Session, block: _NestedBlock):
+        super().__init__(db, session, None)
+        self._block = block
+
+    @wrap_orm_errors
+    def commit(self):
+        """Override commit() by releasing the savepoint and starting a new one."""
+        self.db._nested_commit(self._block)
+
+    @wrap_orm_errors
+    def rollback(self):
+        """Override rollback() by rolling back to the savepoint and starting a new one."""
+        self.db._nested_rollback(self._block)
+
+
 @injector.injectable
 class Database:
     """Represents the database that the application is connected to.
@@ -78,6 +108,9 @@ class Database:
     stored in a configuration file (see Zirconium documentation) using the following template:
     [database]
     connection_string: CONNECTION_STRING
+
+    Setting [pipeman.database] session_mode to "shared" makes all blocks on the same thread within one
+    request or task share a single session (and its identity map) instead of opening a new one each time.
     """
 
     config: zr.ApplicationConfig = None
@@ -92,6 +125,10 @@ class Database:
         self._log = zrlog.get_logger("pipeman.db")
         self._maker = None
         self._sessions: list[orm.Session] = []
+        self._shared_mode = self.config.as_str(("pipeman", "database", "session_mode"), default="isolated") == "shared"
+        self._local = threading.local()
+        self._shared_lock = threading.Lock()
+        self._shared_sessions: list[orm.Session] = []
 
     def get_maker(self) -> orm.sessionmaker:
         if self._maker is None:
@@ -102,28 +139,25 @@ class Database:
         if self.engine is None:
             self._log.debug(f"Opening database connection pool")
             self.engine = sa.engine_from_config(self.config["database"], prefix="")
+            if self.config.as_bool(("pipeman", "database", "instrument_queries"), default=True):
+                instrument_engine(self.engine)
         return self.engine
 
     @wrap_orm_errors
     def __enter__(self) -> SessionWrapper:
         """Implement __enter__().
-        Create a new session if none exists, then starts a new transaction (even
-        if one exists). This nesting of transactions enables commit() and rollback() to only affect statements
-        executed within the context manager block.
+        In isolated mode (the default), each block gets its own session. In shared mode, every block entered
+        on the same thread shares one session until the scope ends; nested blocks are wrapped in a savepoint
+        so that commit() and rollback() only affect statements executed within the context manager block.
         Returns
         -------
         SessionWrapper
             An instance of SessionWrapper that wraps both the session and transaction object.
         """
+        if self._shared_mode:
+            return self._enter_shared()
         self._sessions.append(self.get_maker()())
         return SessionWrapper(self, self._sessions[-1], None)
-        if self._session is None:
-            self._session = self.get_maker()()
-        try:
-            self._transaction_stack.append(self._session.begin())
-        except InvalidRequestError:
-            self._transaction_stack.append(self._session.begin_nested())
-        return SessionWrapper(self, self._session, self._transaction_stack[-1])
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Implement __exit__().
@@ -135,8 +169,11 @@ class Database:
             Exception value
         exc_tb
             Exception traceback
-        If there is an error, the transaction is rolled back, otherwise it is committed.
+        In shared mode, anything not explicitly committed within the block is rolled back.
         """
+        if self._shared_mode:
+            self._exit_shared(exc_type)
+            return
         if self._sessions:
             if self._sessions[-1].in_transaction():
                 if exc_type:
@@ -145,29 +182,77 @@ class Database:
                     self._sessions[-1].rollback()
             self._sessions[-1].close()
             del self._sessions[-1]
-        return
-        if self._transaction_stack:
-            if exc_type:
-                self._log.debug("Automatic rollback")
-                if self._transaction_stack[-1].is_active:
-                    self._transaction_stack[-1].rollback()
-            else:
-                self._log.debug("Automatic commit")
-                if self._transaction_stack[-1].is_active:
-                    self._transaction_stack[-1].commit()
-            del self._transaction_stack[-1]
-        else:
-            self._log.info(f"Database transaction stack empty during __exit__")
-        if not self._transaction_stack:
-            if self._session:
-                self._log.debug("Closing session")
-                self._session.close()
-                self._session = None
+
+    def _shared_state(self):
+        state = self._local
+        if not hasattr(state, "session"):
+            state.session = None
+            state.blocks = []
+            state.pending_commit = False
+        return state
+
+    def _enter_shared(self) -> SessionWrapper:
+        state = self._shared_state()
+        if state.session is None:
+            state.session = self.get_maker()()
+            with self._shared_lock:
+                self._shared_sessions.append(state.session)
+        if not state.blocks:
+            # The outermost block uses the session's own transaction
+            state.blocks.append(None)
+            return SessionWrapper(self, state.session, None)
+        block = _NestedBlock(state.session.begin_nested())
+        state.blocks.append(block)
+        return NestedSessionWrapper(self, state.session, block)
+
+    def _exit_shared(self, exc_type):
+        state = self._shared_state()
+        if not state.blocks:
+            self._log.info(f"Database block stack empty during __exit__")
+            return
+        block = state.blocks.pop()
+        session = state.session
+        if block is not None:
+            if block.savepoint.is_active:
+                block.savepoint.rollback()
+        elif session.in_transaction():
+            if state.pending_commit and not exc_type:
+                # Nested blocks committed their work, so the outer transaction needs to be committed to keep it
+                self._log.debug("Committing work from nested blocks")
+                session.commit()
             else:
-                self._log.info(f"Database session not set")
-        if self._is_closed and not self._transaction_stack:
-            self._log.info(f"Database object used after cleanup called")
-            self._close()
+                session.rollback()
+        if not state.blocks:
+            state.pending_commit = False
+
+    def _nested_commit(self, block: "_NestedBlock"):
+        state = self._shared_state()
+        if block.savepoint.is_active:
+            block.savepoint.commit()
+        state.pending_commit = True
+        block.savepoint = state.session.begin_nested()
+
+    def _nested_rollback(self, block: "_NestedBlock"):
+        state = self._shared_state()
+        if block.savepoint.is_active:
+            block.savepoint.rollback()
+        block.savepoint = state.session.begin_nested()
+
+    def end_scope(self):
+        """Close the shared session for the current thread, if there is one and it is not in use."""
+        state = self._shared_state()
+        if state.session is None or state.blocks:
+            return
+        try:
+            if state.session.in_transaction():
+                state.session.rollback()
+            state.session.close()
+        finally:
+            with self._shared_lock:
+                if state.session in self._shared_sessions:
+                    self._shared_sessions.remove(state.session)
+            state.session = None
+            state.pending_commit = False
 
     def close(self):
         self._close()
@@ -189,6 +274,19 @@ class Database:
         finally:
             self._transaction_stack.clear()
 
+        try:
+            with self._shared_lock:
+                while self._shared_sessions:
+                    if self._shared_sessions[-1].in_transaction():
+                        self._shared_sessions[-1].rollback()
+                    self._shared_sessions[-1].close()
+                    del self._shared_sessions[-1]
+        except Exception:
+            self._log.exception("Error while clearing shared sessions")
+        finally:
+            self._shared_sessions.clear()
+            self._local = threading.local()
+
         try:
             while self._sessions:
                 if self._sessions[-1].in_transaction():
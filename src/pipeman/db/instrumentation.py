@@ -0,0 +1,100 @@
+"""Counts the SQL statements issued (and the time spent on them) within a Flask request or cron task."""
+import contextvars
+import time
+
+import prometheus_client as pc
+import sqlalchemy as sa
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+from ..util.metrics import PromMetrics
+
+
+_current_tally: contextvars.ContextVar = contextvars.ContextVar("pipeman_query_tally", default=None)
+
+
+class QueryTally:
+    """Accumulates statistics on the statements executed while it is active.
+    Parameters
+    ----------
+    label: str
+        The endpoint or task name the statistics are reported under.
+    repeat_threshold: int
+        The number of times the same statement can run before it is reported as a possible N+1 pattern. Set to
+        zero to disable the check.
+    """
+
+    def __init__(self, label: str, repeat_threshold: int = 0):
+        self.label = label
+        self.repeat_threshold = repeat_threshold
+        self.query_count = 0
+        self.query_time = 0.0
+        self.statements: dict[str, int] = {}
+        self.repeated: list[str] = []
+
+    def record(self, statement: str, elapsed: float):
+        self.query_count += 1
+        self.query_time += elapsed
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if self.repeat_threshold > 0 and self.statements[statement] == self.repeat_threshold + 1:
+            self.repeated.append(statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_tally.get() is not None:
+        conn.info.setdefault("pipeman_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tally = _current_tally.get()
+    if tally is not None and conn.info.get("pipeman_query_start"):
+        tally.record(statement, time.perf_counter() - conn.info["pipeman_query_start"].pop())
+
+
+def instrument_engine(engine: sa.engine.Engine):
+    """Attach the statement listeners to an engine."""
+    sa.event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    sa.event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@injector.inject
+def start_query_tally(label: str, config: zr.ApplicationConfig = None) -> contextvars.Token:
+    """Start counting statements for the current request or task."""
+    threshold = config.as_int(("pipeman", "database", "repeated_query_threshold"), default=25)
+    return _current_tally.set(QueryTally(label, threshold))
+
+
+@injector.inject
+def finish_query_tally(token: contextvars.Token = None, prom_metrics: PromMetrics = None):
+    """Stop counting statements, report the results and return the completed tally (if any)."""
+    tally = _current_tally.get()
+    if token is not None:
+        _current_tally.reset(token)
+    else:
+        _current_tally.set(None)
+    if tally is None:
+        return None
+    prom_metrics.get_stat(
+        "pipeman_db_query_count",
+        "Number of SQL statements executed per request or task",
+        pc.Histogram,
+        labelnames=["endpoint"],
+        buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+    ).labels(endpoint=tally.label).observe(tally.query_count)
+    prom_metrics.get_stat(
+        "pipeman_db_query_time",
+        "Time spent executing SQL statements per request or task",
+        pc.Histogram,
+        labelnames=["endpoint"]
+    ).labels(endpoint=tally.label).observe(tally.query_time)
+    if tally.repeated:
+        log = zrlog.get_logger("pipeman.db.queries")
+        for statement in tally.repeated:
+            log.warning(
+                "Possible N+1 query in [%s]: statement executed %s times: %s",
+                tally.label,
+                tally.statements[statement],
+                statement[:500]
+            )
+    return tally
@@ -3,27 +3,52 @@ import pipeman.db.orm as orm
 from autoinject import injector
 import json
 
-from pipeman.dbconfig import ValueController
 from pipeman.util import deep_update
 from threading import RLock
 import yaml
+import copy
 import datetime
 import decimal
-import time
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
+import threading
+import typing as t
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+import zirconium as zr
 import zrlog
 
 
 REFRESH_FREQUENCY = 60
 
+VERSION_KEY_PREFIX = "registry_version."
+
+FILE_KEY_PREFIX = "registry_file."
+
+BULK_BATCH_SIZE = 1000
+
+SNAPSHOT_FORMAT = 1
+
 
 @injector.injectable_global
 class GlobalObjectRegistry:
+    """Keeps the object registries of this process in line with the definitions in the database.
+
+    Every change to the definitions of an object type increments a version counter for that type in the key_value
+    table. A background thread reads all of the counters in one query every ``pipeman.registry.check_seconds``
+    and reloads only the registries whose type changed (plus objects, like caches, that depend on all of them).
+    """
 
     def __init__(self):
         self._log = zrlog.get_logger("pipeman.registries")
         self._registry = []
-        self._last_setup_run = None
-        self._last_setup_check = None
+        self._versions: t.Optional[dict[str, int]] = None
+        self._lock = RLock()
+        self._watcher: t.Optional[threading.Thread] = None
+        self._halt = threading.Event()
 
     def register(self, obj):
         self._registry.append(obj)
@@ -32,25 +57,85 @@ class GlobalObjectRegistry:
         if obj in self._registry:
             self._registry.remove(obj)
 
-    def check_all(self):
-        # Don't check everytime to prevent a lot of overhead (every 15 seconds)
-        if self._last_setup_check and (time.monotonic() - self._last_setup_check) < REFRESH_FREQUENCY:
-            return
-        self._last_setup_check = time.monotonic()
-        self._check_all()
+    def mark_versions(self) -> dict[str, int]:
+        """Remember the current versions as loaded; call before loading the registries."""
+        with self._lock:
+            self._versions = self._read_versions()
+            return dict(self._versions)
+
+    def type_maps(self) -> dict[str, dict]:
+        """The definitions currently loaded, by object type."""
+        return {
+            obj.obj_type: obj._type_map
+            for obj in list(self._registry)
+            if isinstance(obj, BaseObjectRegistry)
+        }
+
+    def load_type_maps(self, type_maps: dict[str, dict]):
+        """Replace the definitions of every registry with those given (types not given are emptied)."""
+        for obj in list(self._registry):
+            if isinstance(obj, BaseObjectRegistry):
+                obj.load_type_map(type_maps.get(obj.obj_type) or {})
+
+    def check_all(self) -> list[str]:
+        """Reload the registries whose versions changed; returns the changed object types."""
+        with self._lock:
+            versions = self._read_versions()
+            if self._versions is None:
+                changed = None
+            else:
+                changed = [k for k in set(versions) | set(self._versions) if versions.get(k) != self._versions.get(k)]
+                if not changed:
+                    return []
+            self._log.info(f"Reloading registries for {'all types' if changed is None else changed}")
+            # Registries first, then anything (like caches) built from them
+            for obj in list(self._registry):
+                obj_type = getattr(obj, "obj_type", None)
+                if obj_type is not None and (changed is None or obj_type in changed):
+                    obj.reload_types()
+            for obj in list(self._registry):
+                if getattr(obj, "obj_type", None) is None:
+                    obj.reload_types()
+            self._versions = versions
+            return changed if changed is not None else list(versions.keys())
 
     @injector.inject
-    def _check_all(self, vc: ValueController = None):
-        self._log.debug("Checking for registry updates")
-        # Check if setup has actually run recently
-        setup_last_run = vc.get_value("setup_last_run")
-        if self._last_setup_run == setup_last_run:
-            return
-        self._log.info(f"Updating [{len(self._registry)}] registry files")
-        # Do the reload
-        for obj in self._registry:
-            obj.reload_types()
-        self._last_setup_run = setup_last_run
+    def _read_versions(self, db: Database = None) -> dict[str, int]:
+        with db as session:
+            return {
+                key[len(VERSION_KEY_PREFIX):]: json.loads(value) if value else 0
+                for key, value in session.execute(
+                    sa.select(orm.KeyValue.key, orm.KeyValue.value)
+                    .where(orm.KeyValue.key.startswith(VERSION_KEY_PREFIX, autoescape=True))
+                )
+            }
+
+    @injector.inject
+    def start_watcher(self, config: zr.ApplicationConfig = None):
+        """Start the background thread that checks for registry changes, if it isn't running already."""
+        interval = config.as_float(("pipeman", "registry", "check_seconds"), default=REFRESH_FREQUENCY)
+        with self._lock:
+            if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+                return
+            self._halt.clear()
+            self._watcher = threading.Thread(
+                target=self._watch,
+                args=(interval,),
+                daemon=True,
+                name="registry_watcher"
+            )
+            self._watcher.start()
+
+    def stop_watcher(self):
+        self._halt.set()
+
+    @injector.as_thread_run
+    def _watch(self, interval: float):
+        while not self._halt.wait(interval):
+            try:
+                self.check_all()
+            except Exception:
+                self._log.exception("Error while checking for registry updates")
 
 
 @injector.injectable
@@ -70,6 +155,7 @@ class ObjectController:
     def clear_object_defs(self, obj_type):
         with self.db as session:
             session.query(orm.ConfigRegistry).filter_by(obj_type=obj_type).delete()
+            self.bump_version(session, obj_type)
             session.commit()
 
     def upsert_object_def(self, obj_type, obj_name, config):
@@ -79,7 +165,6 @@ class ObjectController:
                 cfg = ObjectController._from_json(obj_def.config) or {}
                 deep_update(cfg, config or {})
                 obj_def.config = ObjectController._to_json(cfg)
-                session.commit()
             else:
                 obj_def = orm.ConfigRegistry(
                     obj_type=obj_type,
@@ -87,7 +172,67 @@ class ObjectController:
                     config=ObjectController._to_json(config)
                 )
                 session.add(obj_def)
-                session.commit()
+            self.bump_version(session, obj_type)
+            session.commit()
+
+    def bulk_upsert_object_defs(self, obj_type, defs: dict) -> tuple[int, int]:
+        """Upsert many definitions of one type in a single transaction; returns the number inserted and updated.
+
+        Existing definitions are merged the same way as upsert_object_def(), and unchanged rows are not written.
+        """
+        with self.db as session:
+            existing = {
+                obj_name: (obj_id, config)
+                for obj_id, obj_name, config in session.execute(
+                    sa.select(orm.ConfigRegistry.id, orm.ConfigRegistry.obj_name, orm.ConfigRegistry.config)
+                    .where(orm.ConfigRegistry.obj_type == obj_type)
+                )
+            }
+            inserts = []
+            updates = []
+            for obj_name, config in defs.items():
+                # _to_json() changes the dictionary, keep the caller's copy as is
+                config = copy.deepcopy(config or {})
+                if obj_name in existing:
+                    obj_id, old_config = existing[obj_name]
+                    cfg = ObjectController._from_json(old_config) or {}
+                    deep_update(cfg, config)
+                    new_config = ObjectController._to_json(cfg)
+                    if new_config != old_config:
+                        updates.append({"id": obj_id, "config": new_config})
+                else:
+                    inserts.append({"obj_type": obj_type, "obj_name": obj_name, "config": ObjectController._to_json(config)})
+            for i in range(0, len(inserts), BULK_BATCH_SIZE):
+                session.execute(sa.insert(orm.ConfigRegistry), inserts[i:i + BULK_BATCH_SIZE])
+            for i in range(0, len(updates), BULK_BATCH_SIZE):
+                session.execute(sa.update(orm.ConfigRegistry), updates[i:i + BULK_BATCH_SIZE])
+            if inserts or updates:
+                self.bump_version(session, obj_type)
+            session.commit()
+            return len(inserts), len(updates)
+
+    @staticmethod
+    def bump_version(session, obj_type):
+        """Increment the version of an object type so that other processes reload it (commit with the change).
+
+        The increment is done in the database so that concurrent writers can't overwrite each other's version.
+        """
+        key = VERSION_KEY_PREFIX + obj_type
+        # The value is a JSON integer, which is also valid as the text of an integer
+        increment = (
+            sa.update(orm.KeyValue)
+            .where(orm.KeyValue.key == key)
+            .values(value=sa.cast(sa.func.coalesce(sa.cast(orm.KeyValue.value, sa.Integer), 0) + 1, sa.Text))
+            .execution_options(synchronize_session=False)
+        )
+        if session.execute(increment).rowcount > 0:
+            return
+        try:
+            with session.begin_nested():
+                session.execute(sa.insert(orm.KeyValue).values(key=key, value=json.dumps(1)))
+        # Another writer inserted it first
+        except IntegrityError:
+            session.execute(increment)
 
     @staticmethod
     def _to_json(config):
@@ -142,6 +287,143 @@ class ObjectController:
             return config
 
 
+class RegistryFile:
+    """A YAML file of object definitions, read by RegistryFileTracker."""
+
+    def __init__(self, path: pathlib.Path, obj_types: list[str], digest: str, content=None):
+        self.path = path
+        self.obj_types = obj_types
+        self.digest = digest
+        self.content = content
+
+
+@injector.injectable
+class RegistryFileTracker:
+    """Skips YAML files of object definitions that have not changed since they were last imported.
+
+    After a file is imported, its hash is saved along with the versions of the object types it defines. The file is
+    skipped when both still match; any other change to those types (including removing them) imports it again.
+    """
+
+    db: Database = None
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.registries")
+        self._skip_unchanged = self.config.as_bool(("pipeman", "registry", "skip_unchanged_files"), default=True)
+
+    def load(self, file_path, obj_types: list[str]) -> t.Optional[RegistryFile]:
+        """Read a file, returning None if it can be skipped."""
+        path = pathlib.Path(file_path).resolve()
+        with open(path, "rb") as h:
+            raw = h.read()
+        rf = RegistryFile(path, obj_types, hashlib.sha256(raw).hexdigest())
+        if self._skip_unchanged:
+            with self.db as session:
+                entry = session.query(orm.KeyValue).filter_by(key=self._key(path)).first()
+                if entry and entry.value and json.loads(entry.value) == self._state(session, rf):
+                    self._log.notice(f"Skipping [{path}], it has not changed since it was imported")
+                    return None
+        rf.content = yaml.safe_load(raw.decode("utf-8"))
+        return rf
+
+    def mark_imported(self, rf: RegistryFile):
+        with self.db as session:
+            key = self._key(rf.path)
+            entry = session.query(orm.KeyValue).filter_by(key=key).first()
+            value = json.dumps(self._state(session, rf))
+            if entry:
+                entry.value = value
+            else:
+                session.add(orm.KeyValue(key=key, value=value))
+            session.commit()
+
+    @staticmethod
+    def _key(path: pathlib.Path) -> str:
+        return FILE_KEY_PREFIX + hashlib.sha1(str(path).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _state(session, rf: RegistryFile) -> dict:
+        versions = {
+            key[len(VERSION_KEY_PREFIX):]: json.loads(value) if value else 0
+            for key, value in session.execute(
+                sa.select(orm.KeyValue.key, orm.KeyValue.value)
+                .where(orm.KeyValue.key.in_([VERSION_KEY_PREFIX + x for x in rf.obj_types]))
+            )
+        }
+        return {"hash": rf.digest, "versions": {x: versions.get(x, 0) for x in rf.obj_types}}
+
+
+@injector.injectable
+class RegistrySnapshot:
+    """A pickled copy of every registry, so that workers can start without reading and decoding each definition.
+
+    "core setup" writes the snapshot to ``pipeman.registry.snapshot_file`` along with the registry versions it was
+    built from. At startup the snapshot is only used if those versions match the ones in the database; otherwise the
+    registries are loaded from the database and the snapshot is written again.
+    """
+
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.registries")
+        self.path = self.config.as_path(("pipeman", "registry", "snapshot_file"), default=None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def read(self, versions: dict[str, int]) -> t.Optional[dict[str, dict]]:
+        """Load the definitions from the snapshot, or return None if it is missing or out of date."""
+        if not self.enabled or not self.path.exists():
+            return None
+        try:
+            with open(self.path, "rb") as h:
+                snapshot = pickle.load(h)
+        except Exception:
+            self._log.exception(f"Error reading registry snapshot [{self.path}]")
+            return None
+        if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("versions") != versions:
+            self._log.info(f"Registry snapshot [{self.path}] is out of date")
+            return None
+        return snapshot["types"]
+
+    def write(self, versions: dict[str, int], type_maps: dict[str, dict]):
+        """Save the definitions to the snapshot file, replacing it atomically."""
+        if not self.enabled:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as h:
+                pickle.dump(
+                    {"format": SNAPSHOT_FORMAT, "versions": versions, "types": type_maps},
+                    h,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
+            # mkstemp() only gives the owner access, but the web server may run as another user
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path)
+        except Exception:
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+            raise
+        self._log.info(f"Wrote registry snapshot [{self.path}]")
+
+
+@injector.inject
+def write_registry_snapshot(gor: GlobalObjectRegistry = None, snapshot: RegistrySnapshot = None):
+    """Reload every registry from the database and save the snapshot (run after setup)."""
+    if not snapshot.enabled:
+        return
+    versions = gor.mark_versions()
+    for obj in list(gor._registry):
+        if isinstance(obj, BaseObjectRegistry):
+            obj.reload_types()
+    snapshot.write(versions, gor.type_maps())
+
+
 class BaseObjectRegistry:
 
     gor: GlobalObjectRegistry = None
@@ -152,6 +434,7 @@ class BaseObjectRegistry:
         self._lock = RLock()
         self._obj_type = obj_type
         self._ensure_fields = ensure_fields
+        self._version = 0
         self.gor.register(self)
         self._log = zrlog.get_logger("pipeman.registries")
 
@@ -178,20 +461,34 @@ class BaseObjectRegistry:
         keys.sort()
         return keys
 
+    @property
+    def obj_type(self) -> str:
+        return self._obj_type
+
+    @property
+    def version(self) -> int:
+        """Incremented whenever the object definitions change, for use in cache keys."""
+        return self._version
+
     @injector.inject
     def reload_types(self, oc: ObjectController = None):
         with self._lock:
-            found = []
-            for obj_name, config in oc.get_object_defs(self._obj_type):
-                found.append(obj_name)
-                self._type_map[obj_name] = config
-            for obj_name in list(self._type_map.keys()):
-                if obj_name not in found:
-                    del self._type_map[obj_name]
+            # Swap in a new map so that other threads never see a partly loaded one
+            self._type_map = {obj_name: config for obj_name, config in oc.get_object_defs(self._obj_type)}
+            self._version += 1
+
+    def load_type_map(self, type_map: dict):
+        with self._lock:
+            self._type_map = type_map
+            self._version += 1
 
     @injector.inject
     def register(self, obj_name, oc: ObjectController = None, **config):
         oc.upsert_object_def(self._obj_type, obj_name, config)
+        self._merge_local(obj_name, config)
+        self._version += 1
+
+    def _merge_local(self, obj_name, config):
         if self._ensure_fields:
             for f in self._ensure_fields:
                 if f not in config:
@@ -201,18 +498,28 @@ class BaseObjectRegistry:
         else:
             self._type_map[obj_name] = config or {}
 
-    def register_from_dict(self, cfg_dict):
-        cfg_dict = cfg_dict or {}
+    @injector.inject
+    def register_from_dict(self, cfg_dict, oc: ObjectController = None):
+        cfg_dict = {key: dict(cfg_dict[key] or {}) for key in cfg_dict or {}}
         self._log.debug(f"Importing {len(cfg_dict)} object definitions of type [{self._obj_type}]")
-        for key in cfg_dict:
-            self.register(key, **cfg_dict[key])
+        inserted, updated = oc.bulk_upsert_object_defs(self._obj_type, cfg_dict)
+        self._log.debug(f"Inserted {inserted} and updated {updated} object definitions of type [{self._obj_type}]")
+        with self._lock:
+            for key in cfg_dict:
+                self._merge_local(key, cfg_dict[key])
+            self._version += 1
 
-    def register_from_yaml(self, file_path):
+    @injector.inject
+    def register_from_yaml(self, file_path, tracker: RegistryFileTracker = None):
+        rf = tracker.load(file_path, [self._obj_type])
+        if rf is None:
+            return
         self._log.notice(f"Importing object definitions of type [{self._obj_type}] from [{file_path}]")
-        with open(file_path, "r", encoding="utf-8") as h:
-            self.register_from_dict(yaml.safe_load(h))
+        self.register_from_dict(rf.content)
+        tracker.mark_imported(rf)
 
     @injector.inject
     def remove_all(self, oc: ObjectController = None):
         self._log.notice(f"Removing all object definitions of type [{self._obj_type}]")
         oc.clear_object_defs(self._obj_type)
+        self._version += 1
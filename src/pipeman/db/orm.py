@@ -179,22 +179,40 @@ class Entity(_BaseModel, _AuditableModel, Base):
     parent_id = sa.Column(sa.Integer, nullable=True, index=True)
     parent_type = sa.Column(sa.String(255), nullable=True, index=True)
     guid = sa.Column(sa.String(255), nullable=True, index=True)
+    latest_revision_no = sa.Column(sa.Integer, nullable=True)
 
     data = orm.relationship("EntityData", back_populates="entity")
     organization = orm.relationship("Organization", back_populates="entities")
 
     def latest_revision(self):
-        latest = None
-        for ed in self.data:
-            if latest is None or latest.revision_no < ed.revision_no:
-                latest = ed
-        return latest
+        if self.latest_revision_no is not None:
+            return self.specific_revision(self.latest_revision_no)
+        session = orm.object_session(self)
+        if session is None:
+            latest = None
+            for ed in self.data:
+                if latest is None or latest.revision_no < ed.revision_no:
+                    latest = ed
+            return latest
+        return self._revision_query(session).order_by(EntityData.revision_no.desc()).first()
 
     def specific_revision(self, rev_no):
         rev_no = int(rev_no)
-        for ed in self.data:
-            if ed.revision_no == rev_no:
-                return ed
+        session = orm.object_session(self)
+        if session is None:
+            for ed in self.data:
+                if ed.revision_no == rev_no:
+                    return ed
+            return None
+        return self._revision_query(session).filter(EntityData.revision_no == rev_no).first()
+
+    def next_revision_no(self):
+        session = orm.object_session(self)
+        current = session.query(sa.func.max(EntityData.revision_no)).filter(EntityData.entity_id == self.id).scalar()
+        return 1 if current is None else current + 1
+
+    def _revision_query(self, session):
+        return session.query(EntityData).filter(EntityData.entity_id == self.id)
 
     def set_display_name(self, language, display_name):
         dns = {}
@@ -272,6 +290,8 @@ class Dataset(_BaseModel, _AuditableModel, Base):
     guid = sa.Column(sa.String(255), nullable=False)
     authority = sa.Column(sa.String(255), nullable=True, default=None)
     activated_item_id = sa.Column(sa.ForeignKey("workflow_item.id"), nullable=True)
+    latest_revision_no = sa.Column(sa.Integer, nullable=True)
+    latest_published_revision_no = sa.Column(sa.Integer, nullable=True)
 
     attachments = orm.relationship("Attachment", back_populates="dataset")
     organization = orm.relationship("Organization", back_populates="datasets")
@@ -279,26 +299,57 @@ class Dataset(_BaseModel, _AuditableModel, Base):
     users = orm.relationship("User", secondary=user_dataset, back_populates="datasets")
 
     def latest_revision(self):
-        latest = None
-        for ed in self.data:
-            if latest is None or latest.revision_no < ed.revision_no:
-                latest = ed
-        return latest
+        if self.latest_revision_no is not None:
+            return self.specific_revision(self.latest_revision_no)
+        session = orm.object_session(self)
+        if session is None:
+            latest = None
+            for ed in self.data:
+                if latest is None or latest.revision_no < ed.revision_no:
+                    latest = ed
+            return latest
+        return self._revision_query(session).order_by(MetadataEdition.revision_no.desc()).first()
 
     def latest_published_revision(self):
-        latest = None
-        for ed in self.data:
-            if not ed.is_published:
-                continue
-            if latest is None or latest.revision_no < ed.revision_no:
-                latest = ed
-        return latest
+        if self.latest_published_revision_no is not None:
+            return self.specific_revision(self.latest_published_revision_no)
+        session = orm.object_session(self)
+        if session is None:
+            latest = None
+            for ed in self.data:
+                if not ed.is_published:
+                    continue
+                if latest is None or latest.revision_no < ed.revision_no:
+                    latest = ed
+            return latest
+        return (
+            self._revision_query(session)
+            .filter(MetadataEdition.is_published == True)
+            .order_by(MetadataEdition.revision_no.desc())
+            .first()
+        )
 
     def specific_revision(self, rev_no):
         rev_no = int(rev_no)
-        for ed in self.data:
-            if ed.revision_no == rev_no:
-                return ed
+        session = orm.object_session(self)
+        if session is None:
+            for ed in self.data:
+                if ed.revision_no == rev_no:
+                    return ed
+            return None
+        return self._revision_query(session).filter(MetadataEdition.revision_no == rev_no).first()
+
+    def next_revision_no(self):
+        session = orm.object_session(self)
+        current = session.query(sa.func.max(MetadataEdition.revision_no)).filter(MetadataEdition.dataset_id == self.id).scalar()
+        return 1 if current is None else current + 1
+
+    def mark_published(self, edition):
+        if self.latest_published_revision_no is None or self.latest_published_revision_no < edition.revision_no:
+            self.latest_published_revision_no = edition.revision_no
+
+    def _revision_query(self, session):
+        return session.query(MetadataEdition).filter(MetadataEdition.dataset_id == self.id)
 
     def set_display_name(self, language, display_name):
         dns = {}
@@ -322,6 +373,7 @@ class MetadataEdition(_BaseModel, _AuditableModel, Base):
 
     __table_args__ = (
         sa.UniqueConstraint("dataset_id", "revision_no", name="unique_dataset_revision_data"),
+        sa.Index("ix_metadata_edition_published_revision", "dataset_id", "is_published", "revision_no"),
     )
 
     dataset_id = sa.Column(sa.ForeignKey("dataset.id"), nullable=False, index=True)
@@ -347,6 +399,13 @@ class ConfigRegistry(_BaseModel, _AuditableModel, Base):
 
 class WorkflowItem(_BaseModel, _AuditableModel, Base):
 
+    __table_args__ = (
+        sa.Index("ix_workflow_item_status_created_date", "status", "created_date"),
+        sa.Index("ix_workflow_item_status_next_attempt_at", "status", "next_attempt_at"),
+        sa.Index("ix_workflow_item_status_lane_priority", "status", "lane", "priority"),
+        sa.Index("ix_workflow_item_status_remote_pipeline", "status", "remote_pipeline"),
+    )
+
     context = sa.Column(sa.Text)
     workflow_type = sa.Column(sa.String(255), index=True)
     workflow_name = sa.Column(sa.String(255), index=True)
@@ -357,6 +416,12 @@ class WorkflowItem(_BaseModel, _AuditableModel, Base):
     status = sa.Column(sa.String(255))
     locked_by = sa.Column(sa.String(36))
     locked_since = sa.Column(sa.DateTime)
+    lock_expiry = sa.Column(sa.DateTime(timezone=True), nullable=True)
+    next_attempt_at = sa.Column(sa.DateTime(timezone=True), nullable=True)
+    attempt = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    priority = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    lane = sa.Column(sa.String(64), nullable=True)
+    remote_pipeline = sa.Column(sa.String(255), nullable=True)
     step_output = sa.Column(sa.Text)
 
     decisions = orm.relationship("WorkflowDecision", back_populates="workflow_item")
@@ -364,6 +429,22 @@ class WorkflowItem(_BaseModel, _AuditableModel, Base):
     created_by_user = orm.relationship("User")
 
 
+class WorkflowItemArchive(_BaseModel, _AuditableModel, Base):
+
+    # id is copied from the original workflow item
+    context = sa.Column(sa.Text)
+    workflow_type = sa.Column(sa.String(255), index=True)
+    workflow_name = sa.Column(sa.String(255))
+    object_type = sa.Column(sa.String(255), nullable=True)
+    object_id = sa.Column(sa.Integer, index=True)
+    step_list = sa.Column(sa.Text)
+    completed_index = sa.Column(sa.Integer, nullable=True)
+    status = sa.Column(sa.String(255))
+    step_output = sa.Column(sa.Text)
+    decisions = sa.Column(sa.Text)
+    archived_date = sa.Column(sa.DateTime(timezone=True), index=True)
+
+
 class Attachment(_BaseModel, _AuditableModel, Base):
 
     file_name = sa.Column(sa.String(1024), nullable=False)
@@ -22,12 +22,26 @@ class Field:
         self.field_config = field_config
         self.display_group = field_config['display_group'] if 'display_group' in field_config else ""
         self.order = field_config['order'] if 'order' in field_config else 0
-        self.value = None
-        self._use_default_repeatable = True
         self.parent = container
+        self._value = None
+        self._use_default_repeatable = True
         self._default_thesaurus = None
         self._log = zrlog.get_logger("pipeman.field")
 
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.value_changed()
+
+    def value_changed(self):
+        """Call after modifying the value in place so that the parent can drop anything derived from it."""
+        if self.parent is not None and hasattr(self.parent, "invalidate_data"):
+            self.parent.invalidate_data()
+
     @property
     def parent_id(self):
         return self.parent.container_id if self.parent else None
@@ -87,6 +101,7 @@ class Field:
             self._set_from_translation(self.value[index], val)
         else:
             self._set_from_translation(self.value, val)
+        self.value_changed()
 
     def _set_from_translation(self, current_value, new_value):
         if not isinstance(current_value, dict):
@@ -0,0 +1,73 @@
+import datetime
+import json
+import threading
+import time
+import uuid
+
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.dbconfig import ValueController
+
+
+VERSION_KEY = "entity_content_version"
+
+
+@injector.injectable_global
+class EntityChangeTracker:
+    """Tracks a version token that changes whenever any entity is saved, removed or restored.
+
+    Anything derived from entity content (such as rendered metadata) can include the token in its cache keys. The
+    token is stored in the database so that changes made by other processes are picked up after a short delay.
+    """
+
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.entity.changes")
+        self._lock = threading.Lock()
+        self._version = None
+        self._changed_date = None
+        self._last_check = None
+        self._check_frequency = self.config.as_float(("pipeman", "entity", "cache_check_seconds"), default=60)
+
+    def version(self) -> str:
+        self._check_version()
+        return self._version or ""
+
+    def changed_date(self) -> datetime.datetime | None:
+        """When entity content was last changed, if known."""
+        self._check_version()
+        return self._changed_date
+
+    def mark_changed(self, session):
+        """Record in the database that entity content has changed; commit the session afterwards."""
+        version = str(uuid.uuid4())
+        changed_date = datetime.datetime.now().astimezone()
+        value = json.dumps({"version": version, "changed_date": changed_date.isoformat()})
+        entry = session.query(orm.KeyValue).filter_by(key=VERSION_KEY).first()
+        if entry:
+            entry.value = value
+        else:
+            session.add(orm.KeyValue(key=VERSION_KEY, value=value))
+        self._version = version
+        self._changed_date = changed_date
+
+    def _check_version(self):
+        if self._last_check is None or (time.monotonic() - self._last_check) >= self._check_frequency:
+            with self._lock:
+                if self._last_check is None or (time.monotonic() - self._last_check) >= self._check_frequency:
+                    self._last_check = time.monotonic()
+                    self._check_version_now()
+
+    @injector.inject
+    def _check_version_now(self, vc: ValueController = None):
+        remote = vc.get_value(VERSION_KEY) or {}
+        if remote.get("version") != self._version:
+            if self._version is not None:
+                self._log.debug("Entity content changed in another process")
+            self._version = remote.get("version")
+            self._changed_date = datetime.datetime.fromisoformat(remote["changed_date"]) if remote.get("changed_date") else None
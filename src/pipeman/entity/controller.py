@@ -8,6 +8,7 @@ from autoinject import injector
 import wtforms as wtf
 import flask
 from .entity import entity_access, specific_entity_access
+from .changes import EntityChangeTracker
 from pipeman.i18n import gettext, MultiLanguageString, DelayedTranslationString
 from pipeman.db import Database
 from pipeman.util.flask import TranslatableField
@@ -29,6 +30,9 @@ from ..util import UserInputError
 import typing as t
 
 
+ENTITY_LOAD_CHUNK_SIZE = 500
+
+
 """ This is an order of entity_types that are safe to load without circular references.
     Where there is a list of entity types, they can cross-reference each other! Be careful. """
 ENTITY_ORDER: list[str | list[str]] = [
@@ -84,6 +88,7 @@ class EntityController:
 
     db: Database = None
     reg: EntityRegistry = None
+    changes: EntityChangeTracker = None
 
     @injector.construct
     def __init__(self, view_template="view_entity.html", edit_template="form.html"):
@@ -419,6 +424,18 @@ class EntityController:
             query = query.filter_by(parent_id=parent_id, parent_type=parent_type)
             return self._entity_iterator(query, True)
 
+    def list_component_ids(self, entity_type, parent_id, parent_type, include_deprecated: bool = False) -> list[int]:
+        with self.db as session:
+            query = (
+                session.query(orm.Entity.id)
+                .filter_by(entity_type=entity_type, parent_id=parent_id, parent_type=parent_type)
+            )
+            if not include_deprecated:
+                query = query.filter(orm.Entity.is_deprecated == False)
+            for filter in self.base_filters():
+                query = query.filter(filter)
+            return [x[0] for x in query.order_by(orm.Entity.id)]
+
     def _entity_query(self, entity_type, session):
         q = session.query(orm.Entity).filter_by(entity_type=entity_type)
         for filter in self.base_filters():
@@ -471,6 +488,7 @@ class EntityController:
         with self.db as session:
             ent = session.query(orm.Entity).filter_by(entity_type=entity.entity_type, id=entity.container_id).first()
             ent.is_deprecated = True
+            self.changes.mark_changed(session)
             session.commit()
 
     def restore_entity(self, entity):
@@ -478,6 +496,7 @@ class EntityController:
         with self.db as session:
             ent = session.query(orm.Entity).filter_by(entity_type=entity.entity_type, id=entity.container_id).first()
             ent.is_deprecated = False
+            self.changes.mark_changed(session)
             session.commit()
 
     def load_entity(self, entity_type, entity_id, revision_no=None):
@@ -491,11 +510,49 @@ class EntityController:
                 raise EntityNotFoundError(entity_id)
             return self._load_entity_from_orm(e, revision_no)
 
+    def load_entities(self, entity_ids: t.Iterable[int], revision_map: dict[int, int] = None, entity_type: str = None) -> dict[int, Entity]:
+        """Load several entities at once, returning a dictionary of entity ID to entity (missing entities are
+        left out). revision_map can specify the revision to load for each entity, otherwise the latest is loaded."""
+        entity_ids = list(set(int(x) for x in entity_ids))
+        revision_map = revision_map or {}
+        entities = {}
+        if not entity_ids:
+            return entities
+        self._log.debug(f"Loading {len(entity_ids)} entities")
+        with self.db as session:
+            for i in range(0, len(entity_ids), ENTITY_LOAD_CHUNK_SIZE):
+                chunk = entity_ids[i:i + ENTITY_LOAD_CHUNK_SIZE]
+                query = session.query(orm.Entity).filter(orm.Entity.id.in_(chunk))
+                if entity_type is not None:
+                    query = query.filter(orm.Entity.entity_type == entity_type)
+                orm_entities = query.all()
+                wanted = {}
+                for e in orm_entities:
+                    rev_no = revision_map.get(e.id) or e.latest_revision_no
+                    if rev_no is not None:
+                        wanted[e.id] = int(rev_no)
+                revisions = {}
+                if wanted:
+                    rev_query = session.query(orm.EntityData).filter(
+                        sa.tuple_(orm.EntityData.entity_id, orm.EntityData.revision_no).in_(list(wanted.items()))
+                    )
+                    revisions = {ed.entity_id: ed for ed in rev_query}
+                for e in orm_entities:
+                    if e.id in wanted:
+                        entities[e.id] = self._build_entity(e, revisions.get(e.id))
+                    else:
+                        # No pointer to the latest revision yet, so find it the slow way
+                        entities[e.id] = self._build_entity(e, e.latest_revision())
+        return entities
+
     def _load_entity_from_orm(self, e, revision_no=None):
         entity_data = e.specific_revision(revision_no) if revision_no else e.latest_revision()
+        return self._build_entity(e, entity_data)
+
+    def _build_entity(self, e, entity_data):
         return self.reg.new_entity(
                 e.entity_type,
-                field_values=json.loads(entity_data.data) if entity_data else {},
+                field_values_json=entity_data.data if entity_data else None,
                 display_names=json.loads(e.display_names) if e.display_names else None,
                 db_id=e.id,
                 ed_id=entity_data.id if entity_data else None,
@@ -544,8 +601,7 @@ class EntityController:
             while retries > 0:
                 retries -= 1
                 try:
-                    rev_nos = [ed.revision_no for ed in session.query(orm.EntityData).filter_by(entity_id=e.id)]
-                    next_rev = 1 if not rev_nos else max(rev_nos) + 1
+                    next_rev = e.next_revision_no()
                     ed = orm.EntityData(
                         entity_id=e.id,
                         revision_no=next_rev,
@@ -553,6 +609,8 @@ class EntityController:
                         created_by=flask_login.current_user.user_id
                     )
                     session.add(ed)
+                    e.latest_revision_no = next_rev
+                    self.changes.mark_changed(session)
                     session.commit()
                     break
                 # Trap an error in case two people try to insert at the same time
@@ -4,15 +4,16 @@ from autoinject import injector
 import flask
 import flask_login
 from pipeman.i18n import MultiLanguageString
-import copy
 import zrlog
 
 from pipeman.i18n.i18n import BaseTranslatableString
 from pipeman.util import deep_update, load_object
-from functools import cache
 from pipeman.db import BaseObjectRegistry
 from pipeman.i18n import gettext
 from threading import RLock
+from .schema import ContainerSchema, SchemaCache
+import collections.abc
+import json
 import typing as t
 
 
@@ -54,6 +55,9 @@ def specific_entity_access(entity, op: str, log_access_failures: bool = False) -
 @injector.injectable_global
 class EntityRegistry(BaseObjectRegistry):
 
+    schemas: SchemaCache = None
+
+    @injector.construct
     def __init__(self):
         super().__init__("entity")
 
@@ -78,28 +82,36 @@ class EntityRegistry(BaseObjectRegistry):
                     yield {field_name}
 
     def new_entity(self, key, **kwargs):
-        ent = Entity(
+        return Entity(
             key,
-            field_list=self[key]["fields"],
+            schema=self.entity_schema(key),
             is_component=self[key]["is_component"] if "is_component" in self[key] else False,
             **kwargs
         )
+
+    def entity_schema(self, key) -> ContainerSchema:
+        return self.schemas.get(("entity", key, self.version), lambda: self._compile_schema(key))
+
+    def _compile_schema(self, key) -> ContainerSchema:
+        derived_fields = []
+        field_validators = []
+        self_validators = []
         if "derived_fields" in self[key] and self[key]["derived_fields"]:
             dfns = self[key]["derived_fields"]
             for dfn in dfns:
-                ent.add_derived_field(dfn, dfns[dfn]["label"], dfns[dfn]["value_function"])
+                derived_fields.append((dfn, dfns[dfn]["label"], dfns[dfn]["value_function"]))
         if 'validation' in self[key] and self[key]['validation']:
             validation = self[key]['validation']
             if 'required' in validation and validation['required']:
                 for fn in validation['required']:
-                    ent.add_field_validator(fn, RequiredFieldValidator())
+                    field_validators.append((fn, RequiredFieldValidator()))
             if 'recommended' in validation and validation['recommended']:
                 for fn in validation['recommended']:
-                    ent.add_field_validator(fn, RecommendedFieldValidator())
+                    field_validators.append((fn, RecommendedFieldValidator()))
             if 'custom' in validation and validation['custom']:
                 for call in validation['custom']:
-                    ent.add_self_validator(CustomValidator(call))
-        return ent
+                    self_validators.append(CustomValidator(call))
+        return ContainerSchema(self[key]["fields"], derived_fields, field_validators, self_validators)
 
 
 def combine_object_path(parent_path, sub_path):
@@ -110,21 +122,99 @@ def combine_object_path(parent_path, sub_path):
     return new_path
 
 
-class FieldContainer:
+class LazyFieldMap(collections.abc.MutableMapping):
+    """Mapping of field name to field that only builds each field (and unserializes its value) on first access.
+
+    The raw values can be given as a JSON string, in which case it is only parsed once the first field is built.
+    """
 
     creator: FieldCreator = None
 
     @injector.construct
-    def __init__(self, container_type: str, container_id: int | None, field_list: dict, field_values: dict = None, display_names: dict = None, is_deprecated: bool = False, org_id: int = None):
-        self._fields = {}
+    def __init__(self, container, schema: ContainerSchema, field_values: dict = None, field_values_json: str = None):
+        self._container = container
+        self._schema = schema
+        self._raw_values = field_values
+        self._raw_json = field_values_json
+        self._built = {}
+
+    def raw_values(self) -> dict:
+        if self._raw_values is None:
+            self._raw_values = json.loads(self._raw_json) if self._raw_json else {}
+            self._raw_json = None
+        return self._raw_values
+
+    def _build(self, field_name):
+        field_schema = self._schema.fields[field_name]
+        # Fields may adjust top-level settings on their config, so they each get their own copy of it
+        field = self.creator.build_field(field_name, field_schema.data_type, dict(field_schema.config), self._container)
+        raw_values = self.raw_values()
+        if raw_values and field_name in raw_values:
+            # Loading the stored value is not a change, so skip the notification
+            field._value = field.unserialize(raw_values[field_name])
+        return field
+
+    def __getitem__(self, field_name):
+        if field_name not in self._built:
+            if field_name not in self._schema.fields:
+                raise KeyError(field_name)
+            self._built[field_name] = self._build(field_name)
+        return self._built[field_name]
+
+    def __setitem__(self, field_name, field):
+        self._built[field_name] = field
+
+    def __delitem__(self, field_name):
+        raise TypeError("Fields cannot be removed from a container")
+
+    def __contains__(self, field_name):
+        return field_name in self._schema.fields or field_name in self._built
+
+    def __iter__(self):
+        yield from self._schema.fields
+        for field_name in self._built:
+            if field_name not in self._schema.fields:
+                yield field_name
+
+    def __len__(self):
+        return len(self._schema.fields) + sum(1 for x in self._built if x not in self._schema.fields)
+
+    def is_built(self, field_name) -> bool:
+        return field_name in self._built
+
+
+class FieldContainer:
+
+    @injector.construct
+    def __init__(self,
+                 container_type: str,
+                 container_id: int | None,
+                 field_list: dict = None,
+                 field_values: dict = None,
+                 display_names: dict = None,
+                 is_deprecated: bool = False,
+                 org_id: int = None,
+                 schema: ContainerSchema = None,
+                 field_values_json: str = None,
+                 lazy: bool = True):
         self.container_type = container_type
         self.container_id = container_id
         self.organization_id = org_id
-        self._load_fields(field_list, field_values)
+        self._schema = schema if schema is not None else ContainerSchema(field_list or {})
+        self._data_memo = {}
+        self._fields = LazyFieldMap(self, self._schema, field_values, field_values_json)
+        if not lazy:
+            for fn in self._schema.fields:
+                _ = self._fields[fn]
         self._display = display_names if display_names else {}
         self.is_deprecated = is_deprecated
-        self._validation_config = {"fields": {}, "self": []}
+        self._validation_config = {
+            "fields": {fn: list(self._schema.field_validators[fn]) for fn in self._schema.field_validators},
+            "self": list(self._schema.self_validators)
+        }
         self._derived_fields = {}
+        for dfn, label, cb in self._schema.derived_fields:
+            self.add_derived_field(dfn, label, cb)
 
     def field_label(self, fn):
         return self._fields[fn].label()
@@ -134,6 +224,7 @@ class FieldContainer:
             "label": field_label,
             "cb": field_cb
         }
+        self.invalidate_data()
 
     def add_field_validator(self, field_name, validator):
         if field_name not in self._validation_config["fields"]:
@@ -166,13 +257,6 @@ class FieldContainer:
             errors.extend(validator.validate(parent_path, self, memo))
         return errors
 
-    def _load_fields(self, field_list: dict, field_values: dict = None):
-        for field_name in field_list:
-            field_config = copy.deepcopy(field_list[field_name])
-            self._fields[field_name] = self.creator.build_field(field_name, field_config.get('data_type'), field_config, self)
-            if field_values and field_name in field_values:
-                self._fields[field_name].value = self._fields[field_name].unserialize(field_values[field_name])
-
     def display_values(self, display_group = None) -> t.Generator[tuple[str | BaseTranslatableString, t.Any, str | None, str | None], None, None]:
         if display_group == "__derived__":
             keys = list(self._derived_fields.keys())
@@ -203,10 +287,10 @@ class FieldContainer:
     def supports_display_group(self, display_group) -> bool:
         if display_group == "__derived__":
             return bool(self._derived_fields)
-        return any(self._fields[fn].display_group == display_group for fn in self._fields)
+        return any(self._field_display_group(fn) == display_group for fn in self._fields)
 
     def supported_display_groups(self) -> set:
-        dg = set(self._fields[fn].display_group for fn in self._fields)
+        dg = set(self._field_display_group(fn) for fn in self._fields)
         if self._derived_fields:
             dg.add("__derived__")
         return dg
@@ -214,8 +298,16 @@ class FieldContainer:
     def __html__(self):
         return str(self)
 
-    @cache
     def data(self, key, **kwargs):
+        memo_key = (key, *sorted(kwargs.items()))
+        if memo_key not in self._data_memo:
+            self._data_memo[memo_key] = self._data(key, **kwargs)
+        return self._data_memo[memo_key]
+
+    def invalidate_data(self):
+        self._data_memo.clear()
+
+    def _data(self, key, **kwargs):
         if key in self._derived_fields:
             try:
                 return load_object(self._derived_fields[key]['cb'])(self)
@@ -240,9 +332,16 @@ class FieldContainer:
         return {fn: self._fields[fn].control() for fn in self.ordered_field_names(display_group)}
 
     def ordered_field_names(self, display_group=None):
-        fields = [fn for fn in self._fields if display_group is None or display_group == self._fields[fn].display_group]
-        fields.sort(key=lambda x: (self._fields[x].order, x))
-        return fields
+        return [
+            fn for fn in self._schema.ordered_field_names
+            if display_group is None or display_group == self._field_display_group(fn)
+        ]
+
+    def _field_display_group(self, fn):
+        # Avoid building the field just to check which group it is in
+        if fn in self._schema.fields and not self._fields.is_built(fn):
+            return self._schema.fields[fn].display_group
+        return self._fields[fn].display_group
 
     def get_field(self, fn) -> t.Optional[Field]:
         if fn in self._fields:
@@ -251,8 +350,9 @@ class FieldContainer:
 
     def process_form_data(self, form_data, display_group=None):
         for fn in self._fields:
-            if display_group is None or display_group == self._fields[fn].display_group:
+            if display_group is None or display_group == self._field_display_group(fn):
                 self._fields[fn].value = self._fields[fn].sanitize_form_input(form_data[fn])
+        self.invalidate_data()
 
     def set_display_name(self, lang, name):
         self._display[lang] = name
@@ -61,14 +61,12 @@ class ComponentReferenceField(EntityRefMixin, HtmlContentField):
         return markupsafe.Markup(self._build_html_content())
 
     def data(self, **kwargs):
-        _data = []
-        for c, _, _ in self.component_list():
-            if c.is_deprecated:
-                continue
-            ent = self.ec.load_entity(c.entity_type, c.id)
-            if ent:
-                _data.append(ent)
-        return _data
+        if not self.parent_id:
+            return []
+        entity_type = self.field_config["entity_type"]
+        component_ids = self.ec.list_component_ids(entity_type, self.parent_id, self.parent_type)
+        entities = self.ec.load_entities(component_ids, entity_type=entity_type)
+        return [entities[x] for x in component_ids if x in entities]
 
     def _build_html_content(self):
         create_link = None
@@ -208,6 +206,7 @@ class InlineEntityReferenceField(EntityRefMixin, Field):
                 self.value = [info]
             else:
                 self.value.append(info)
+                self.value_changed()
         else:
             self.value = info
 
@@ -258,16 +257,66 @@ class EntityReferenceField(EntityRefMixin, ChoiceField):
             return ""
         return MultiLanguageLink(flask.url_for("core.view_entity", obj_type=entity.entity_type, obj_id=entity.container_id), entity.display_names())
 
+    def data(self, *args, **kwargs):
+        self._preload_entities()
+        return super().data(*args, **kwargs)
+
+    def display(self):
+        self._preload_entities()
+        return super().display()
+
+    def _preload_entities(self):
+        # Load every referenced entity in one go instead of once per value
+        if not self.value:
+            return
+        values = self.value if isinstance(self.value, list) else [self.value]
+        cache_key = tuple(str(x) for x in values)
+        if self._value_cache is not None and self._value_cache[0] == cache_key:
+            return
+        refs = {}
+        for val in values:
+            if not isinstance(val, (str, int)):
+                continue
+            try:
+                refs[val] = self._parse_value(val)
+            except ValueError:
+                continue
+        loaded = {}
+        latest = [ent_id for ent_id, rev_no in refs.values() if rev_no is None]
+        for ent_id, entity in self.ec.load_entities(latest).items():
+            loaded[(ent_id, None)] = entity
+        # load_entities() loads one revision per entity, so different revisions of the same entity take one call each
+        pinned = sorted(set(ref for ref in refs.values() if ref[1] is not None))
+        while pinned:
+            revision_map = {}
+            remaining = []
+            for ent_id, rev_no in pinned:
+                if ent_id in revision_map:
+                    remaining.append((ent_id, rev_no))
+                else:
+                    revision_map[ent_id] = rev_no
+            for ent_id, entity in self.ec.load_entities(revision_map.keys(), revision_map).items():
+                loaded[(ent_id, revision_map[ent_id])] = entity
+            pinned = remaining
+        self._value_cache = (cache_key, {val: loaded.get(refs[val]) for val in refs})
+
     def _process_value(self, val, **kwargs):
         if val is None or val == '':
             return None
+        if self._value_cache is not None and isinstance(val, (str, int)) and self._value_cache[1].get(val) is not None:
+            return self._value_cache[1][val]
         try:
-            ent_id, rev_no = EntitySelectField.parse_entity_option(val, False)
+            ent_id, rev_no = self._parse_value(val)
             return self.ec.load_entity(None, ent_id, rev_no)
         except ValueError:
             zrlog.get_logger("pipeman.entity_field").warning(f"Requested entity {val} does not exist")
             return None
 
+    @staticmethod
+    def _parse_value(val) -> tuple[int, t.Optional[int]]:
+        # Values pinned to a revision are stored as "entity_id|revision_no"
+        return EntitySelectField.parse_entity_option(str(val), "|" in str(val))
+
     def sanitize_form_input(self, val):
         if self.is_repeatable() and isinstance(val, list) and len(val) == 1 and isinstance(val[0], list):
             return val[0]
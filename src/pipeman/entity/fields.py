@@ -12,6 +12,7 @@ import pipeman.db.orm as orm
 from pipeman.i18n import gettext, format_date, format_datetime
 from pipeman.i18n import MultiLanguageString, DelayedTranslationString, MultiLanguageLink
 from pipeman.db import Database
+from pipeman.vocab.cache import VocabularyTermCache
 from pipeman.util.errors import APIInputError
 from pipeman.util.flask import HtmlField, FlatPickrWidget, Select2Widget
 from pipeman.entity.base import Field, NumberValidationMixin, NoControlMixin, LengthValidationMixin
@@ -473,6 +474,7 @@ class VocabularyReferenceField(ChoiceField):
     DATA_TYPE = "vocabulary"
 
     db: Database = None
+    term_cache: VocabularyTermCache = None
 
     @injector.construct
     def __init__(self, *args, **kwargs):
@@ -494,14 +496,17 @@ class VocabularyReferenceField(ChoiceField):
 
     def _build_choices(self):
         values: list[tuple[str, DelayedTranslationString | MultiLanguageString]] = [("", DelayedTranslationString("pipeman.common.placeholder"))]
-        with self.db as session:
-            for term in session.query(orm.VocabularyTerm).filter_by(vocabulary_name=self.field_config['vocabulary_name']):
-                dns = json.loads(term.display_names)
-                if "und" not in dns or not dns["und"]:
-                    dns['und'] = term.short_name
-                values.append((term.short_name, MultiLanguageString(dns)))
+        values.extend(self.term_cache.get(self.field_config['vocabulary_name']).choices)
         return values
 
+    def _find_choice(self, value) -> tuple:
+        if value is None or value == "":
+            return None, None
+        term = self.term_cache.find_term(self.field_config['vocabulary_name'], value)
+        if term is None:
+            return None, None
+        return term.short_name, term.choice_display
+
     def _process_value(self, val, none_as_blank=False, **kwargs):
         short, long = self._find_choice(val)
         if short is not None:
@@ -0,0 +1,84 @@
+import copy
+import threading
+import types
+import typing as t
+
+import zrlog
+from autoinject import injector
+
+from pipeman.db.obj_registry import GlobalObjectRegistry
+
+
+class FieldSchema:
+    """Compiled definition of a single field.
+
+    The configuration is copied once at compile time and shared by every field built from it, so it must be
+    treated as read-only; fields get a shallow copy of the top level to adjust their own settings.
+    """
+
+    __slots__ = ("name", "data_type", "config", "order", "display_group")
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.config = copy.deepcopy(config)
+        self.data_type = self.config.get("data_type")
+        self.order = self.config.get("order", 0)
+        self.display_group = self.config.get("display_group", "")
+
+
+class ContainerSchema:
+    """Compiled, immutable definition of the fields, derived fields and validators of a dataset or entity type."""
+
+    def __init__(self,
+                 field_list: dict,
+                 derived_fields: t.Iterable[tuple[str, t.Any, str]] = None,
+                 field_validators: t.Iterable[tuple[str, t.Any]] = None,
+                 self_validators: t.Iterable = None,
+                 profiles: t.Iterable[str] = None):
+        self.fields: t.Mapping[str, FieldSchema] = types.MappingProxyType({
+            fn: FieldSchema(fn, field_list[fn]) for fn in field_list
+        })
+        self.derived_fields: tuple = tuple(derived_fields or ())
+        self.self_validators: tuple = tuple(self_validators or ())
+        validators = {}
+        for fn, validator in (field_validators or ()):
+            validators.setdefault(fn, []).append(validator)
+        self.field_validators: t.Mapping[str, tuple] = types.MappingProxyType({
+            fn: tuple(validators[fn]) for fn in validators
+        })
+        self.profiles: frozenset = frozenset(profiles or ())
+        ordered = list(self.fields.keys())
+        ordered.sort(key=lambda x: (self.fields[x].order, x))
+        self.ordered_field_names: tuple = tuple(ordered)
+
+
+@injector.injectable_global
+class SchemaCache:
+    """Holds compiled schemas, keyed by whatever identifies the definition (including registry versions).
+
+    The cache is registered with the GlobalObjectRegistry so that it is emptied whenever the registries reload.
+    """
+
+    gor: GlobalObjectRegistry = None
+
+    @injector.construct
+    def __init__(self):
+        self._schemas: dict[tuple, ContainerSchema] = {}
+        self._lock = threading.Lock()
+        self._log = zrlog.get_logger("pipeman.schema")
+        self.gor.register(self)
+
+    def get(self, key: tuple, builder: t.Callable[[], ContainerSchema]) -> ContainerSchema:
+        schema = self._schemas.get(key)
+        if schema is None:
+            with self._lock:
+                schema = self._schemas.get(key)
+                if schema is None:
+                    self._log.debug(f"Compiling schema for {key}")
+                    schema = builder()
+                    self._schemas[key] = schema
+        return schema
+
+    def reload_types(self):
+        with self._lock:
+            self._schemas.clear()
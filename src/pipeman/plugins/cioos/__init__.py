@@ -10,7 +10,6 @@ import yaml
 def init_plugin(system: System = None):
     root = pathlib.Path(__file__).parent
     system.register_cli("pipeman.plugins.cioos.cli", "cioos")
-    system.on_setup("pipeman.plugins.cioos.cli.do_update")
     system.on_setup(setup_plugin)
 
 
@@ -9,10 +9,11 @@ def cioos():
 
 
 @cioos.command
-def update():
-    do_update()
+@click.option("--eovs", required=True, help="JSON copy of the EOV list ({\"eovs\": [...]})")
+def update(eovs):
+    do_update(eovs)
 
 
 @injector.inject
-def do_update(vm: CIOOSVocabularyManager = None):
-    vm.fetch()
+def do_update(eovs, vm: CIOOSVocabularyManager = None):
+    vm.fetch(eovs)
@@ -1,54 +1,35 @@
-import requests
-import csv
-from pipeman.vocab import VocabularyTermController
+from pipeman.vocab.ingest import VocabularyIngester, open_source, iter_json_array
 from autoinject import injector
-import xml.etree.ElementTree as ET
-import zirconium as zr
 import logging
 
 
 @injector.injectable
 class CIOOSVocabularyManager:
 
-    cfg: zr.ApplicationConfig = None
-    vtc: VocabularyTermController = None
+    ingester: VocabularyIngester = None
 
     @injector.construct
     def __init__(self):
-        self.cioos_eovs_list_url = self.cfg.as_str(
-            ("pipeman", "cioos", "eov_list_url"),
-            default="https://raw.githubusercontent.com/cioos-siooc/metadata-entry-form/refs/heads/main/src/eovs.js"
-        )
         self.log = logging.getLogger("pipeman.cioos_eovs")
 
-    def fetch(self):
-        self.fetch_eovs()
+    def fetch(self, eovs: str):
+        """Load the vocabularies from local copies or URLs of their sources."""
+        self.fetch_eovs(eovs)
 
-    def fetch_eovs(self):
+    def fetch_eovs(self, source: str):
+        """Load the EOVs from a JSON copy of the list ({"eovs": [...]})."""
         try:
-            resp = requests.get(self.cioos_eovs_list_url)
-            resp.raise_for_status()
-            return  # TODO: fix
-            self.vtc.clear_terms_from_dict("cioos_eovs")
-
-            cioos_eovs = resp.json()
-            if "eovs" in cioos_eovs:
-                eov_terms = {}
-                for eov in cioos_eovs["eovs"]:
-                    eov_terms[eov['value']] = {
-                        'display': {
-                            'en': eov['label EN'],
-                            'fr': eov['label FR']
-                        },
-                        'description': {
-                            'en': eov['definition EN'],
-                            'fr': eov['definition FR']
-                        }
-                    }
-                self.vtc.save_terms_from_dict("cioos_eovs", eov_terms)
-            else:
-                print("no eovs variable found")
+            eov_terms = self.ingester.stage("cioos_eovs")
+            with open_source(source) as h:
+                for eov in iter_json_array(h, "eovs"):
+                    eov_terms.add(
+                        eov['value'],
+                        {'en': eov['label EN'], 'fr': eov['label FR']},
+                        {'en': eov['definition EN'], 'fr': eov['definition FR']}
+                    )
+            if not eov_terms:
+                self.log.warning("No EOVs found")
+                return
+            self.ingester.apply(eov_terms)
         except Exception as ex:
             self.log.exception(ex)
-
-
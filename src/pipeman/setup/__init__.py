@@ -3,12 +3,14 @@ from pipeman.entity import EntityRegistry
 from pipeman.vocab import VocabularyRegistry
 from pipeman.workflow import WorkflowRegistry
 from pipeman.dataset import MetadataRegistry
+from pipeman.db.obj_registry import write_registry_snapshot
 from autoinject import injector
 import pathlib
 
 
 def init(system: System):
     system.on_setup(setup_module)
+    system.post_setup(write_registry_snapshot)
 
 
 @injector.inject
@@ -1,4 +1,6 @@
+import concurrent.futures
 import datetime
+import functools
 import signal
 import tracemalloc
 
@@ -11,6 +13,10 @@ import zrlog
 import time
 from autoinject import injector
 import enum
+import re
+import prometheus_client as pc
+from pipeman.db.instrumentation import start_query_tally, finish_query_tally
+from pipeman.util.metrics import PromMetrics
 
 
 class TaskState(enum.Enum):
@@ -20,90 +26,188 @@ class TaskState(enum.Enum):
     NONE = 0
 
 
+class TaskHandle:
+    """Passed to each task callback; long-running tasks should check ``halt`` and stop early when it is set."""
+
+    def __init__(self, halt_event: threading.Event, name: str):
+        self.halt = halt_event
+        self.task_name = name
+
+
+@injector.as_thread_run
+def _run_task(app, handle: TaskHandle, callback: t.Callable):
+    # Strip out IDs so that the metric labels don't grow without bounds
+    token = start_query_tally("cron:" + re.sub(r"\d+", "", handle.task_name or "task"))
+    try:
+        with app.app_context():
+            callback(handle)
+    except Exception:
+        zrlog.get_logger("dmd.uttm").exception(f"Error in task [{handle.task_name}]")
+    finally:
+        finish_query_tally(token)
+
+
 class UniqueTaskThreadManager:
+    """Runs named tasks on a pool of up to max_threads threads, ignoring a task if one with the same name is still pending.
 
-    def __init__(self, app, halt_event, max_threads):
+    Tasks are held here until :meth:`sow` is called and only handed to the pool while a thread is free, so the pool's
+    own queue stays empty and the lanes below are respected. Tasks can be given a lane. Each lane in ``reserved`` has
+    that many threads set aside that only its tasks can use; the remaining threads are shared by every task
+    (including any lane tasks beyond their reservation).
+
+    Once the halt event is set, no more tasks are started; running tasks are expected to check it and finish early.
+    """
+
+    metrics: PromMetrics = None
+
+    @injector.construct
+    def __init__(self, app, halt_event, max_threads, reserved: t.Optional[dict[str, int]] = None, name: str = "tasks"):
         self._app = app
         self.halt = halt_event
-        self._max_threads: int = max_threads
+        self.name = name
+        self._max_threads: int = max(1, max_threads)
+        self._reserved: dict[str, int] = {k: max(0, int(reserved[k])) for k in (reserved or {})}
         self._queued: dict[str, t.Callable] = {}
-        self._queued_names: list[str] = []
-        self._executing: dict[str, TaskThread] = {}
+        self._executing: dict[str, concurrent.futures.Future] = {}
+        self._lanes: dict[str, t.Optional[str]] = {}
+        self._lock = threading.RLock()
+        self._pool: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
         self._log = zrlog.get_logger("dmd.uttm")
-
-    def execute(self, name, callback):
-        self.reap()
-        if name in self._executing or name in self._queued_names:
-            self._log.info("skipping task [%s], already queued", name)
-            return
-        self._log.info("queuing task [%s] to call %s", name, callback)
-        self._queued[name] = callback
-        self._queued_names.append(name)
+        if self._reserved and sum(self._reserved.values()) >= self._max_threads:
+            # Tasks without a reserved lane would never run
+            self._log.warning(f"Reserved threads {self._reserved} leave none of the {self._max_threads} threads shared, ignoring them")
+            self._reserved = {}
+
+    def execute(self, name, callback, lane: t.Optional[str] = None):
+        with self._lock:
+            if name in self._executing or name in self._queued:
+                self._log.info("skipping task [%s], already queued", name)
+                return
+            self._log.info("queuing task [%s] to call %s", name, callback)
+            self._queued[name] = callback
+            self._lanes[name] = lane
+            self._update_gauges()
+
+    def cancel(self, name: str) -> bool:
+        """Remove a task that has not started yet; returns False if it is running or unknown."""
+        with self._lock:
+            if name in self._queued:
+                del self._queued[name]
+                self._lanes.pop(name, None)
+                self._update_gauges()
+                return True
+            return False
 
     def is_full(self) -> bool:
-        return (self._max_threads - len(self._executing) - len(self._queued_names)) <= 0
+        return self.available_slots() <= 0
+
+    def available_slots(self, lane: t.Optional[str] = None) -> int:
+        """How many more tasks can be queued for the given lane (or for no lane) right now."""
+        with self._lock:
+            used = self._lane_usage()
+            shared_used = sum(max(0, count - self._reserved.get(l, 0)) for l, count in used.items())
+            shared_free = max(0, self._max_threads - sum(self._reserved.values()) - shared_used)
+            return shared_free + self.reserved_slots(lane, used)
+
+    def reserved_slots(self, lane: t.Optional[str], used: t.Optional[dict] = None) -> int:
+        """How many of the threads reserved for a lane are free."""
+        if lane not in self._reserved:
+            return 0
+        with self._lock:
+            used = used if used is not None else self._lane_usage()
+            return max(0, self._reserved[lane] - used.get(lane, 0))
+
+    def _lane_usage(self) -> dict[t.Optional[str], int]:
+        used = {}
+        for name in self._lanes:
+            used[self._lanes[name]] = used.get(self._lanes[name], 0) + 1
+        return used
+
+    def reserved_lanes(self) -> list[str]:
+        return list(self._reserved.keys())
 
     def job_state(self, name: str):
-        if name in self._executing:
-            return TaskState.EXECUTING
-        if name in self._queued_names:
-            return TaskState.QUEUED
-        return TaskState.NONE
+        with self._lock:
+            if name in self._executing:
+                return TaskState.EXECUTING
+            if name in self._queued:
+                return TaskState.QUEUED
+            return TaskState.NONE
+
+    def queue_depth(self) -> int:
+        return len(self._queued)
 
     def sow(self):
-        self.reap()
-        if not self._queued_names:
-            self._log.debug("No tasks to queue")
-            return
-        sow_count = self._max_threads - len(self._executing)
-        while sow_count > 0 and self._queued_names:
-            self._sow(self._queued_names.pop(0))
-            sow_count -= 1
+        with self._lock:
+            if not self._queued:
+                self._log.debug("No tasks to queue")
+                return
             if self.halt.is_set():
-                break
-        else:
-            self._log.debug("Already at cap")
+                self._log.debug("Halt flag is set, not starting tasks")
+                return
+            sow_count = self._max_threads - len(self._executing)
+            if sow_count <= 0:
+                self._log.debug("Already at cap")
+            while sow_count > 0 and self._queued:
+                self._sow(next(iter(self._queued)))
+                sow_count -= 1
+            self._update_gauges()
 
     def _sow(self, key: str):
         self._log.debug("Starting job %s", key)
-        t = TaskThread(self._app, self.halt, self._queued.pop(key))
-        t.start()
-
-    def reap(self):
-        for k in self._executing:
-            if self._executing[k] and self._executing[k].is_alive():
-                self._log.trace("%s is still alive", k)
-                continue
-            else:
-                self._log.debug("Clearing job for %s", k)
-                del self._executing[k]
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_threads,
+                thread_name_prefix=f"uttm_{self.name}"
+            )
+        future = self._pool.submit(_run_task, self._app, TaskHandle(self.halt, key), self._queued.pop(key))
+        self._executing[key] = future
+        future.add_done_callback(functools.partial(self._task_done, key))
+
+    def _task_done(self, key: str, future: concurrent.futures.Future):
+        with self._lock:
+            if self._executing.get(key) is future:
+                self._log.debug("Clearing job for %s", key)
+                del self._executing[key]
+                self._lanes.pop(key, None)
+            self._update_gauges()
+
+    def _update_gauges(self):
+        self.metrics.get_stat(
+            "pipeman_task_queue_depth",
+            "Tasks waiting for a free thread",
+            pc.Gauge,
+            labelnames=["manager"],
+            multiprocess_mode="livesum"
+        ).labels(manager=self.name).set(len(self._queued))
+        self.metrics.get_stat(
+            "pipeman_task_active_count",
+            "Tasks running or about to run on a thread",
+            pc.Gauge,
+            labelnames=["manager"],
+            multiprocess_mode="livesum"
+        ).labels(manager=self.name).set(len(self._executing))
 
     def active_threads(self):
-        return sum(1 if self._executing[k] and self._executing[k].is_alive() else 0 for k in self._executing)
+        with self._lock:
+            return sum(1 for k in self._executing if not self._executing[k].done())
 
     def wait_for_all(self, timeout=5):
-        s = time.monotonic()
-        check = True
-        while check:
-            check = False
-            for k in self._executing:
-                if self._executing[k] and self._executing[k].is_alive():
-                    check = True
-            if 0 < timeout < (time.monotonic() - s):
-                check = False
-
-
-class TaskThread(threading.Thread):
-
-    def __init__(self, app, halt_event, callback):
-        super().__init__()
-        self._app = app
-        self.halt = halt_event
-        self.callback = callback
-
-    def run(self):
-        with self._app.app_context():
-            self.callback(self)
+        """Wait up to timeout seconds (forever if timeout <= 0) for the running tasks to finish."""
+        with self._lock:
+            futures = list(self._executing.values())
+        if futures:
+            concurrent.futures.wait(futures, timeout=timeout if timeout > 0 else None)
+
+    def shutdown(self, wait: bool = False):
+        """Drop any tasks that have not started and release the pool threads once they are done."""
+        with self._lock:
+            self._queued.clear()
+            self._lanes = {k: self._lanes[k] for k in self._executing if k in self._lanes}
+            self._update_gauges()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
 
 
 class CronThread(threading.Thread):
@@ -173,7 +277,7 @@ class CronDaemon:
         self._max_exit_count = self.config.as_int(("pipeman", "daemon", "max_exit_count"), default=3)
         self._cleanup_sleep_time = self.config.as_float(("pipeman", "daemon", "exit_cleanup_sleep"), default=0.25)
         self._max_cleanup_time = self.config.as_int(("pipeman", "daemon", "max_cleanup_time_seconds"), default=5)
-        self._tasks = UniqueTaskThreadManager(self._app, self.halt, self._max_scheduled_tasks)
+        self._tasks = UniqueTaskThreadManager(self._app, self.halt, self._max_scheduled_tasks, name="cron")
 
     def register_cron_thread(self, cls: type, constructor: t.Callable = None):
         self._cron_thread_classes[cls] = constructor or cls
@@ -197,12 +301,10 @@ class CronDaemon:
             signal.signal(getattr(signal, sig_name), self._exit_signal_handler)
 
     def run_forever(self):
-        import gc
         self._setup()
         try:
             while not self.halt.is_set():
                 self._inner_loop()
-                gc.collect()
                 self.halt.wait(1)
         finally:
             self.log.debug("Cleaning up...")
@@ -283,5 +385,6 @@ class CronDaemon:
                     self.log.warning(f"{count} threads still active, some data loss may occur!")
             else:
                 self.log.notice("All threads completed, exiting")
+        self._tasks.shutdown()
         self.system.fire("cron.stop", self)
         self.system.fire("cron.stop.after", self)
@@ -65,6 +65,10 @@ class WorkflowItemNotFoundError(PipemanError):
     pass
 
 
+class RemoteLeaseError(PipemanError):
+    pass
+
+
 class DataStoreNotFoundError(PipemanError):
     pass
 
@@ -28,11 +28,11 @@ class PromMetrics:
                 self.log.warning("PROMETHEUS_MULTIPROC_DIR not set, Prometheus metrics may be corrupt if using a multi-process WSGI server")
             self.metrics = PrometheusMetrics(app, registry=reg)
 
-    def get_stat(self, name, documentation, cls):
+    def get_stat(self, name, documentation, cls, **kwargs):
         if name not in self.stats:
             with self._lock:
                 if name not in self.stats:
-                    self.stats[name] = cls(name, documentation)
+                    self.stats[name] = cls(name, documentation, **kwargs)
         return self.stats[name]
 
 
@@ -7,6 +7,7 @@ from pipeman.i18n import gettext
 from pipeman.i18n.i18n import BaseTranslatableString
 import typing as t
 import datetime
+import time
 import sqlalchemy as sa
 from flask_wtf.csrf import CSRFProtect
 import flask
@@ -18,13 +19,14 @@ from pipeman.util.errors import PipemanConfigurationError
 from pipeman.util.flask import self_url, RequestInfo
 import zrlog
 from pipeman.db import Database
+from pipeman.db.instrumentation import start_query_tally, finish_query_tally
 import pipeman.db.orm as orm
 import uuid
 from pipeman.vocab import VocabularyRegistry
 from pipeman.workflow import WorkflowRegistry
 from pipeman.entity import EntityRegistry
 from pipeman.dataset import MetadataRegistry
-from pipeman.db.obj_registry import GlobalObjectRegistry
+from pipeman.db.obj_registry import GlobalObjectRegistry, RegistrySnapshot
 import ipaddress
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -144,11 +146,28 @@ def init_system_logging(system, rinfo: RequestInfo = None):
 
 @injector.inject
 @time_function("pipeman_setup_init_registries", "Time to initialize the registries")
-def init_registries(r1: MetadataRegistry = None, r2: VocabularyRegistry = None, r3: WorkflowRegistry = None, r4: EntityRegistry = None):
-    r1.reload_types()
-    r2.reload_types()
-    r3.reload_types()
-    r4.reload_types()
+def init_registries(r1: MetadataRegistry = None, r2: VocabularyRegistry = None, r3: WorkflowRegistry = None, r4: EntityRegistry = None, gor: GlobalObjectRegistry = None, snapshot: RegistrySnapshot = None):
+    start = time.perf_counter()
+    # Read the versions first, so any change made while loading is picked up by the next check
+    versions = gor.mark_versions()
+    type_maps = snapshot.read(versions)
+    if type_maps is not None:
+        gor.load_type_maps(type_maps)
+        source = "snapshot"
+    else:
+        r1.reload_types()
+        r2.reload_types()
+        r3.reload_types()
+        r4.reload_types()
+        source = "database"
+        if snapshot.enabled:
+            try:
+                snapshot.write(versions, gor.type_maps())
+            except Exception:
+                zrlog.get_logger("pipeman.registries").exception("Error writing registry snapshot")
+    zrlog.get_logger("pipeman.registries").info(
+        f"Loaded registries from the {source} in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
 
 
 class TrustedProxyFix:
@@ -210,8 +229,8 @@ def stable_dict_key_list(d: dict):
 @injector.inject
 def core_init_app(system, app: flask.Flask, config, prom_metrics: PromMetrics = None, gor: GlobalObjectRegistry = None):
     #app.session_interface = SessionCookieInterface()
-    # Make sure these are loaded
-    gor.check_all()
+    # Registries were loaded by init(), this keeps them up to date
+    gor.start_watcher()
     if "flask" in config:
         app.config.update(config["flask"] or {})
     if not app.config.get("SECRET_KEY"):
@@ -261,6 +280,11 @@ def core_init_app(system, app: flask.Flask, config, prom_metrics: PromMetrics =
             "request_method": rinfo.request_method(),
         })
 
+    @app.before_request
+    def start_query_accounting():
+        if flask.request.endpoint != "static":
+            flask.g.query_tally_token = start_query_tally(flask.request.endpoint or "unknown")
+
     system.access_log = zrlog.get_logger("pipeman.access_log")
 
     # After the request, perform a few clean-up tasks
@@ -282,14 +306,12 @@ def core_init_app(system, app: flask.Flask, config, prom_metrics: PromMetrics =
         return response
 
     @app.teardown_request
-    @injector.inject
-    def refresh_object_registry(exc, gor: GlobalObjectRegistry = None):
-        try:
-            gor.check_all()
-        except Exception as ex:
-            zrlog.get_logger("pipeman.teardown").exception("Error while refreshing object registry")
-        import gc
-        gc.collect()
+    def finish_query_accounting(exc):
+        if "query_tally_token" in flask.g:
+            try:
+                finish_query_tally(flask.g.pop("query_tally_token"))
+            except Exception as ex:
+                zrlog.get_logger("pipeman.teardown").exception("Error while reporting query statistics")
 
 
     # Add the menu items and self_url() function to every template
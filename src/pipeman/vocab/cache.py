@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+import uuid
+
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+from pipeman.dbconfig import ValueController
+from pipeman.i18n import MultiLanguageString
+
+
+VERSION_KEY = "vocabulary_terms_version"
+
+
+class CachedTerm:
+
+    def __init__(self, term_id: int, short_name: str, display_names: dict, descriptions: dict):
+        self.id = term_id
+        self.short_name = short_name
+        self.display_names = display_names
+        self.descriptions = descriptions
+        dns = display_names.copy()
+        if "und" not in dns or not dns["und"]:
+            dns["und"] = short_name
+        self.choice_display = MultiLanguageString(dns)
+
+
+class CachedVocabulary:
+
+    def __init__(self, version: int, terms: list[CachedTerm]):
+        self.version = version
+        self.terms = terms
+        self.by_name = {term.short_name: term for term in terms}
+        self.choices = [(term.short_name, term.choice_display) for term in terms]
+
+
+@injector.injectable_global
+class VocabularyTermCache:
+    """Process-wide cache of the terms in each vocabulary.
+
+    Entries are invalidated locally by bumping the version for the vocabulary whenever its terms change. Changes
+    made by other processes are detected by periodically checking a version key in the database.
+    """
+
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.vocab.cache")
+        self._lock = threading.RLock()
+        self._entries: dict[str, CachedVocabulary] = {}
+        self._versions: dict[str, int] = {}
+        self._remote_version = None
+        self._last_remote_check = None
+        self._check_frequency = self.config.as_float(("pipeman", "vocab", "cache_check_seconds"), default=60)
+
+    def get(self, vocab_name: str) -> CachedVocabulary:
+        self._check_remote_version()
+        entry = self._entries.get(vocab_name)
+        version = self._versions.get(vocab_name, 0)
+        if entry is not None and entry.version == version:
+            return entry
+        with self._lock:
+            entry = self._entries.get(vocab_name)
+            version = self._versions.get(vocab_name, 0)
+            if entry is None or entry.version != version:
+                entry = CachedVocabulary(version, self._load_terms(vocab_name))
+                self._entries[vocab_name] = entry
+            return entry
+
+    def version(self) -> str:
+        """Token that changes whenever the terms of any vocabulary change, in this or another process."""
+        self._check_remote_version()
+        return self._remote_version or ""
+
+    def find_term(self, vocab_name: str, short_name: str) -> CachedTerm | None:
+        return self.get(vocab_name).by_name.get(short_name)
+
+    def invalidate(self, vocab_name: str):
+        """Drop the cached terms for a vocabulary; call after the changes have been committed."""
+        with self._lock:
+            self._versions[vocab_name] = self._versions.get(vocab_name, 0) + 1
+            self._entries.pop(vocab_name, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            for vocab_name in list(self._entries.keys()):
+                self._versions[vocab_name] = self._versions.get(vocab_name, 0) + 1
+            self._entries.clear()
+
+    def mark_changed(self, session):
+        """Record in the database that terms have changed, so that other processes drop their cached copies."""
+        entry = session.query(orm.KeyValue).filter_by(key=VERSION_KEY).first()
+        self._remote_version = str(uuid.uuid4())
+        if entry:
+            entry.value = json.dumps(self._remote_version)
+        else:
+            session.add(orm.KeyValue(key=VERSION_KEY, value=json.dumps(self._remote_version)))
+
+    @injector.inject
+    def _load_terms(self, vocab_name: str, db: Database = None) -> list[CachedTerm]:
+        self._log.debug(f"Loading terms for {vocab_name}")
+        terms = []
+        with db as session:
+            query = (
+                session.query(
+                    orm.VocabularyTerm.id,
+                    orm.VocabularyTerm.short_name,
+                    orm.VocabularyTerm.display_names,
+                    orm.VocabularyTerm.descriptions
+                )
+                .filter(orm.VocabularyTerm.vocabulary_name == vocab_name)
+                .order_by(orm.VocabularyTerm.id)
+            )
+            for term_id, short_name, display_names, descriptions in query:
+                terms.append(CachedTerm(
+                    term_id,
+                    short_name,
+                    json.loads(display_names) if display_names else {},
+                    json.loads(descriptions) if descriptions else {}
+                ))
+        return terms
+
+    def _check_remote_version(self):
+        if self._last_remote_check and (time.monotonic() - self._last_remote_check) < self._check_frequency:
+            return
+        self._last_remote_check = time.monotonic()
+        self._check_remote_version_now()
+
+    @injector.inject
+    def _check_remote_version_now(self, vc: ValueController = None):
+        remote_version = vc.get_value(VERSION_KEY)
+        if remote_version != self._remote_version:
+            if self._remote_version is not None or self._entries:
+                self._log.info("Vocabulary terms changed, clearing the cache")
+                self.invalidate_all()
+            self._remote_version = remote_version
@@ -0,0 +1,240 @@
+import csv
+import json
+import pathlib
+import time
+import typing as t
+
+import sqlalchemy as sa
+import yaml
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+from .cache import VocabularyTermCache
+
+
+# (short_name, display names, descriptions)
+TermRow = tuple[str, dict, dict]
+
+
+def parse_term_row(header: list[str], line: list[str]) -> TermRow:
+    """Convert a CSV line with short_name, display__LANG and description__LANG columns into a term.
+
+    Empty cells are left out, so they don't replace an existing display name or description.
+    """
+    displays = {}
+    descriptions = {}
+    tsname = ""
+    for idx, key in enumerate(header):
+        if key == "short_name":
+            tsname = line[idx]
+        elif key.startswith("display__"):
+            if line[idx]:
+                displays[key[9:]] = line[idx]
+        elif key.startswith("description__"):
+            if line[idx]:
+                descriptions[key[13:]] = line[idx]
+        else:
+            raise ValueError(f"Unrecognized column header [{key}]")
+    if not tsname:
+        if not displays:
+            raise ValueError(f"Missing a term name")
+        key_name = "und" if "und" in displays else "en"
+        if key_name not in displays:
+            raise ValueError(f"Missing a fallback term name")
+        tsname = displays[key_name].replace(" ", "_").lower()
+    return tsname, displays, descriptions
+
+
+def terms_from_dict(terms: dict) -> t.Iterable[TermRow]:
+    """Convert a dictionary of terms (as in the terms section of vocabs.yaml) into term rows."""
+    for tsname in terms or {}:
+        term = terms[tsname] or {}
+        yield (
+            str(tsname),
+            term["display"] if "display" in term else {},
+            term["description"] if "description" in term else {}
+        )
+
+
+class VocabularyImportReport:
+    """Counts and timing for a vocabulary import."""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self._start = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def unchanged(self) -> int:
+        return self.rows - self.inserted - self.updated
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self._start
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Imported {self.rows} terms in {self.elapsed:.1f}s ({self.rows_per_second:.0f}/s): "
+            f"{self.inserted} new, {self.updated} updated, {self.unchanged} unchanged, {self.deleted} removed"
+        )
+
+
+@injector.injectable
+class VocabularyImporter:
+    """Loads vocabulary terms in chunks, with one query to find the existing terms and bulk writes for each chunk.
+
+    By default, the display names and descriptions given are merged into those of existing terms. In replace mode,
+    they replace them and any term not in the input is removed; either way, the whole import is one transaction.
+    """
+
+    db: Database = None
+    cache: VocabularyTermCache = None
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self, chunk_size: t.Optional[int] = None):
+        self._log = zrlog.get_logger("pipeman.vocab.importer")
+        self.chunk_size = max(1, chunk_size or self.config.as_int(("pipeman", "vocab", "import_chunk_size"), default=1000))
+
+    def import_file(self, vocab_name: str, file_path, replace: bool = False) -> VocabularyImportReport:
+        """Import a .csv file or a .yaml file of terms, depending on the extension."""
+        if pathlib.Path(file_path).suffix.lower() in (".yaml", ".yml"):
+            return self.import_yaml(vocab_name, file_path, replace)
+        return self.import_csv(vocab_name, file_path, replace)
+
+    def import_csv(self, vocab_name: str, file_path, replace: bool = False) -> VocabularyImportReport:
+        self._log.notice(f"Loading terms from {file_path} to {vocab_name}")
+        with open(file_path, "r", encoding="utf-8-sig", newline="") as h:
+            reader = csv.reader(h)
+            header = next(reader, None)
+            if header is None:
+                return self.import_terms(vocab_name, [], replace)
+            return self.import_terms(
+                vocab_name,
+                (parse_term_row(header, line) for line in reader if line),
+                replace
+            )
+
+    def import_yaml(self, vocab_name: str, file_path, replace: bool = False) -> VocabularyImportReport:
+        self._log.notice(f"Loading terms from {file_path} to {vocab_name}")
+        with open(file_path, "r", encoding="utf-8") as h:
+            terms = yaml.safe_load(h) or {}
+        # Also accept a vocabs.yaml style entry with the terms in a terms section
+        if isinstance(terms.get("terms"), dict):
+            terms = terms["terms"]
+        return self.import_terms(vocab_name, terms_from_dict(terms), replace)
+
+    def import_terms(self, vocab_name: str, rows: t.Iterable[TermRow], replace: bool = False) -> VocabularyImportReport:
+        return self.import_many({vocab_name: rows}, replace)
+
+    def import_many(self, vocab_rows: dict[str, t.Iterable[TermRow]], replace: bool = False) -> VocabularyImportReport:
+        """Import the terms of several vocabularies in one transaction."""
+        report = VocabularyImportReport()
+        changed = set()
+        with self.db as session:
+            for vocab_name, rows in vocab_rows.items():
+                before = (report.inserted, report.updated, report.deleted)
+                seen = set()
+                for chunk in self._chunks(rows):
+                    self._apply_chunk(session, vocab_name, chunk, replace, report)
+                    seen.update(chunk.keys())
+                if replace:
+                    self._remove_missing(session, vocab_name, seen, report)
+                if (report.inserted, report.updated, report.deleted) != before:
+                    changed.add(vocab_name)
+            if changed:
+                self.cache.mark_changed(session)
+            session.commit()
+        for vocab_name in changed:
+            self.cache.invalidate(vocab_name)
+        report.finish()
+        self._log.info(report.summary())
+        return report
+
+    def _chunks(self, rows: t.Iterable[TermRow]) -> t.Iterable[dict[str, tuple[dict, dict, int]]]:
+        chunk = {}
+        for tsname, display, description in rows:
+            tsname = str(tsname)
+            if tsname in chunk:
+                # Repeated within the chunk, merge them
+                old_display, old_description, count = chunk[tsname]
+                chunk[tsname] = ({**old_display, **(display or {})}, {**old_description, **(description or {})}, count + 1)
+                continue
+            chunk[tsname] = (dict(display or {}), dict(description or {}), 1)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = {}
+        if chunk:
+            yield chunk
+
+    def _apply_chunk(self, session, vocab_name: str, chunk: dict, replace: bool, report: VocabularyImportReport):
+        existing = {
+            short_name: (term_id, display_names, descriptions)
+            for term_id, short_name, display_names, descriptions in session.execute(
+                sa.select(
+                    orm.VocabularyTerm.id,
+                    orm.VocabularyTerm.short_name,
+                    orm.VocabularyTerm.display_names,
+                    orm.VocabularyTerm.descriptions
+                )
+                .where(orm.VocabularyTerm.vocabulary_name == vocab_name)
+                .where(orm.VocabularyTerm.short_name.in_(list(chunk.keys())))
+            )
+        }
+        inserts = []
+        updates = []
+        for tsname, (display, description, count) in chunk.items():
+            report.rows += count
+            if tsname not in existing:
+                inserts.append({
+                    "vocabulary_name": vocab_name,
+                    "short_name": tsname,
+                    "display_names": json.dumps(display),
+                    "descriptions": json.dumps(description),
+                })
+                continue
+            term_id, old_dn, old_desc = existing[tsname]
+            new_dn = old_dn
+            new_desc = old_desc
+            if replace:
+                new_dn = json.dumps(display)
+                new_desc = json.dumps(description)
+            else:
+                if display:
+                    dn = json.loads(old_dn) if old_dn else {}
+                    dn.update(display)
+                    new_dn = json.dumps(dn)
+                if description:
+                    desc = json.loads(old_desc) if old_desc else {}
+                    desc.update(description)
+                    new_desc = json.dumps(desc)
+            if new_dn != old_dn or new_desc != old_desc:
+                updates.append({"id": term_id, "display_names": new_dn, "descriptions": new_desc})
+        if inserts:
+            session.execute(sa.insert(orm.VocabularyTerm), inserts)
+        if updates:
+            session.execute(sa.update(orm.VocabularyTerm), updates)
+        report.inserted += len(inserts)
+        report.updated += len(updates)
+
+    def _remove_missing(self, session, vocab_name: str, seen: set, report: VocabularyImportReport):
+        missing = [
+            term_id
+            for term_id, short_name in session.execute(
+                sa.select(orm.VocabularyTerm.id, orm.VocabularyTerm.short_name)
+                .where(orm.VocabularyTerm.vocabulary_name == vocab_name)
+            )
+            if short_name not in seen
+        ]
+        for i in range(0, len(missing), self.chunk_size):
+            session.execute(sa.delete(orm.VocabularyTerm).where(orm.VocabularyTerm.id.in_(missing[i:i + self.chunk_size])))
+        report.deleted += len(missing)
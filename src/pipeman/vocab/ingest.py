@@ -0,0 +1,244 @@
+"""Shared pipeline for loading vocabularies published by external sources (CF, UDUNITS, ISO-19115, CIOOS, etc.).
+
+Fetchers open a URL or a local copy with :func:`open_source`, parse it incrementally with
+:func:`iter_xml_elements` or :func:`iter_json_array`, add the terms to a :class:`StagedVocabulary` and pass it to
+:meth:`VocabularyIngester.apply`. A vocabulary whose source and terms have not changed since it was last applied is
+skipped; otherwise only the new and changed terms are written, in batches.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import typing as t
+import xml.etree.ElementTree as ET
+
+import requests
+import sqlalchemy as sa
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+from .importer import VocabularyImporter, VocabularyImportReport, TermRow
+
+
+SOURCE_KEY_PREFIX = "vocabulary_source."
+
+
+@contextlib.contextmanager
+def open_source(source: str, timeout: float = 60) -> t.Iterator[t.BinaryIO]:
+    """Open a URL as a stream, or a local file if the source is not an http(s) URL."""
+    if source.startswith("http://") or source.startswith("https://"):
+        with requests.get(source, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            yield resp.raw
+    else:
+        with open(source, "rb") as h:
+            yield h
+
+
+def iter_xml_elements(handle: t.BinaryIO, tag: str) -> t.Iterator[ET.Element]:
+    """Yield each complete element with the given tag, discarding it (and what came before it) afterwards."""
+    root = None
+    for event, elem in ET.iterparse(handle, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event == "end" and elem.tag == tag:
+            yield elem
+            elem.clear()
+            root.clear()
+
+
+def iter_json_array(handle: t.BinaryIO, key: t.Optional[str] = None, read_size: int = 65536) -> t.Iterator[t.Any]:
+    """Yield the items of a JSON array one at a time without loading the whole document.
+
+    If a key is given, the array is the first one after that key (e.g. {"key": [...]}), otherwise it is the first
+    array in the document. Anything after the array is not read.
+    """
+    reader = io.TextIOWrapper(handle, encoding="utf-8")
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def _read_more() -> bool:
+        nonlocal buffer, eof
+        if eof:
+            return False
+        data = reader.read(read_size)
+        if not data:
+            eof = True
+            return False
+        buffer += data
+        return True
+
+    # Find the start of the array
+    marker = f'"{key}"' if key else None
+    pos = -1
+    while pos < 0:
+        if marker is not None:
+            key_pos = buffer.find(marker)
+            if key_pos >= 0:
+                buffer = buffer[key_pos + len(marker):]
+                marker = None
+        if marker is None:
+            pos = buffer.find("[")
+        if pos < 0 and not _read_more():
+            raise ValueError(f"No array found{' for ' + key if key else ''}")
+    buffer = buffer[pos + 1:]
+    pos = 0
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+            pos += 1
+        if pos >= len(buffer):
+            buffer = ""
+            pos = 0
+            if not _read_more():
+                raise ValueError("Unexpected end of array")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not _read_more():
+                raise
+            continue
+        if end >= len(buffer) and _read_more():
+            # The item might continue in the next block (e.g. a number), so decode it again
+            continue
+        yield item
+        buffer = buffer[end:]
+        pos = 0
+
+
+class StagedVocabulary:
+    """The terms read from a source for one vocabulary, each kept as a compact JSON string until it is applied."""
+
+    __slots__ = ("name", "_terms")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._terms: dict[str, str] = {}
+
+    def add(self, short_name: str, display: t.Optional[dict] = None, description: t.Optional[dict] = None):
+        """Add a term; if it was already added, the display names and descriptions are merged."""
+        short_name = str(short_name)
+        display = {k: v for k, v in (display or {}).items() if v}
+        description = {k: v for k, v in (description or {}).items() if v}
+        if short_name in self._terms:
+            old_display, old_description = self.get(short_name)
+            display = {**old_display, **display}
+            description = {**old_description, **description}
+        self._terms[short_name] = json.dumps(
+            [display, description],
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+
+    def get(self, short_name: str) -> tuple[dict, dict]:
+        display, description = json.loads(self._terms[short_name])
+        return display, description
+
+    def __contains__(self, short_name: str) -> bool:
+        return short_name in self._terms
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def rows(self) -> t.Iterator[TermRow]:
+        for short_name in sorted(self._terms):
+            display, description = json.loads(self._terms[short_name])
+            yield short_name, display, description
+
+    def digest(self) -> str:
+        h = hashlib.sha256()
+        for short_name in sorted(self._terms):
+            h.update(short_name.encode("utf-8"))
+            h.update(b"\0")
+            h.update(self._terms[short_name].encode("utf-8"))
+            h.update(b"\n")
+        return h.hexdigest()
+
+
+@injector.injectable
+class VocabularyIngester:
+    """Applies staged vocabularies, skipping those that have not changed since they were last applied.
+
+    After a vocabulary is applied, the hash of its source terms is saved along with the number of terms, the highest
+    term ID and the last modified date of the vocabulary. It is skipped when all of these still match; any other
+    change to its terms applies it again.
+    """
+
+    db: Database = None
+    importer: VocabularyImporter = None
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.vocab.ingest")
+        self._skip_unchanged = self.config.as_bool(("pipeman", "vocab", "skip_unchanged_sources"), default=True)
+
+    def stage(self, vocab_name: str) -> StagedVocabulary:
+        return StagedVocabulary(vocab_name)
+
+    def apply(self, *staged: StagedVocabulary, replace: bool = False) -> VocabularyImportReport:
+        """Write the terms of the staged vocabularies in one transaction.
+
+        By default, the terms are merged into the existing ones; in replace mode, existing terms are overwritten and
+        terms that are not in the source are removed.
+        """
+        digests = {vocab.name: vocab.digest() for vocab in staged}
+        with self.db as session:
+            states = self._load_states(session, list(digests.keys()))
+            to_apply = []
+            for vocab in staged:
+                if self._skip_unchanged and states.get(vocab.name) == self._state(session, vocab.name, digests[vocab.name]):
+                    self._log.notice(f"Skipping {vocab.name}, it has not changed since it was last loaded")
+                else:
+                    to_apply.append(vocab)
+        if not to_apply:
+            report = VocabularyImportReport()
+            report.finish()
+            return report
+        report = self.importer.import_many({vocab.name: vocab.rows() for vocab in to_apply}, replace)
+        with self.db as session:
+            for vocab in to_apply:
+                self._save_state(session, vocab.name, self._state(session, vocab.name, digests[vocab.name]))
+            session.commit()
+        return report
+
+    @staticmethod
+    def _load_states(session, vocab_names: list[str]) -> dict[str, dict]:
+        return {
+            key[len(SOURCE_KEY_PREFIX):]: json.loads(value) if value else None
+            for key, value in session.execute(
+                sa.select(orm.KeyValue.key, orm.KeyValue.value)
+                .where(orm.KeyValue.key.in_([SOURCE_KEY_PREFIX + x for x in vocab_names]))
+            )
+        }
+
+    @staticmethod
+    def _state(session, vocab_name: str, digest: str) -> dict:
+        count, max_id, last_modified = session.execute(
+            sa.select(
+                sa.func.count(orm.VocabularyTerm.id),
+                sa.func.max(orm.VocabularyTerm.id),
+                sa.func.max(orm.VocabularyTerm.modified_date)
+            ).where(orm.VocabularyTerm.vocabulary_name == vocab_name)
+        ).one()
+        return {
+            "hash": digest,
+            "terms": [count, max_id, last_modified.isoformat() if last_modified else None]
+        }
+
+    @staticmethod
+    def _save_state(session, vocab_name: str, state: dict):
+        key = SOURCE_KEY_PREFIX + vocab_name
+        entry = session.query(orm.KeyValue).filter_by(key=key).first()
+        if entry:
+            entry.value = json.dumps(state)
+        else:
+            session.add(orm.KeyValue(key=key, value=json.dumps(state)))
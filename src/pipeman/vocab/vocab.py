@@ -1,12 +1,14 @@
 import flask
+import sqlalchemy as sa
 from autoinject import injector
 from pipeman.db import Database
 import pipeman.db.orm as orm
 from pipeman.i18n import MultiLanguageString, gettext
 from pipeman.db import BaseObjectRegistry
 import json
-import csv
 import zrlog
+from .cache import VocabularyTermCache
+from .importer import VocabularyImporter, parse_term_row, terms_from_dict
 
 
 @injector.injectable_global
@@ -32,21 +34,23 @@ class VocabularyRegistry(BaseObjectRegistry):
         if terms:
             self.register_terms_from_dict(obj_name, terms)
 
+    @injector.inject
+    def register_from_dict(self, cfg_dict, vtc: "pipeman.vocab.vocab.VocabularyTermController" = None):
+        cfg_dict = {key: dict(cfg_dict[key] or {}) for key in cfg_dict or {}}
+        terms = {key: cfg_dict[key].pop("terms") for key in cfg_dict if cfg_dict[key].get("terms")}
+        for key in cfg_dict:
+            cfg_dict[key].pop("terms", None)
+        super().register_from_dict(cfg_dict)
+        if terms:
+            vtc.save_terms_from_dicts(terms)
+
     @injector.inject
     def register_terms_from_dict(self, vocab_name, terms: dict, vtc: "pipeman.vocab.vocab.VocabularyTermController" = None):
         vtc.save_terms_from_dict(vocab_name, terms)
 
     @injector.inject
-    def register_terms_from_csv(self, vocab_name, term_file, vtc: "pipeman.vocab.vocab.VocabularyTermController" = None):
-        self._log.notice(f"Loading terms from {term_file} to {vocab_name}")
-        with open(term_file, "r", encoding="utf-8-sig") as h:
-            r = csv.reader(h)
-            header = None
-            for line in r:
-                if header is None:
-                    header = line
-                    continue
-                vtc.upsert_term_by_map(vocab_name, line, header)
+    def register_terms_from_csv(self, vocab_name, term_file, importer: VocabularyImporter = None):
+        importer.import_csv(vocab_name, term_file)
 
 
 @injector.injectable
@@ -54,6 +58,7 @@ class VocabularyTermController:
 
     reg: VocabularyRegistry = None
     db: Database = None
+    cache: VocabularyTermCache = None
 
     @injector.construct
     def __init__(self):
@@ -81,69 +86,45 @@ class VocabularyTermController:
         )
 
     def list_terms(self, vocabulary_name):
-        with self.db as session:
-            for term in session.query(orm.VocabularyTerm).filter_by(vocabulary_name=vocabulary_name):
-                display_names = json.loads(term.display_names) if term.display_names else {}
-                descriptions = json.loads(term.descriptions) if term.descriptions else {}
-                display_names["und"] = term.short_name
-                descriptions["und"] = ""
-                yield term.short_name, MultiLanguageString(display_names), MultiLanguageString(descriptions)
+        for term in self.cache.get(vocabulary_name).terms:
+            display_names = term.display_names.copy()
+            descriptions = term.descriptions.copy()
+            display_names["und"] = term.short_name
+            descriptions["und"] = ""
+            yield term.short_name, MultiLanguageString(display_names), MultiLanguageString(descriptions)
 
     def clear_terms_from_dict(self, vocab_name):
         self._log.notice(f"Clearing all terms from {vocab_name}")
         with self.db as session:
             session.query(orm.VocabularyTerm).filter_by(vocabulary_name=vocab_name).delete()
+            self.cache.mark_changed(session)
             session.commit()
+        self.cache.invalidate(vocab_name)
 
     def save_terms_from_dict(self, vocab_name, terms: dict):
-        with self.db as session:
-            for tsname in terms:
-                if terms[tsname] is None:
-                    terms[tsname] = {}
-                self.upsert_term(
-                    vocab_name,
-                    str(tsname),
-                    terms[tsname]["display"] if "display" in terms[tsname] else {},
-                    terms[tsname]["description"] if "description" in terms[tsname] else {},
-                    session
-                )
+        self.save_terms_from_dicts({vocab_name: terms})
+
+    @injector.inject
+    def save_terms_from_dicts(self, vocab_terms: dict[str, dict], importer: VocabularyImporter = None):
+        """Upsert the terms of several vocabularies in one transaction, writing only new or changed terms."""
+        importer.import_many({vocab_name: terms_from_dict(vocab_terms[vocab_name]) for vocab_name in vocab_terms})
 
     def upsert_term_by_map(self, vocab_name, line, header):
-        displays = {}
-        descriptions = {}
-        tsname = ""
-        for idx, key in enumerate(header):
-            if key == "short_name":
-                tsname = line[idx]
-            elif key.startswith("display__"):
-                displays[key[9:]] = line[idx]
-            elif key.startswith("description__"):
-                displays[key[13:]] = line[idx]
-            else:
-                raise ValueError(f"Unrecognized column header [{key}]")
-        if not tsname:
-            if not displays:
-                raise ValueError(f"Missing a term name")
-            key_name = "und" if "und" in displays else "en"
-            if key_name not in displays:
-                raise ValueError(f"Missing a fallback term name")
-            tsname = displays[key_name].replace(" ", "_").lower()
+        tsname, displays, descriptions = parse_term_row(header, line)
         with self.db as session:
             self.upsert_term(vocab_name, tsname, displays, descriptions, session)
 
     def get_term_id(self, vocab_name, tsname):
-        with self.db as session:
-            term = session.query(orm.VocabularyTerm).filter_by(vocabulary_name=vocab_name, short_name=tsname).first()
-            if term:
-                return term.id
-            return None
+        term = self.cache.find_term(vocab_name, tsname)
+        if term:
+            return term.id
+        return None
 
     def get_term_name(self, vocab_name, tsname):
-        with self.db as session:
-            term = session.query(orm.VocabularyTerm).filter_by(vocabulary_name=vocab_name, short_name=tsname).first()
-            if term:
-                return term.short_name
-            return None
+        term = self.cache.find_term(vocab_name, tsname)
+        if term:
+            return term.short_name
+        return None
 
     def upsert_term(self, vocab_name, tsname, display, description, session):
         term = session.query(orm.VocabularyTerm).filter_by(vocabulary_name=vocab_name, short_name=tsname).first()
@@ -164,4 +145,6 @@ class VocabularyTermController:
             if description:
                 desc.update(description)
                 term.descriptions = json.dumps(desc)
+        self.cache.mark_changed(session)
         session.commit()
+        self.cache.invalidate(vocab_name)
@@ -1,27 +1,36 @@
 from .workflow import WorkflowRegistry
 from .controller import WorkflowController
 from .steps import ItemResult
+from .process_pool import StepProcessPool
 from autoinject import injector
 import asyncio
+import threading
 from pipeman.util.cron import CronDaemon
 
 
 def init(system):
     system.on_cron_start(_setup_cron_jobs)
+    system.on("cron.stop", _shutdown_process_pool)
     system.on_cleanup(_wc_cleanup)
     system.on_cleanup(_wc_batch_process)
 
 
 def _setup_cron_jobs(cron: CronDaemon):
     from pipeman.workflow.controller import  WorkflowCronThread
-    cron.register_periodic_job("workflow_batch_processing", _wc_batch_process, minutes=5)
+    from pipeman.workflow.async_engine import AsyncWorkflowCronThread
     cron.register_periodic_job("workflow_cleanup", _wc_cleanup, hours=24, off_peak_only=True)
     cron.register_cron_thread(WorkflowCronThread)
+    cron.register_cron_thread(AsyncWorkflowCronThread)
+
+
+def _wc_batch_process(st = None):
+    from pipeman.workflow.async_engine import AsyncWorkflowEngine
+    asyncio.run(AsyncWorkflowEngine(st.halt if st is not None else threading.Event()).run(until_idle=True))
 
 
 @injector.inject
-def _wc_batch_process(st = None, wc: WorkflowController = None):
-    asyncio.run(wc.async_batch_process_items(st))
+def _shutdown_process_pool(cron, pool: StepProcessPool = None):
+    pool.shutdown()
 
 
 @injector.inject
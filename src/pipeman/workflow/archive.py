@@ -0,0 +1,143 @@
+import datetime
+import gzip
+import json
+import os
+import pathlib
+import tempfile
+
+import sqlalchemy as sa
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+
+
+_ITEM_COLUMNS = (
+    "id", "created_date", "modified_date", "created_by", "context", "workflow_type", "workflow_name", "object_type",
+    "object_id", "step_list", "completed_index", "status", "step_output",
+)
+
+_DECISION_COLUMNS = (
+    "id", "created_date", "created_by", "step_name", "decider_id", "decision", "decision_date", "comments",
+    "attachment_id",
+)
+
+
+def _json_value(v):
+    if isinstance(v, datetime.datetime):
+        return v.isoformat()
+    return v
+
+
+@injector.injectable
+class WorkflowItemArchiver:
+    """Moves finished workflow items (and their decisions) out of the live tables.
+
+    Items in one of ``archive_statuses`` that were created more than ``retention_days`` ago are copied to the
+    workflow_item_archive table (or to gzipped JSON lines files when ``archive_mode`` is "file") and then deleted,
+    ``archive_batch_size`` items per transaction. Items still referenced by a dataset or metadata edition are kept.
+    """
+
+    db: Database = None
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.workflow.archive")
+        self.retention_days = self.config.as_float(("pipeman", "workflow", "retention_days"), default=90)
+        self.statuses = self.config.as_list(
+            ("pipeman", "workflow", "archive_statuses"),
+            default=["COMPLETED", "FAILURE", "CANCELLED"]
+        )
+        self.batch_size = max(1, self.config.as_int(("pipeman", "workflow", "archive_batch_size"), default=500))
+        self.mode = self.config.as_str(("pipeman", "workflow", "archive_mode"), default="table")
+        if self.mode not in ("table", "file"):
+            raise ValueError(f"Invalid workflow archive mode [{self.mode}], expected table or file")
+        self.directory = self.config.as_path(("pipeman", "workflow", "archive_directory"), default=None)
+        if self.mode == "file" and self.directory is None:
+            raise ValueError("pipeman.workflow.archive_directory is required when archive_mode is file")
+
+    def archive_old_items(self, halt=None) -> int:
+        """Archive items in batches until none are left or halt is set; returns the number archived."""
+        if self.retention_days <= 0:
+            self._log.debug("Workflow item retention is disabled")
+            return 0
+        cutoff = datetime.datetime.now().astimezone() - datetime.timedelta(days=self.retention_days)
+        self._log.info(f"Archiving workflow items created before {cutoff.isoformat()}")
+        total = 0
+        while halt is None or not halt.is_set():
+            archived = self.archive_batch(cutoff)
+            total += archived
+            if archived < self.batch_size:
+                break
+        self._log.notice(f"Archived {total} workflow items")
+        return total
+
+    def archive_batch(self, cutoff: datetime.datetime) -> int:
+        """Archive up to one batch of items created before cutoff in a single transaction."""
+        with self.db as session:
+            item_ids = session.execute(
+                sa.select(orm.WorkflowItem.id)
+                .where(orm.WorkflowItem.status.in_(self.statuses))
+                .where(orm.WorkflowItem.created_date < cutoff)
+                # NOT IN is never true if the subquery has a NULL in it
+                .where(orm.WorkflowItem.id.not_in(
+                    sa.select(orm.Dataset.activated_item_id).where(orm.Dataset.activated_item_id.is_not(None))
+                ))
+                .where(orm.WorkflowItem.id.not_in(
+                    sa.select(orm.MetadataEdition.approval_item_id)
+                    .where(orm.MetadataEdition.approval_item_id.is_not(None))
+                ))
+                .order_by(orm.WorkflowItem.created_date)
+                .limit(self.batch_size)
+            ).scalars().all()
+            if not item_ids:
+                return 0
+            items = [
+                dict(row._mapping) for row in session.execute(
+                    sa.select(*[getattr(orm.WorkflowItem, c) for c in _ITEM_COLUMNS])
+                    .where(orm.WorkflowItem.id.in_(item_ids))
+                )
+            ]
+            decisions: dict[int, list] = {}
+            for row in session.execute(
+                sa.select(orm.WorkflowDecision.workflow_item_id, *[getattr(orm.WorkflowDecision, c) for c in _DECISION_COLUMNS])
+                .where(orm.WorkflowDecision.workflow_item_id.in_(item_ids))
+                .order_by(orm.WorkflowDecision.id)
+            ):
+                values = dict(row._mapping)
+                decisions.setdefault(values.pop("workflow_item_id"), []).append(
+                    {k: _json_value(v) for k, v in values.items()}
+                )
+            archived_date = datetime.datetime.now().astimezone()
+            for item in items:
+                item["decisions"] = decisions.get(item["id"], [])
+                item["archived_date"] = archived_date
+            if self.mode == "file":
+                self._write_file(items)
+            else:
+                for item in items:
+                    item["decisions"] = json.dumps(item["decisions"])
+                session.execute(sa.insert(orm.WorkflowItemArchive), items)
+            session.execute(sa.delete(orm.WorkflowDecision).where(orm.WorkflowDecision.workflow_item_id.in_(item_ids)))
+            session.execute(sa.delete(orm.WorkflowItem).where(orm.WorkflowItem.id.in_(item_ids)))
+            session.commit()
+            self._log.debug(f"Archived {len(item_ids)} workflow items")
+            return len(item_ids)
+
+    def _write_file(self, items: list[dict]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        ids = [item["id"] for item in items]
+        file_name = f"workflow_items_{datetime.datetime.now():%Y%m%d%H%M%S}_{min(ids)}_{max(ids)}.jsonl.gz"
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as h:
+                for item in items:
+                    h.write(json.dumps({k: _json_value(v) for k, v in item.items()}))
+                    h.write("\n")
+            os.replace(temp_path, self.directory / file_name)
+        except Exception:
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+            raise
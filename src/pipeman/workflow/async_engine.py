@@ -0,0 +1,155 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+import uuid
+
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+from pipeman.util.cron import CronThread
+from .controller import WorkflowController
+from .notify import WorkflowNotifier
+
+
+@injector.inject
+def _call_controller(method_name: str, *args, wc: WorkflowController = None, **kwargs):
+    # Each database thread gets its own controller (and database connections) from its injector context
+    return getattr(wc, method_name)(*args, **kwargs)
+
+
+class AsyncWorkflowEngine:
+    """Runs ASYNC_EXECUTE workflow items on an event loop.
+
+    Items are claimed atomically (so each one runs once, even with several daemons), at most ``async_max_items``
+    run at the same time and each one uses its own database sessions. Only the steps themselves run on the event
+    loop; claiming, preparing and recording items is done on a few database threads (``async_db_threads``) so that
+    it doesn't hold up the other items. When halted, running items are given ``async_drain_seconds`` to finish
+    before they are cancelled and released.
+    """
+
+    cfg: zr.ApplicationConfig = None
+    notifier: WorkflowNotifier = None
+
+    @injector.construct
+    def __init__(self, halt: threading.Event):
+        self.halt = halt
+        self._log = zrlog.get_logger("pipeman.workflow.async")
+        self._max_items = max(1, self.cfg.as_int(("pipeman", "async_max_items"), default=5))
+        self._lease_seconds = 60 * self.cfg.as_float(("pipeman", "workflow", "task_lock_time_minutes"), default=30)
+        self._drain_seconds = self.cfg.as_float(("pipeman", "workflow", "async_drain_seconds"), default=30)
+        self._idle_wait = self.cfg.as_float(("pipeman", "workflow", "task_thread_idle_wait_seconds"), default=60)
+        self._reset_interval = self.cfg.as_float(("pipeman", "workflow", "task_thread_reset_sleep_seconds"), default=300)
+        self._db_threads = max(1, self.cfg.as_int(("pipeman", "workflow", "async_db_threads"), default=2))
+        self._db_executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._worker_id = str(uuid.uuid4())
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+
+    async def run(self, until_idle: bool = False):
+        """Process items until halted or, if until_idle is set, until there is nothing left to do."""
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        unsubscribe = self.notifier.subscribe(lambda: loop.call_soon_threadsafe(self._wakeup.set))
+        semaphore = asyncio.Semaphore(self._max_items)
+        last_reset = None
+        self._db_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._db_threads,
+            thread_name_prefix="async_workflow_db"
+        )
+        self._log.info(f"Starting async workflow engine {self._worker_id} with {self._max_items} slots")
+        try:
+            while not self.halt.is_set():
+                if last_reset is None or (time.monotonic() - last_reset) > self._reset_interval:
+                    await self._db("reset_async_items")
+                    last_reset = time.monotonic()
+                self._wakeup.clear()
+                free_slots = self._max_items - len(self._tasks)
+                item_ids = await self._db(
+                    "claim_items",
+                    self._worker_id,
+                    free_slots,
+                    self._lease_seconds,
+                    status="ASYNC_EXECUTE",
+                    claimed_status="ASYNC_IN_PROGRESS",
+                    delayed_status="ASYNC_DELAY"
+                ) if free_slots > 0 else []
+                for item_id in item_ids:
+                    task = asyncio.create_task(self._run_item(item_id, semaphore), name=f"workflow_item{item_id}")
+                    self._tasks.add(task)
+                    task.add_done_callback(self._task_done)
+                if until_idle and not item_ids and not self._tasks:
+                    break
+                # Wait for new work, a free slot or the halt signal
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._idle_wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            unsubscribe()
+            try:
+                await self._drain()
+            finally:
+                self._db_executor.shutdown(wait=True)
+                self._db_executor = None
+
+    async def _db(self, method_name: str, *args, **kwargs):
+        """Call a WorkflowController method on a database thread, keeping the Flask application context."""
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db_executor,
+            functools.partial(ctx.run, _call_controller, method_name, *args, **kwargs)
+        )
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._log.error(f"Error in async task {task.get_name()}", exc_info=task.exception())
+        self._wakeup.set()
+
+    async def _run_item(self, item_id: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            prepared = await self._db("prepare_async_item", item_id, self._worker_id)
+            if prepared is None:
+                return
+            step, steps, ctx = prepared
+            try:
+                result = await step.async_execute(ctx)
+            except asyncio.CancelledError:
+                self._log.warning(f"Async processing of item {item_id} was cancelled, releasing it")
+                # The task is cancelled, so wait for the release without letting it be cancelled too
+                await asyncio.shield(self._db("release_items", [item_id], self._worker_id, "ASYNC_EXECUTE"))
+                raise
+            await self._db("complete_async_item", item_id, self._worker_id, step, steps, ctx, result)
+
+    async def _drain(self):
+        if not self._tasks:
+            return
+        self._log.notice(f"Waiting for {len(self._tasks)} async items to complete")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=self._drain_seconds)
+        if pending:
+            self._log.warning(f"Cancelling {len(pending)} async items that did not complete in time")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class AsyncWorkflowCronThread(CronThread):
+    """Keeps an event loop running the async workflow engine for the life of the cron daemon."""
+
+    notifier: WorkflowNotifier = None
+
+    @injector.construct
+    def __init__(self, app):
+        super().__init__(app)
+
+    def terminate(self):
+        super().terminate()
+        self.notifier.wake()
+
+    def _run(self):
+        self.notifier.start_listener(self.halt)
+        asyncio.run(AsyncWorkflowEngine(self.halt).run())
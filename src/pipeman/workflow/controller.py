@@ -13,10 +13,9 @@ import time
 import zirconium as zr
 import logging
 import markupsafe
-import asyncio
 from pipeman.attachment import AttachmentController
 from pipeman.util.flask import ActionList, flasht
-from pipeman.util.errors import WorkflowNotFoundError, StepNotFoundError
+from pipeman.util.errors import WorkflowNotFoundError, StepNotFoundError, WorkflowItemNotFoundError, RemoteLeaseError
 from autoinject import injector
 from pipeman.db import Database
 from pipeman.i18n import MultiLanguageString
@@ -24,9 +23,16 @@ from pipeman.i18n import gettext, format_datetime, DelayedTranslationString
 from pipeman.util.flask import DataQuery, DataTable, DatabaseColumn, CustomDisplayColumn, ActionListColumn
 from flask_wtf.file import FileField
 from .workflow import WorkflowRegistry
-from .steps import ItemResult, StepStatus, ItemNextAction
+from .archive import WorkflowItemArchiver
+from .notify import WorkflowNotifier
+from .process_pool import StepProcessPool
+from .steps import ItemResult, StepStatus, ItemNextAction, RetryPolicy, WorkflowRemoteStep
 from pipeman.util.cron import CronThread, UniqueTaskThreadManager
 import functools
+import os
+import socket
+import uuid
+import typing as t
 
 
 class ItemDisplayWrapper:
@@ -54,7 +60,7 @@ class ItemDisplayWrapper:
         return ""
 
     def properties(self):
-        return [
+        props = [
             (gettext('pipeman.label.witem.object_link'),
              markupsafe.Markup(f"<a href='{self.object_link()}'>{self.object_link_text()}</a>")),
             (gettext('pipeman.label.witem.type'), gettext(f'pipeman.label.witem.type.{self.item.workflow_type}')),
@@ -63,6 +69,10 @@ class ItemDisplayWrapper:
             (gettext('pipeman.label.witem.created'), format_datetime(self.item.created_date)),
             (gettext('pipeman.label.witem.status'), gettext(f'pipeman.label.witem.status.{self.item.status.lower()}')),
         ]
+        if self.item.next_attempt_at and self.item.status in ('BATCH_DELAY', 'ASYNC_DELAY'):
+            props.append((gettext('pipeman.label.witem.next_attempt'), format_datetime(self.item.next_attempt_at)))
+            props.append((gettext('pipeman.label.witem.attempt'), str(self.item.attempt)))
+        return props
 
     def steps(self):
         decision_list = {}
@@ -117,12 +127,17 @@ class WorkflowController:
     reg: WorkflowRegistry = None
     cfg: zr.ApplicationConfig = None
     attachments: AttachmentController = None
+    notifier: WorkflowNotifier = None
+    process_pool: StepProcessPool = None
 
     @injector.construct
     def __init__(self):
         self._log = logging.getLogger("pipeman.workflow")
+        self._retry_policy = None
 
-    def start_workflow(self, workflow_type, workflow_name, workflow_context, object_id=None, object_type="dataset"):
+    def start_workflow(self, workflow_type, workflow_name, workflow_context, object_id=None, object_type="dataset",
+                       priority: t.Optional[int] = None, lane: t.Optional[str] = None):
+        default_priority, default_lane = self.reg.workflow_scheduling(workflow_type, workflow_name)
         with self.db as session:
             item = orm.WorkflowItem(
                 workflow_type=workflow_type,
@@ -134,10 +149,13 @@ class WorkflowController:
                 created_date=datetime.datetime.now(),
                 created_by=flask_login.current_user.user_id if flask_login.current_user else None,
                 completed_index=0,
-                status="IN_PROGRESS"
+                status="IN_PROGRESS",
+                priority=default_priority if priority is None else priority,
+                lane=default_lane if lane is None else (lane or None)
             )
             session.add(item)
             session.commit()
+            # Runnable work created by the first step is signalled from _handle_step_result
             self._start_next_step(item, session)
             return item.status, item.id
 
@@ -380,54 +398,80 @@ class WorkflowController:
                 self._log.warning(f"Unrecognized access mode {mode}")
         return False
 
-    def cleanup_old_items(self, st = None):
-        # TODO: add old item removal for completed workflow items
-        #self._log.info(f"Cleaning up old workflow items")
-        self._log.warning(f"Cleanup not implemented")
+    @injector.inject
+    def cleanup_old_items(self, st = None, archiver: WorkflowItemArchiver = None):
+        archiver.archive_old_items(st.halt if st is not None else None)
 
-    async def async_batch_process_items(self, st = None):
-        self._log.info(f"Starting async batch jobs")
-        max_exec_time = 1000000000 * self.cfg.as_int(("pipeman", "async_batch_process_time"), default=5)
-        max_items = self.cfg.as_int(("pipeman", "async_max_items"), default=5)
+    def prepare_async_item(self, item_id: int, worker_id: str):
+        """Build the next step and context of an item claimed for async execution, or None if it can't run."""
         with self.db as session:
-            q = sa.update(orm.WorkflowItem).where(orm.WorkflowItem.status == 'ASYNC_DELAY').values({
-                'status': 'ASYNC_EXECUTE'
-            })
-            session.execute(q)
-            session.commit()
-            start_time = time.monotonic_ns()
-            cont = True
-            tasks = []
-            while cont:
-                cont = False
-                for item in session.query(orm.WorkflowItem).filter_by(status="ASYNC_EXECUTE"):
-                    cont = True
-                    if st.halt.is_set() or (time.monotonic_ns() - start_time) > max_exec_time:
-                        cont = False
-                        break
-                    tasks.append(asyncio.create_task(self._async_batch_execute(item, session)))
-                    while len(tasks) >= max_items:
-                        await asyncio.sleep(0.5)
-                        if (st and st.halt.is_set()) or (time.monotonic_ns() - start_time) > max_exec_time:
-                            cont = False
-                            break
-                        tasks, _ = await asyncio.wait(tasks)
-            await asyncio.gather(*tasks)
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            if item is None:
+                self._log.warning("Item ID %s requested but not found", item_id)
+                return None
+            if item.status != "ASYNC_IN_PROGRESS" or item.locked_by != worker_id:
+                self._log.warning("Item %s is no longer leased to %s", item_id, worker_id)
+                return None
+            step, steps = self._build_next_step(item)
+            if step is None:
+                item.locked_by = None
+                item.locked_since = None
+                item.lock_expiry = None
+                session.commit()
+                return None
+            return step, steps, self._build_context(item)
 
-    async def _async_batch_execute(self, item, session):
-        step, steps = self._build_next_step(item)
-        if step is None:
+    def complete_async_item(self, item_id: int, worker_id: str, step, steps, ctx, result, st=None):
+        """Record the result of an async step, in a new session."""
+        with self.db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            if item is None or item.status != "ASYNC_IN_PROGRESS" or item.locked_by != worker_id:
+                self._log.warning("Lease on item %s was lost before it completed, discarding result %s", item_id, result)
+                return
+            item.locked_by = None
+            item.locked_since = None
+            item.lock_expiry = None
+            step.set_item(item)
+            self._log.info("Async process result for item %s is %s", item_id, result)
+            self._handle_step_result(step, result, item, session, steps, ctx, st=st)
             session.commit()
+
+    def release_items(self, item_ids: list[int], worker_id: str, status: str):
+        """Give up the lease on items so that they can be claimed again."""
+        if not item_ids:
             return
-        ctx = self._build_context(item)
-        result = await step.async_execute(ctx)
-        self._handle_step_result(step, result, item, session, steps, ctx)
+        with self.db as session:
+            session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.id.in_(item_ids))
+                .where(orm.WorkflowItem.locked_by == worker_id)
+                .values({"status": status, "locked_by": None, "locked_since": None, "lock_expiry": None})
+            )
+            session.commit()
+
+    def reset_async_items(self) -> int:
+        """Make async items with expired leases runnable again."""
+        now = datetime.datetime.now().astimezone()
+        with self.db as session:
+            released = session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.status == "ASYNC_IN_PROGRESS")
+                .where(orm.WorkflowItem.lock_expiry < now)
+                .values({"status": "ASYNC_EXECUTE", "locked_by": None, "locked_since": None, "lock_expiry": None})
+            ).rowcount
+            session.commit()
+        if released:
+            self._log.debug("%s async items released", released)
+        return released
 
     def _handle_step_result(self, step, result, item, session, steps, ctx, st = None):
         if result is ItemResult.AUTO_APPROVE:
             self._log.debug("Auto-approving step for %s", item.id)
             self._make_decision(item, session, True, None, True)
         else:
+            item_status, next_step = ItemResult.get_item_status_after_step(result)
+            if item_status in (StepStatus.BATCH_DELAY, StepStatus.ASYNC_DELAY):
+                item_status, next_step = self._schedule_retry(step, item, item_status, next_step)
             if step.output:
                 self._log.debug("Updating output for %s", item.id)
                 outputs = json.loads(item.step_output) if item.step_output else {}
@@ -436,24 +480,55 @@ class WorkflowController:
                 else:
                     outputs[str(item.completed_index)] = [str(x) for x in step.output]
                 item.step_output = json.dumps(outputs)
-            item_status, next_step = ItemResult.get_item_status_after_step(result)
             item.status = item_status.value
             if next_step == ItemNextAction.CONTINUE:
                 self._log.debug("Continuing to next step for %s", item.id)
                 item.completed_index += 1
+                item.attempt = 0
+                item.next_attempt_at = None
                 item.context = json.dumps(ctx)
                 session.commit()
                 if st is None or not st.halt.is_set():
                     self._start_next_step(item, session, steps, ctx)
             elif next_step == ItemNextAction.FAILURE:
                 self._log.debug("Step failure for %s", item.id)
+                item.attempt = 0
+                item.next_attempt_at = None
                 item.context = json.dumps(ctx)
                 session.commit()
                 self._handle_cleanup(item, session, steps, ctx, item.status, st=st)
             else:
                 self._log.debug("No action [%s] for %s", next_step, item.id)
+                if item_status == StepStatus.REMOTE_EXECUTE_REQUIRED:
+                    item.remote_pipeline = step.pipeline_name()
                 item.context = json.dumps(ctx)
                 session.commit()
+                if item_status in (StepStatus.BATCH_EXECUTE, StepStatus.ASYNC_EXECUTE):
+                    self.notifier.notify(session)
+
+    def _schedule_retry(self, step, item, item_status, next_step):
+        """Set when a delayed item can next be claimed, or fail it if its step has run out of attempts."""
+        item.attempt = (item.attempt or 0) + 1
+        delay = step.retry_policy(self._default_retry_policy()).next_delay(item.attempt)
+        if delay is None:
+            self._log.warning("Item %s failed after %s attempts at %s", item.id, item.attempt, step.step_name)
+            step.output.append(f"Giving up on {step.step_name} after {item.attempt} attempts")
+            item.next_attempt_at = None
+            return StepStatus.FAILURE, ItemNextAction.FAILURE
+        item.next_attempt_at = datetime.datetime.now().astimezone() + datetime.timedelta(seconds=delay)
+        self._log.debug("Item %s will be tried again in %.0f seconds (attempt %s)", item.id, delay, item.attempt)
+        return item_status, next_step
+
+    def _default_retry_policy(self) -> RetryPolicy:
+        if self._retry_policy is None:
+            self._retry_policy = RetryPolicy(
+                self.cfg.as_float(("pipeman", "workflow", "retry", "initial_delay_seconds"), default=60),
+                self.cfg.as_float(("pipeman", "workflow", "retry", "max_delay_seconds"), default=3600),
+                self.cfg.as_float(("pipeman", "workflow", "retry", "multiplier"), default=2),
+                self.cfg.as_float(("pipeman", "workflow", "retry", "jitter"), default=0.1),
+                self.cfg.as_int(("pipeman", "workflow", "retry", "max_attempts"), default=0),
+            )
+        return self._retry_policy
 
     def _handle_cleanup(self, item, session, steps, ctx, end_state, st = None):
         if '_in_cleanup' in ctx and ctx['_in_cleanup'] and (st is None or not st.halt.is_set()):
@@ -525,16 +600,311 @@ class WorkflowController:
                 if step is not None:
                     self._log.info("Batching processing item %s [%s]", item_id, step)
                     ctx = self._build_context(item)
-                    result = step.batch(ctx)
+                    if step.item_config.get("execution") == "process" and self.process_pool.enabled:
+                        result = self.process_pool.run_batch(step, item.id, ctx)
+                    else:
+                        result = step.batch(ctx)
                     self._log.info("Batch process result for item %s is %s", item_id, result)
                     self._handle_step_result(step, result, item, session, steps, ctx, st=st)
                     item.locked_since = None
+                    item.locked_by = None
+                    item.lock_expiry = None
                     session.commit()
                 else:
                     self._log.warning("Could not build next step for %s", item_id)
             else:
                 self._log.warning("Item ID %s requested but not found", item_id)
 
+    def claim_items(self,
+                    worker_id: str,
+                    max_items: int,
+                    lease_seconds: float,
+                    status: str = "BATCH_EXECUTE",
+                    claimed_status: str = "BATCH_IN_PROGRESS",
+                    delayed_status: t.Optional[str] = "BATCH_DELAY",
+                    lane: t.Optional[str] = None,
+                    remote_pipeline: t.Optional[str] = None) -> list[int]:
+        """Lease up to max_items items in the given status to a worker and return their IDs.
+
+        Items in delayed_status are included once their next_attempt_at has passed. Higher priority items are
+        claimed first, then older ones, and only items in the given lane are claimed if one is given. On PostgreSQL
+        the items are selected and updated in one statement with FOR UPDATE SKIP LOCKED, so concurrent workers
+        neither block each other nor claim the same item. Elsewhere, the update only applies to items that are
+        still in the original status (compare-and-set), so an item claimed by another worker in between is skipped.
+        """
+        if max_items <= 0:
+            return []
+        now = datetime.datetime.now().astimezone()
+        values = {
+            "status": claimed_status,
+            "locked_by": worker_id,
+            "locked_since": now,
+            "lock_expiry": now + datetime.timedelta(seconds=lease_seconds),
+        }
+        runnable = orm.WorkflowItem.status == status
+        statuses = [status]
+        if delayed_status:
+            runnable = sa.or_(runnable, sa.and_(
+                orm.WorkflowItem.status == delayed_status,
+                sa.or_(orm.WorkflowItem.next_attempt_at.is_(None), orm.WorkflowItem.next_attempt_at <= now)
+            ))
+            statuses.append(delayed_status)
+        with self.db as session:
+            dialect = session.get_bind().dialect
+            candidates = (
+                sa.select(orm.WorkflowItem.id)
+                .where(runnable)
+                .order_by(orm.WorkflowItem.priority.desc(), orm.WorkflowItem.created_date)
+                .limit(max_items)
+            )
+            if lane is not None:
+                candidates = candidates.where(orm.WorkflowItem.lane == lane)
+            if remote_pipeline is not None:
+                candidates = candidates.where(orm.WorkflowItem.remote_pipeline == remote_pipeline)
+            if dialect.name == "postgresql":
+                q = (
+                    sa.update(orm.WorkflowItem)
+                    .where(orm.WorkflowItem.id.in_(candidates.with_for_update(skip_locked=True).scalar_subquery()))
+                    .values(values)
+                    .returning(orm.WorkflowItem.id)
+                )
+                item_ids = [x for x, in session.execute(q)]
+            else:
+                candidate_ids = [x for x, in session.execute(candidates)]
+                if not candidate_ids:
+                    return []
+                q = (
+                    sa.update(orm.WorkflowItem)
+                    .where(orm.WorkflowItem.id.in_(candidate_ids))
+                    .where(orm.WorkflowItem.status.in_(statuses))
+                    .values(values)
+                )
+                if dialect.update_returning:
+                    item_ids = [x for x, in session.execute(q.returning(orm.WorkflowItem.id))]
+                else:
+                    session.execute(q)
+                    item_ids = [x for x, in session.execute(
+                        sa.select(orm.WorkflowItem.id)
+                        .where(orm.WorkflowItem.id.in_(candidate_ids))
+                        .where(orm.WorkflowItem.status == claimed_status)
+                        .where(orm.WorkflowItem.locked_by == worker_id)
+                    )]
+            session.commit()
+        if item_ids:
+            self._log.debug("Worker %s claimed items %s", worker_id, item_ids)
+        return item_ids
+
+    def next_attempt_time(self, delayed_status: str = "BATCH_DELAY") -> t.Optional[datetime.datetime]:
+        """The earliest time that a delayed item can be claimed again, or None if no items are delayed."""
+        with self.db as session:
+            return session.execute(
+                sa.select(sa.func.min(orm.WorkflowItem.next_attempt_at))
+                .where(orm.WorkflowItem.status == delayed_status)
+            ).scalar()
+
+    def lease_remote_item(self, pipeline_name: str, lease_seconds: t.Optional[float] = None) -> t.Optional[dict]:
+        """Lease the next item waiting for a remote worker in a pipeline, or return None if there isn't one.
+
+        The lease token in the result must be given to renew, release or complete the item.
+        """
+        lease_seconds = lease_seconds or self._remote_lease_seconds()
+        token = str(uuid.uuid4())
+        item_ids = self.claim_items(
+            token,
+            1,
+            lease_seconds,
+            status=StepStatus.REMOTE_EXECUTE_REQUIRED.value,
+            claimed_status="REMOTE_IN_PROGRESS",
+            delayed_status=None,
+            remote_pipeline=pipeline_name
+        )
+        if not item_ids:
+            return None
+        with self.db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_ids[0]).first()
+            step, _ = self._build_next_step(item)
+            self._log.info("Item %s leased to remote worker in pipeline %s", item.id, pipeline_name)
+            return {
+                "item_id": item.id,
+                "lease_token": token,
+                "lease_expiry": item.lock_expiry.isoformat(),
+                "pipeline": pipeline_name,
+                "step_name": step.step_name if step else None,
+                "parameters": (step.item_config.get("parameters") or {}) if step else {},
+                "workflow_type": item.workflow_type,
+                "workflow_name": item.workflow_name,
+                "object_type": item.object_type,
+                "object_id": item.object_id,
+                "context": self._build_context(item),
+            }
+
+    def renew_remote_item(self, item_id: int, lease_token: str, lease_seconds: t.Optional[float] = None) -> dict:
+        """Extend the lease on a remote item; raises RemoteLeaseError if the lease was lost."""
+        expiry = datetime.datetime.now().astimezone() + datetime.timedelta(
+            seconds=lease_seconds or self._remote_lease_seconds()
+        )
+        with self.db as session:
+            updated = session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.id == item_id)
+                .where(orm.WorkflowItem.status == "REMOTE_IN_PROGRESS")
+                .where(orm.WorkflowItem.locked_by == lease_token)
+                .values({"lock_expiry": expiry})
+            ).rowcount
+            session.commit()
+        if not updated:
+            raise RemoteLeaseError(f"Lease on item {item_id} is not held")
+        return {"item_id": item_id, "lease_expiry": expiry.isoformat()}
+
+    def release_remote_item(self, item_id: int, lease_token: str) -> bool:
+        """Put a remote item back in its queue; returns False if the lease was not held."""
+        with self.db as session:
+            updated = session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.id == item_id)
+                .where(orm.WorkflowItem.status == "REMOTE_IN_PROGRESS")
+                .where(orm.WorkflowItem.locked_by == lease_token)
+                .values({
+                    "status": StepStatus.REMOTE_EXECUTE_REQUIRED.value,
+                    "locked_by": None,
+                    "locked_since": None,
+                    "lock_expiry": None,
+                })
+            ).rowcount
+            session.commit()
+        if updated:
+            self.notifier.wake()
+        return bool(updated)
+
+    def complete_remote_item(self,
+                             item_id: int,
+                             lease_token: str,
+                             success: bool,
+                             output: t.Optional[list] = None,
+                             context: t.Optional[dict] = None) -> dict:
+        """Record the outcome of remote work and continue the workflow.
+
+        Completing again with the same lease token and outcome (e.g. when a response was lost) has no further
+        effect. Raises RemoteLeaseError if the lease is not held and WorkflowItemNotFoundError for unknown items.
+        """
+        decider_id = f"_remote_:{lease_token}"
+        with self.db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            if item is None:
+                raise WorkflowItemNotFoundError(item_id)
+            previous = session.query(orm.WorkflowDecision).filter_by(
+                workflow_item_id=item_id,
+                decider_id=decider_id
+            ).first()
+            if previous is not None:
+                if previous.decision != success:
+                    raise RemoteLeaseError(f"Item {item_id} was already completed with a different outcome")
+                return {"item_id": item_id, "status": item.status, "already_completed": True}
+            # Only one completion can take the item out of REMOTE_IN_PROGRESS
+            updated = session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.id == item_id)
+                .where(orm.WorkflowItem.status == "REMOTE_IN_PROGRESS")
+                .where(orm.WorkflowItem.locked_by == lease_token)
+                .values({
+                    "status": StepStatus.IN_PROGRESS.value,
+                    "locked_by": None,
+                    "locked_since": None,
+                    "lock_expiry": None,
+                })
+                .execution_options(synchronize_session="fetch")
+            ).rowcount
+            if not updated:
+                session.rollback()
+                raise RemoteLeaseError(f"Lease on item {item_id} is not held")
+            step, steps = self._build_next_step(item)
+            if step is None or not isinstance(step, WorkflowRemoteStep):
+                session.rollback()
+                raise RemoteLeaseError(f"Item {item_id} is not waiting on a remote step")
+            session.add(orm.WorkflowDecision(
+                workflow_item_id=item.id,
+                step_name=step.step_name,
+                decider_id=decider_id,
+                decision=success,
+                decision_date=datetime.datetime.now(),
+            ))
+            ctx = self._build_context(item)
+            if context:
+                ctx.update(context)
+            step.output.extend(str(x) for x in output or [])
+            result = step.complete(success, ctx)
+            self._log.info("Remote work on item %s completed with %s", item_id, result)
+            self._handle_step_result(step, result, item, session, steps, ctx)
+            session.commit()
+            return {"item_id": item_id, "status": item.status, "already_completed": False}
+
+    def reset_remote_items(self) -> int:
+        """Put remote items whose lease has expired back in their queue."""
+        now = datetime.datetime.now().astimezone()
+        with self.db as session:
+            released = session.execute(
+                sa.update(orm.WorkflowItem)
+                .where(orm.WorkflowItem.status == "REMOTE_IN_PROGRESS")
+                .where(orm.WorkflowItem.lock_expiry < now)
+                .values({
+                    "status": StepStatus.REMOTE_EXECUTE_REQUIRED.value,
+                    "locked_by": None,
+                    "locked_since": None,
+                    "lock_expiry": None,
+                })
+            ).rowcount
+            session.commit()
+        if released:
+            self._log.info("%s remote items with expired leases released", released)
+        return released
+
+    def _remote_lease_seconds(self) -> float:
+        return self.cfg.as_float(("pipeman", "workflow", "remote_lease_seconds"), default=600)
+
+    def pop_remote_pipeline(self, pipeline_name):
+        item = self.lease_remote_item(pipeline_name)
+        if item is None:
+            return "", 204
+        return flask.jsonify(item)
+
+    def renew_remote_lock(self, item_id):
+        token = self._request_lease_token()
+        if not token:
+            return flask.jsonify({"error": "lease_token is required"}), 400
+        try:
+            return flask.jsonify(self.renew_remote_item(item_id, token))
+        except RemoteLeaseError as ex:
+            return flask.jsonify({"error": str(ex)}), 409
+
+    def release_remote_lock(self, item_id):
+        token = self._request_lease_token()
+        if not token:
+            return flask.jsonify({"error": "lease_token is required"}), 400
+        return flask.jsonify({"item_id": item_id, "released": self.release_remote_item(item_id, token)})
+
+    def remote_work_complete(self, item_id, success: bool):
+        token = self._request_lease_token()
+        if not token:
+            return flask.jsonify({"error": "lease_token is required"}), 400
+        body = flask.request.get_json(silent=True) or {}
+        try:
+            return flask.jsonify(self.complete_remote_item(
+                item_id,
+                token,
+                success,
+                body.get("output"),
+                body.get("context")
+            ))
+        except WorkflowItemNotFoundError:
+            return flask.jsonify({"error": f"Item {item_id} not found"}), 404
+        except RemoteLeaseError as ex:
+            return flask.jsonify({"error": str(ex)}), 409
+
+    @staticmethod
+    def _request_lease_token() -> t.Optional[str]:
+        body = flask.request.get_json(silent=True) or {}
+        return flask.request.headers.get("X-Lease-Token") or body.get("lease_token") or flask.request.args.get("lease_token")
+
     def _make_decision(self, item, session, decision: bool, form=None, auto_approved: bool = False):
         step, steps = self._build_next_step(item)
         if step is None:
@@ -606,74 +976,126 @@ class WorkflowCronThread(CronThread):
 
     db: Database = None
     cfg: zr.ApplicationConfig = None
+    notifier: WorkflowNotifier = None
 
     @injector.construct
     def __init__(self, app):
         super().__init__(app)
         self._sleep_interval: float = self.cfg.as_float(("pipeman", "workflow", "task_thread_sleep_seconds"), default=5)
+        self._idle_wait: float = self.cfg.as_float(("pipeman", "workflow", "task_thread_idle_wait_seconds"), default=60)
         self._reset_interval = self.cfg.as_float(("pipeman", "workflow", "task_thread_reset_sleep_seconds"), default=300)
-        self._reset_all_on_boot = self.cfg.as_bool(("pipeman", "workflow", "task_thread_reset_all_on_boot"), default=True)
+        self._reset_all_on_boot = self.cfg.as_bool(("pipeman", "workflow", "task_thread_reset_all_on_boot"), default=False)
         self._max_threads = self.cfg.as_int(("pipeman", "workflow", "max_sub_threads"), default=3)
         self._lock_time: float = self.cfg.as_float(("pipeman", "workflow", "task_lock_time_minutes"), default=30)  # minutes
         self._finish_delay_time = self.cfg.as_float(("pipeman", "workflow", "max_exit_delay_time_seconds"), default=5)
+        self._worker_id = str(uuid.uuid4())
         self._last_reset = None
         if self._max_threads <= 0:
             self._max_threads = 3
-        self._tasks = UniqueTaskThreadManager(app, self.halt, self._max_threads)
+        self._tasks = UniqueTaskThreadManager(
+            app,
+            self.halt,
+            self._max_threads,
+            self.cfg.as_dict(("pipeman", "workflow", "reserved_threads"), default={"interactive": 1}),
+            name="workflow"
+        )
         self._log = zrlog.get_logger("dmd.workflow_cron")
+        self._log.info(f"Workflow worker ID on {socket.gethostname()} [{os.getpid()}] is {self._worker_id}")
+
+    def terminate(self):
+        super().terminate()
+        self.notifier.wake()
 
     def _run(self):
-        self._reset_delayed_jobs(0 if self._reset_all_on_boot else self._lock_time)
+        self.notifier.start_listener(self.halt)
+        self._release_expired_leases(self._lock_time, on_boot=True)
         while not self.halt.is_set():
             if (time.monotonic() - self._last_reset) > self._reset_interval:
-                self._reset_delayed_jobs(self._lock_time)
-            self._check_for_jobs()
+                self._release_expired_leases(self._lock_time)
+            backlog = self._check_for_jobs()
             self._tasks.sow()
-            time.sleep(self._sleep_interval)
+            self.db.end_scope()
+            # When there may be more work than free threads, check again soon; otherwise wait to be notified of new
+            # work (or of a thread finishing) or for the next delayed item to be due.
+            self.notifier.wait(self._sleep_interval if backlog else self._idle_wait_time())
         self._tasks.wait_for_all(self._finish_delay_time)
+        self._tasks.shutdown()
 
-    def _check_for_jobs(self):
+    @injector.inject
+    def _check_for_jobs(self, wc: WorkflowController = None) -> bool:
+        """Claim as many jobs as there are free threads; returns True if there might be more waiting."""
         self._log.debug("Checking for new jobs")
-        with self.db as session:
-            for item in session.query(orm.WorkflowItem).filter_by(status="BATCH_EXECUTE").order_by(orm.WorkflowItem.created_date).all():
-                if self.halt.is_set():
-                    self._log.debug("Halt flag is set")
-                    break
-                if self._tasks.is_full():
+        if self.halt.is_set():
+            self._log.debug("Halt flag is set")
+            return False
+        backlog = False
+        # Fill the threads reserved for each lane with that lane's items first, then the shared threads with
+        # whatever has the highest priority
+        for lane in [*self._tasks.reserved_lanes(), None]:
+            slots = self._tasks.reserved_slots(lane) if lane is not None else self._tasks.available_slots()
+            if slots <= 0:
+                if lane is None:
                     self._log.debug("Task manager already full")
-                    break
-                self._log.debug(f"queuing job {item.id}")
-                item.status = "BATCH_IN_PROGRESS"
-                item.locked_since = datetime.datetime.now()
-                item_id = int(item.id)
-                session.commit()
+                    backlog = True
+                continue
+            item_ids = wc.claim_items(self._worker_id, slots, self._lock_time * 60, lane=lane)
+            for item_id in item_ids:
+                self._log.debug(f"queuing job {item_id}")
                 self._tasks.execute(f'workflow_item{item_id}',
-                                    functools.partial(self._handle_batch_job, item_id=item_id))
+                                    functools.partial(self._handle_batch_job, item_id=item_id),
+                                    lane)
+            if len(item_ids) >= slots:
+                backlog = True
+        return backlog
+
+    @injector.inject
+    def _idle_wait_time(self, wc: WorkflowController = None) -> float:
+        """How long to wait for a notification when there is no work left to claim."""
+        # Items started by other processes only wake this one up if it is listening for their notifications, so poll
+        # as often as when there is a backlog otherwise
+        wait_time = self._idle_wait if self.notifier.listening else self._sleep_interval
+        wait_time = min(wait_time, self._reset_interval)
+        next_attempt = wc.next_attempt_time()
+        if next_attempt is not None:
+            due_in = (next_attempt.astimezone() - datetime.datetime.now().astimezone()).total_seconds()
+            # At least a second, so that a due item that can't be claimed yet doesn't keep the loop busy
+            wait_time = min(wait_time, max(due_in, 1.0))
+        return wait_time
 
     @injector.inject
     def _handle_batch_job(self, st, item_id, wc: WorkflowController=None):
-        wc.batch_process(st, item_id)
+        try:
+            wc.batch_process(st, item_id)
+        finally:
+            # A thread is free again, so check for more work
+            self.notifier.wake()
 
-    def _reset_delayed_jobs(self, gate_time_minutes: float):
+    def _release_expired_leases(self, gate_time_minutes: float, on_boot: bool = False):
         with self.db as session:
-            self._log.debug("Releasing delayed items")
-            q = sa.update(orm.WorkflowItem).where(orm.WorkflowItem.status == 'BATCH_DELAY').values({
-                'status': 'BATCH_EXECUTE'
-            })
-            r = session.execute(q)
-            session.commit()
-            self._log.debug("%s delayed items released", r.rowcount)
-            if self.halt.is_set():
-                return
-            gate = datetime.datetime.now().astimezone() - datetime.timedelta(minutes=gate_time_minutes)
-            self._log.debug("Resetting items older than %s", gate)
+            now = datetime.datetime.now().astimezone()
+            gate = now - datetime.timedelta(minutes=gate_time_minutes)
+            self._log.debug("Resetting items with expired leases or older than %s", gate)
+            expired = sa.and_(orm.WorkflowItem.lock_expiry.is_not(None), orm.WorkflowItem.lock_expiry < now)
+            legacy = sa.and_(orm.WorkflowItem.lock_expiry.is_(None), orm.WorkflowItem.locked_since < gate)
+            if on_boot:
+                # Items locked before leases were introduced have no expiry and no worker left to finish them; items
+                # with an unexpired lease may belong to a worker on another node, so they are left alone unless
+                # task_thread_reset_all_on_boot is set (only safe with a single node)
+                legacy = orm.WorkflowItem.lock_expiry.is_(None)
+                if self._reset_all_on_boot:
+                    expired = sa.true()
             q = (
                     sa.update(orm.WorkflowItem)
                     .where(orm.WorkflowItem.status == 'BATCH_IN_PROGRESS')
-                    .where(orm.WorkflowItem.locked_since < gate)
-                    .values({'status': 'BATCH_EXECUTE', 'locked_since': None})
+                    .where(sa.or_(expired, legacy))
+                    .values({'status': 'BATCH_EXECUTE', 'locked_since': None, 'locked_by': None, 'lock_expiry': None})
             )
             res = session.execute(q)
             session.commit()
             self._log.debug(f"%s items reset", res.rowcount)
-            self._last_reset = time.monotonic()
+        self._reset_remote_items()
+        self._last_reset = time.monotonic()
+
+    @injector.inject
+    def _reset_remote_items(self, wc: WorkflowController = None):
+        wc.reset_remote_items()
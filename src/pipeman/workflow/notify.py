@@ -0,0 +1,114 @@
+import re
+import select
+import threading
+import typing as t
+
+import sqlalchemy as sa
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+from pipeman.db import Database
+
+
+@injector.injectable_global
+class WorkflowNotifier:
+    """Wakes up workflow processing as soon as there is runnable work.
+
+    Within a process, a notification sets an event that the workflow cron thread waits on. On PostgreSQL, a
+    NOTIFY is also sent so that cron daemons in other processes (listening on a dedicated connection) wake up too.
+    """
+
+    db: Database = None
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.workflow.notify")
+        self._event = threading.Event()
+        self._subscribers: list[t.Callable[[], None]] = []
+        self._subscriber_lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+        self._use_pg_notify = self.config.as_bool(("pipeman", "workflow", "pg_notify"), default=True)
+        self._channel = self.config.as_str(("pipeman", "workflow", "notify_channel"), default="pipeman_workflow")
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", self._channel):
+            raise ValueError(f"Invalid notification channel name [{self._channel}]")
+
+    def notify(self, session=None):
+        """Signal that runnable work exists; call after the work has been committed."""
+        if session is not None and self._use_pg_notify and session.get_bind().dialect.name == "postgresql":
+            session.execute(sa.text("SELECT pg_notify(:channel, '')"), {"channel": self._channel})
+            session.commit()
+        self.wake()
+
+    def wake(self):
+        """Wake up local waiters only."""
+        self._event.set()
+        with self._subscriber_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback()
+
+    def subscribe(self, callback: t.Callable[[], None]) -> t.Callable[[], None]:
+        """Call a (thread-safe) callback on every notification, for waiters that can't block on an event.
+
+        Returns a function that removes the subscription.
+        """
+        with self._subscriber_lock:
+            self._subscribers.append(callback)
+
+        def _unsubscribe():
+            with self._subscriber_lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return _unsubscribe
+
+    def wait(self, timeout: float) -> bool:
+        """Block until notified or until the timeout expires; returns True if notified."""
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+    @property
+    def listening(self) -> bool:
+        """Whether notifications from other processes are being received."""
+        return self._listener is not None and self._listener.is_alive()
+
+    def start_listener(self, halt: threading.Event):
+        """Listen for notifications from other processes until halt is set (PostgreSQL only)."""
+        if not self._use_pg_notify or self.db.get_engine().dialect.name != "postgresql":
+            return
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(target=self._listen, args=(halt,), daemon=True, name="workflow_listener")
+        self._listener.start()
+
+    def _listen(self, halt: threading.Event):
+        while not halt.is_set():
+            conn = None
+            try:
+                conn = self.db.get_engine().raw_connection()
+                dbapi_conn = conn.driver_connection
+                if not hasattr(dbapi_conn, "poll"):
+                    self._log.warning("Database driver does not support LISTEN, relying on local notifications only")
+                    return
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self._channel}")
+                self._log.debug(f"Listening for workflow notifications on [{self._channel}]")
+                while not halt.is_set():
+                    readable, _, _ = select.select([dbapi_conn], [], [], 5)
+                    if readable:
+                        dbapi_conn.poll()
+                        if dbapi_conn.notifies:
+                            dbapi_conn.notifies.clear()
+                            self.wake()
+            except Exception as ex:
+                self._log.warning(f"Workflow notification listener failed, retrying: {ex}")
+                halt.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+        # Make sure anyone waiting notices the halt
+        self.wake()
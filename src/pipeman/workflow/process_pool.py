@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import threading
+import traceback
+import typing as t
+
+import zirconium as zr
+import zrlog
+from autoinject import injector
+
+import pipeman.db.orm as orm
+from pipeman.db import Database
+from .steps import ItemResult, WorkflowStep
+from .workflow import WorkflowRegistry
+
+
+_worker_app = None
+
+
+def init_worker_process(extra_files: list[str]):
+    """Set up the system, registries and Flask application once in each worker process."""
+    global _worker_app
+    import flask
+    from pipeman.init import init as pipeman_init
+    system = pipeman_init(extra_files=extra_files)
+    _worker_app = flask.Flask("pipeman")
+    system.init_app(_worker_app)
+
+
+def worker_app():
+    """The Flask application of the current worker process."""
+    return _worker_app
+
+
+@injector.inject
+def _run_batch_step(step_name: str, item_id: int, context: dict, reg: WorkflowRegistry = None, db: Database = None):
+    """Run the batch part of a step in a worker process and return what the parent needs to record the result."""
+    with _worker_app.app_context():
+        with db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            step = reg.construct_step(step_name)
+            step.set_item(item)
+            result = step.batch(context)
+            return result, [str(x) for x in step.output], context
+
+
+def _worker_main(conn, extra_files: list[str]):
+    """Run steps sent by the parent one at a time until it sends None or closes the pipe."""
+    init_worker_process(extra_files)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        try:
+            conn.send((True, _run_batch_step(*task)))
+        except Exception as ex:
+            conn.send((False, (str(ex), traceback.format_exc())))
+
+
+class _StepWorker:
+    """A worker process with its own pipe, so that it can be stopped without affecting the other workers."""
+
+    def __init__(self, mp_context, extra_files: list[str], generation: int):
+        self.generation = generation
+        self._conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=_worker_main, args=(child_conn, extra_files), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, task: tuple, timeout: t.Optional[float]) -> tuple[bool, t.Any]:
+        """Send a step to the worker and wait for its result; raises EOFError if the worker died."""
+        self._conn.send(task)
+        if not self._conn.poll(timeout):
+            raise TimeoutError()
+        return self._conn.recv()
+
+    def stop(self, terminate: bool = False):
+        if not terminate:
+            try:
+                self._conn.send(None)
+            except OSError:
+                terminate = True
+        if terminate:
+            self.process.terminate()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self._conn.close()
+
+
+@injector.injectable_global
+class StepProcessPool:
+    """Process pool for batch steps configured with ``execution: process``, so CPU-heavy steps can use every core.
+
+    Each worker runs one step at a time. If a step does not finish within ``process_pool_timeout_seconds``, only
+    the worker running it is stopped; steps running in the other workers are not affected.
+
+    Setting ``pipeman.workflow.process_pool_size`` to 0 runs these steps in the calling thread instead.
+    """
+
+    config: zr.ApplicationConfig = None
+
+    @injector.construct
+    def __init__(self):
+        self._log = zrlog.get_logger("pipeman.workflow.process_pool")
+        self._available = threading.Condition()
+        self._idle: list[_StepWorker] = []
+        self._busy = 0
+        self._generation = 0
+        # Forking a process with running threads and open database connections is unsafe
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._size = self.config.as_int(("pipeman", "workflow", "process_pool_size"), default=os.cpu_count() or 1)
+        self._config_files = self.config.as_list(
+            ("pipeman", "workflow", "process_pool_config_files"),
+            default=[".pipeman.cli.toml"]
+        )
+        # Kept below the default lease (task_lock_time_minutes) so the item is not picked up again while it runs
+        self._timeout = self.config.as_float(("pipeman", "workflow", "process_pool_timeout_seconds"), default=1500)
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    def run_batch(self, step: WorkflowStep, item_id: int, context: dict) -> ItemResult:
+        """Run the batch part of a step in a worker process, copying its output and context changes back."""
+        worker = self._checkout()
+        try:
+            success, value = worker.run((step.step_name, item_id, context), self._timeout if self._timeout > 0 else None)
+        except TimeoutError:
+            self._log.error(f"{step.step_name} for item {item_id} did not finish within {self._timeout} seconds")
+            # The worker is still running the step, so it has to be stopped before the item can be tried again
+            self._discard(worker, terminate=True)
+            step.output.append(f"Error calling {step.step_name}: timed out after {self._timeout} seconds")
+            return ItemResult.FAILURE
+        except (EOFError, OSError) as ex:
+            self._log.exception(f"Worker process failed while running {step.step_name} for item {item_id}")
+            self._discard(worker, terminate=True)
+            step.output.append(f"Error calling {step.step_name}: worker process failed: {str(ex) or type(ex).__name__}")
+            return ItemResult.BATCH_DELAY
+        self._checkin(worker)
+        if not success:
+            message, trace = value
+            self._log.error(f"Error running {step.step_name} for item {item_id} in a worker process\n{trace}")
+            step.output.append(f"Error calling {step.step_name}: {message}")
+            return ItemResult.FAILURE
+        result, output, new_context = value
+        step.output.extend(output)
+        context.clear()
+        context.update(new_context)
+        return result
+
+    def _checkout(self) -> _StepWorker:
+        with self._available:
+            while self._busy >= self._size:
+                self._available.wait()
+            self._busy += 1
+            if self._idle:
+                return self._idle.pop()
+            generation = self._generation
+        try:
+            self._log.info("Starting a step worker process")
+            return _StepWorker(self._mp_context, self._config_files, generation)
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _checkin(self, worker: _StepWorker):
+        with self._available:
+            if worker.generation == self._generation:
+                self._idle.append(worker)
+                worker = None
+            self._busy -= 1
+            self._available.notify()
+        # The pool was shut down while this worker was running a step
+        if worker is not None:
+            worker.stop()
+
+    def _discard(self, worker: _StepWorker, terminate: bool = False):
+        try:
+            worker.stop(terminate)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._available:
+            self._busy -= 1
+            self._available.notify()
+
+    def shutdown(self):
+        """Stop the idle workers; workers running a step stop once it is done. New workers start on the next step."""
+        with self._available:
+            idle = self._idle
+            self._idle = []
+            self._generation += 1
+        for worker in idle:
+            worker.stop()
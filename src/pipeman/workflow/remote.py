@@ -0,0 +1,178 @@
+"""Workers that pull workflow items waiting on a remote step from pipeman and report the outcome.
+
+A worker host runs a :class:`RemoteWorker` with an :class:`HttpRemoteQueue` pointing at the pipeman web
+application (using an API key with the remote_items.access permission). :class:`LocalRemoteQueue` talks to the
+workflow controller directly instead, for tests and single-host setups.
+"""
+import threading
+import typing as t
+
+import requests
+import zrlog
+from autoinject import injector
+
+from pipeman.util.errors import RemoteLeaseError
+from .controller import WorkflowController
+
+
+class RemoteWorkItem:
+    """An item leased from a remote pipeline, along with the output and context changes to send back."""
+
+    def __init__(self, info: dict):
+        self.item_id: int = info["item_id"]
+        self.lease_token: str = info["lease_token"]
+        self.lease_expiry: str = info["lease_expiry"]
+        self.pipeline: str = info["pipeline"]
+        self.step_name: str = info["step_name"]
+        self.parameters: dict = info.get("parameters") or {}
+        self.object_type: t.Optional[str] = info.get("object_type")
+        self.object_id: t.Optional[int] = info.get("object_id")
+        self.context: dict = info.get("context") or {}
+        self.output: list[str] = []
+        self.context_updates: dict = {}
+
+
+class HttpRemoteQueue:
+    """Calls the remote item API of a pipeman web application."""
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = 30, session: t.Optional[requests.Session] = None):
+        self._base_url = base_url.rstrip("/")
+        self._timeout = timeout
+        self._session = session or requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def lease(self, pipeline_name: str) -> t.Optional[dict]:
+        resp = self._post(f"/api/pop-remote-item/{pipeline_name}")
+        if resp.status_code == 204:
+            return None
+        return resp.json()
+
+    def renew(self, item_id: int, lease_token: str) -> dict:
+        return self._post(f"/api/renew-remote-item/{item_id}", lease_token).json()
+
+    def release(self, item_id: int, lease_token: str) -> bool:
+        return self._post(f"/api/release-remote-item/{item_id}", lease_token).json()["released"]
+
+    def complete(self, item_id: int, lease_token: str, success: bool, output: list, context: dict) -> dict:
+        action = "complete" if success else "cancel"
+        return self._post(
+            f"/api/{action}-remote-item/{item_id}",
+            lease_token,
+            {"output": output, "context": context}
+        ).json()
+
+    def _post(self, path: str, lease_token: t.Optional[str] = None, body: t.Optional[dict] = None) -> requests.Response:
+        resp = self._session.post(
+            self._base_url + path,
+            json=body or {},
+            headers={"X-Lease-Token": lease_token} if lease_token else None,
+            timeout=self._timeout
+        )
+        if resp.status_code == 409:
+            raise RemoteLeaseError(resp.json().get("error"))
+        resp.raise_for_status()
+        return resp
+
+
+class LocalRemoteQueue:
+    """Calls a workflow controller in this process instead of going over HTTP."""
+
+    wc: WorkflowController = None
+
+    @injector.construct
+    def __init__(self, controller: t.Optional[WorkflowController] = None):
+        if controller is not None:
+            self.wc = controller
+
+    def lease(self, pipeline_name: str) -> t.Optional[dict]:
+        return self.wc.lease_remote_item(pipeline_name)
+
+    def renew(self, item_id: int, lease_token: str) -> dict:
+        return self.wc.renew_remote_item(item_id, lease_token)
+
+    def release(self, item_id: int, lease_token: str) -> bool:
+        return self.wc.release_remote_item(item_id, lease_token)
+
+    def complete(self, item_id: int, lease_token: str, success: bool, output: list, context: dict) -> dict:
+        return self.wc.complete_remote_item(item_id, lease_token, success, output, context)
+
+
+class RemoteWorker:
+    """Leases items from one pipeline and passes them to a handler, renewing the lease while the handler runs.
+
+    The handler receives a :class:`RemoteWorkItem` and returns True if the work succeeded or False to cancel the
+    item; it can add lines to ``output`` and values to ``context_updates``. If the handler raises an exception,
+    the item is released so that it can be tried again after ``poll_seconds``; once it has failed ``max_failures``
+    times on this worker (if not 0), it is cancelled instead.
+    """
+
+    def __init__(self,
+                 queue,
+                 pipeline_name: str,
+                 handler: t.Callable[[RemoteWorkItem], bool],
+                 renew_seconds: float = 120,
+                 poll_seconds: float = 30,
+                 halt: t.Optional[threading.Event] = None,
+                 max_failures: int = 3):
+        self.queue = queue
+        self.pipeline_name = pipeline_name
+        self.handler = handler
+        self.renew_seconds = renew_seconds
+        self.poll_seconds = poll_seconds
+        self.halt = halt or threading.Event()
+        self.max_failures = max_failures
+        self._failures: dict[int, int] = {}
+        self._log = zrlog.get_logger("pipeman.workflow.remote")
+
+    def run_forever(self):
+        while not self.halt.is_set():
+            try:
+                if not self.run_once():
+                    self.halt.wait(self.poll_seconds)
+            except Exception:
+                self._log.exception(f"Error processing items from {self.pipeline_name}")
+                self.halt.wait(self.poll_seconds)
+
+    def run_once(self) -> bool:
+        """Lease and process one item; returns False if there was nothing to do or the item had to be released."""
+        info = self.queue.lease(self.pipeline_name)
+        if info is None:
+            return False
+        item = RemoteWorkItem(info)
+        self._log.info(f"Processing item {item.item_id} from {self.pipeline_name}")
+        done = threading.Event()
+        renewer = threading.Thread(target=self._renew_until, args=(item, done), daemon=True)
+        renewer.start()
+        try:
+            success = self.handler(item)
+        except Exception as ex:
+            done.set()
+            renewer.join()
+            failures = self._failures.get(item.item_id, 0) + 1
+            if 0 < self.max_failures <= failures:
+                self._log.exception(f"Error processing item {item.item_id}, cancelling it after {failures} failures")
+                self._failures.pop(item.item_id, None)
+                item.output.append(f"Remote worker failed {failures} times: {type(ex).__name__}: {ex}")
+                self.queue.complete(item.item_id, item.lease_token, False, item.output, item.context_updates)
+                return True
+            self._log.exception(f"Error processing item {item.item_id}, releasing it")
+            self._failures[item.item_id] = failures
+            self.queue.release(item.item_id, item.lease_token)
+            # Wait before leasing again, as the same item is likely to be next
+            return False
+        done.set()
+        renewer.join()
+        self._failures.pop(item.item_id, None)
+        result = self.queue.complete(item.item_id, item.lease_token, bool(success), item.output, item.context_updates)
+        self._log.info(f"Item {item.item_id} is now {result['status']}")
+        return True
+
+    def _renew_until(self, item: RemoteWorkItem, done: threading.Event):
+        while not done.wait(self.renew_seconds):
+            try:
+                self.queue.renew(item.item_id, item.lease_token)
+            except RemoteLeaseError:
+                self._log.warning(f"Lost the lease on item {item.item_id}")
+                return
+            except Exception:
+                self._log.exception(f"Error renewing the lease on item {item.item_id}")
@@ -1,4 +1,6 @@
 import importlib
+import math
+import random
 import flask_login
 import requests
 import zrlog
@@ -28,6 +30,7 @@ from pipeman.util.errors import RecoverableError, recoverable_batch_step
 # "gettext('pipeman.label.witem.status.async_execute')"
 # "gettext('pipeman.label.witem.status.cancelled')"
 # "gettext('pipeman.label.witem.status.remote_exec_queued')"
+# gettext('pipeman.label.witem.status.remote_in_progress')
 # "gettext('pipeman.label.witem.status.in_progress')"
 # "gettext('pipeman.label.witem.status.complete')"
 
@@ -103,6 +106,8 @@ class ItemResult(Enum):
             return StepStatus.ASYNC_EXECUTE, ItemNextAction.NO_ACTION
         elif res == ItemResult.AUTO_APPROVE:
             return StepStatus.IN_PROGRESS, ItemNextAction.AUTO_APPROVE
+        elif res == ItemResult.REMOTE_EXECUTE_REQUIRED:
+            return StepStatus.REMOTE_EXECUTE_REQUIRED, ItemNextAction.NO_ACTION
 
 
 class ItemNextAction:
@@ -113,6 +118,55 @@ class ItemNextAction:
     AUTO_APPROVE = 3
 
 
+class RetryPolicy:
+    """Exponential backoff for steps that ask to be tried again later (BATCH_DELAY or ASYNC_DELAY).
+
+    Attempt 1 waits ``initial_delay_seconds``, each later attempt waits ``multiplier`` times longer up to
+    ``max_delay_seconds``, and a random ``jitter`` fraction is added or removed so that items delayed together
+    don't all come back together. Once an item has been delayed ``max_attempts`` times (if not 0), it fails
+    instead of being delayed again.
+    """
+
+    def __init__(self,
+                 initial_delay_seconds: float = 60,
+                 max_delay_seconds: float = 3600,
+                 multiplier: float = 2,
+                 jitter: float = 0.1,
+                 max_attempts: int = 0):
+        self.initial_delay_seconds = float(initial_delay_seconds)
+        self.max_delay_seconds = float(max_delay_seconds)
+        self.multiplier = float(multiplier)
+        self.jitter = float(jitter)
+        self.max_attempts = int(max_attempts)
+
+    def override(self, config: t.Optional[dict]) -> "RetryPolicy":
+        if not config:
+            return self
+        return RetryPolicy(
+            config.get("initial_delay_seconds", self.initial_delay_seconds),
+            config.get("max_delay_seconds", self.max_delay_seconds),
+            config.get("multiplier", self.multiplier),
+            config.get("jitter", self.jitter),
+            config.get("max_attempts", self.max_attempts),
+        )
+
+    def next_delay(self, attempt: int) -> t.Optional[float]:
+        """Seconds to wait after the given delay (starting from 1), or None if the item should fail instead."""
+        if 0 < self.max_attempts < attempt:
+            return None
+        exponent = max(0, attempt - 1)
+        if self.multiplier > 1:
+            # Stop growing once the maximum is reached, so that large attempt counts don't overflow
+            if self.initial_delay_seconds <= 0 or self.max_delay_seconds <= self.initial_delay_seconds:
+                exponent = 0
+            else:
+                exponent = min(exponent, math.ceil(math.log(self.max_delay_seconds / self.initial_delay_seconds, self.multiplier)))
+        delay = min(self.max_delay_seconds, self.initial_delay_seconds * (self.multiplier ** exponent))
+        if self.jitter > 0:
+            delay += delay * random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+
 class WorkflowStep:
 
     def __init__(self, step_name: str, item_config: dict):
@@ -125,6 +179,9 @@ class WorkflowStep:
     def set_item(self, item):
         self.item = item
 
+    def retry_policy(self, defaults: RetryPolicy) -> RetryPolicy:
+        return defaults.override(self.item_config.get("retry"))
+
     def execute(self, context: dict) -> ItemResult:
         return self._execute_wrapper(self._execute, context)
 
@@ -257,12 +314,16 @@ class WorkflowBatchStep(WorkflowDelayedStep):
 
 
 class WorkflowRemoteStep(WorkflowDelayedStep):
+    """Waits for a remote worker to lease the item from its pipeline's queue and report the outcome."""
 
     STEP_TYPE = "remote"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs, execute_response=ItemResult.REMOTE_EXECUTE_REQUIRED)
 
+    def pipeline_name(self) -> str:
+        return self.item_config.get("pipeline") or self.step_name
+
     def complete(self, decision: bool, context: dict) -> ItemResult:
         res = ItemResult.SUCCESS if decision else ItemResult.CANCELLED
         return self._execute_wrapper(self._post_hook, context, res)
@@ -320,6 +381,7 @@ class DefaultStepFactory(GenericStepFactory):
             WorkflowBatchStep,
             WorkflowActionStep,
             WorkflowAsynchronousStep,
+            WorkflowRemoteStep,
         ])
 
 
@@ -1,8 +1,9 @@
-import yaml
+import typing as t
 from pipeman.util.errors import StepNotFoundError, StepConfigurationError, WorkflowNotFoundError
 from autoinject import injector
 from pipeman.i18n import MultiLanguageString
 from pipeman.db import BaseObjectRegistry
+from pipeman.db.obj_registry import RegistryFileTracker
 from .steps import DefaultStepFactory
 
 
@@ -47,17 +48,26 @@ class WorkflowRegistry:
         self._steps.register_from_yaml(yaml_file)
 
     def register_workflows_from_dict(self, d: dict):
+        workflows = {}
         for cat_name in d or {}:
+            # Settings under _defaults apply to every workflow in the category unless the workflow sets them
+            defaults = (d[cat_name] or {}).get("_defaults") or {}
             for obj_name in d[cat_name] or {}:
-                self.register_workflow(obj_name, cat_name, **d[cat_name][obj_name])
+                if obj_name == "_defaults":
+                    continue
+                workflows[f"{cat_name}__{obj_name}"] = {**defaults, **d[cat_name][obj_name]}
+        self._workflows.register_from_dict(workflows)
 
     def list_all_steps(self):
         for s in self._steps:
             yield s, self._steps[s]
 
-    def register_workflows_from_yaml(self, f):
-        with open(f, "r", encoding="utf-8") as h:
-            self.register_workflows_from_dict(yaml.safe_load(h))
+    @injector.inject
+    def register_workflows_from_yaml(self, f, tracker: RegistryFileTracker = None):
+        rf = tracker.load(f, ["workflow"])
+        if rf is not None:
+            self.register_workflows_from_dict(rf.content)
+            tracker.mark_imported(rf)
 
     def step_display(self, step_name):
         return MultiLanguageString(self._steps[step_name]['label'] if step_name in self._steps else {"und": step_name})
@@ -81,6 +91,14 @@ class WorkflowRegistry:
             raise WorkflowNotFoundError(key)
         return self._workflows[key]["steps"]
         
+    def workflow_scheduling(self, category_name, workflow_name) -> tuple[int, t.Optional[str]]:
+        """The priority and lane that new items of a workflow are given."""
+        key = f"{category_name}__{workflow_name}"
+        if key not in self._workflows:
+            return 0, None
+        config = self._workflows[key]
+        return int(config.get("priority") or 0), config.get("lane") or None
+
     def cleanup_step_list(self, category_name, workflow_name):
         key = f"{category_name}__{workflow_name}"
         if key not in self._workflows:
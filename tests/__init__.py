@@ -0,0 +1,138 @@
+"""Shared setup for the test suite.
+
+This package is imported before any of the test modules, so the source directory is added to the path here.
+pipeman.entity is also imported here first: pipeman.dataset and pipeman.builtins.api_mapper import each other, and
+importing pipeman.dataset (directly or through another package) before pipeman.entity fails on the partially
+initialized module. Loading pipeman.entity first resolves the cycle in an order that works.
+"""
+import datetime
+import os
+import pathlib
+import sys
+import tempfile
+import unittest as ut
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent / "src"))
+
+import flask
+import sqlalchemy as sa
+import zirconium as zr
+from autoinject import injector
+from sqlalchemy.pool import StaticPool
+
+import pipeman.entity
+from pipeman.auth import SecurityHelper
+from pipeman.db import Database
+from pipeman.db.obj_registry import GlobalObjectRegistry
+import pipeman.db.orm as orm
+
+
+# Timing comparisons are slow and print their results, so they only run when asked for
+benchmark = ut.skipUnless(os.environ.get("PIPEMAN_BENCHMARK"), "set PIPEMAN_BENCHMARK=1 to run benchmarks")
+
+
+class DatabaseTestCase(ut.TestCase):
+    """Runs each test against a new SQLite database, inside a Flask application context, with a temporary directory."""
+
+    # Use a file in the temporary directory instead of an in-memory database, for tests where other threads or
+    # processes open their own connections
+    file_database = False
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.app = flask.Flask("test")
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.addCleanup(self.ctx.pop)
+        self.db = injector.get(Database)
+        if self.file_database:
+            self.db_url = f"sqlite:///{(pathlib.Path(self.dir.name) / 'pipeman.sqlite').as_posix()}"
+            self.db.engine = sa.create_engine(self.db_url)
+        else:
+            self.db_url = None
+            self.db.engine = sa.create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        self.db._maker = None
+        orm.Base.metadata.create_all(self.db.engine)
+        self.addCleanup(self._close_database)
+
+    def _close_database(self):
+        self.db.engine.dispose()
+        self.db.engine = None
+        self.db._maker = None
+
+
+class WorkerProcessTestCase(DatabaseTestCase):
+    """For tests that start worker processes, which set themselves up from the configuration files."""
+
+    file_database = True
+
+    def setUp(self):
+        super().setUp()
+        (pathlib.Path(self.dir.name) / ".pipeman.toml").write_text(
+            f'[database]\nurl = "{self.db_url}"\n\n[flask]\nSECRET_KEY = "test"\n\n[pipeman.registry]\ncheck_seconds = 0\n',
+            encoding="utf-8"
+        )
+        old_paths = os.environ.get("PIPEMAN_CONFIG_SEARCH_PATHS")
+        os.environ["PIPEMAN_CONFIG_SEARCH_PATHS"] = self.dir.name
+        self.addCleanup(self._restore_config_paths, old_paths)
+
+    @staticmethod
+    def _restore_config_paths(old_paths):
+        if old_paths is None:
+            os.environ.pop("PIPEMAN_CONFIG_SEARCH_PATHS", None)
+        else:
+            os.environ["PIPEMAN_CONFIG_SEARCH_PATHS"] = old_paths
+
+
+class AppTestCase(DatabaseTestCase):
+    """For tests that go through the routes of the full web application (as self.web_app)."""
+
+    file_database = True
+
+    # The plugins and blueprints are registered on a process-wide object, so this is only done once
+    _system = None
+
+    def setUp(self):
+        super().setUp()
+        # The configuration files have already been loaded, so the settings are replaced directly
+        config = injector.get(zr.ApplicationConfig)
+        for key, value in (("database", {"url": self.db_url}), ("flask", {"SECRET_KEY": "test"})):
+            self.addCleanup(self._restore_config, config, key, config.get(key))
+            config[key] = value
+        if AppTestCase._system is None:
+            from pipeman.init import init as pipeman_init
+            AppTestCase._system = pipeman_init()
+        self.web_app = flask.Flask("pipeman")
+        AppTestCase._system.init_app(self.web_app)
+        self.addCleanup(injector.get(GlobalObjectRegistry).stop_watcher)
+
+    @staticmethod
+    def _restore_config(config, key, value):
+        if value is None:
+            config.pop(key, None)
+        else:
+            config[key] = value
+
+    def create_api_user(self, username: str, permissions: list) -> dict:
+        """Create a user with an API key and the given permissions, and return the headers to authenticate as them."""
+        sh = injector.get(SecurityHelper)
+        prefix = sh.generate_secret(32)
+        raw_key = sh.generate_secret(64)
+        salt = sh.generate_salt()
+        with self.db as session:
+            group = orm.Group(short_name=f"{username}_group", permissions=";".join(permissions))
+            user = orm.User(username=username, display=username, email=f"{username}@example.com", allowed_api_access=True)
+            user.groups.append(group)
+            session.add(user)
+            session.flush()
+            session.add(orm.APIKey(
+                user_id=user.id,
+                prefix=prefix,
+                key_hash=sh.hash_secret(raw_key, salt),
+                key_salt=salt,
+                expiry=datetime.datetime.now() + datetime.timedelta(days=1),
+                is_active=True
+            ))
+            session.commit()
+        return {"Authorization": f"Bearer {sh.build_auth_header(prefix, raw_key, username)}"}
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+import zirconium as zr
+from autoinject import injector
+
+from tests import DatabaseTestCase
+import pipeman.db.orm as orm
+from pipeman.workflow import WorkflowController, WorkflowRegistry
+import pipeman.workflow.async_engine as async_engine
+from pipeman.workflow.async_engine import AsyncWorkflowEngine
+
+
+_loop_threads = set()
+
+
+async def slow_io(step, context):
+    _loop_threads.add(threading.get_ident())
+    await asyncio.sleep(0.5)
+    context["done"] = True
+
+
+class TestAsyncWorkflowEngine(DatabaseTestCase):
+
+    file_database = True
+
+    def setUp(self):
+        super().setUp()
+        # The database threads of the engine open their own connections from the configuration
+        self.config = injector.get(zr.ApplicationConfig)
+        self.config["database"] = {"url": self.db_url}
+        self.reg = injector.get(WorkflowRegistry)
+        self.reg._steps._type_map["slow_io"] = {"step_type": "async", "coro": "tests.test_async_engine.slow_io"}
+        self.reg._workflows._type_map["test__slow"] = {"steps": ["slow_io"]}
+        self.wc = WorkflowController()
+        self.wc.db = self.db
+        self.wc.reg = self.reg
+        _loop_threads.clear()
+
+    def tearDown(self):
+        self.reg._steps._type_map.pop("slow_io", None)
+        self.reg._workflows._type_map.pop("test__slow", None)
+        self.config.pop("database", None)
+
+    def test_items_run_concurrently(self):
+        item_ids = []
+        for i in range(5):
+            status, item_id = self.wc.start_workflow("test", "slow", {"n": i}, i)
+            self.assertEqual(status, "ASYNC_EXECUTE")
+            item_ids.append(item_id)
+        engine = AsyncWorkflowEngine(threading.Event())
+        engine._max_items = 5
+        calls = []
+        original = async_engine._call_controller
+
+        def _tracked(method_name, *args, **kwargs):
+            calls.append((method_name, threading.get_ident()))
+            return original(method_name, *args, **kwargs)
+
+        async def _run():
+            start = time.monotonic()
+            await engine.run(until_idle=True)
+            return threading.get_ident(), time.monotonic() - start
+
+        async_engine._call_controller = _tracked
+        try:
+            loop_thread, elapsed = asyncio.run(_run())
+        finally:
+            async_engine._call_controller = original
+        self.assertLess(elapsed, 2.5)
+        self.assertEqual(_loop_threads, {loop_thread})
+        # Only the steps run on the event loop
+        self.assertNotIn(loop_thread, {thread for _, thread in calls})
+        names = [name for name, _ in calls]
+        self.assertEqual(names.count("prepare_async_item"), 5)
+        self.assertEqual(names.count("complete_async_item"), 5)
+        with self.db as session:
+            for item_id in item_ids:
+                self.assertEqual(session.get(orm.WorkflowItem, item_id).status, "COMPLETED")
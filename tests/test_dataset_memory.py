@@ -0,0 +1,47 @@
+import gc
+import tracemalloc
+import unittest as ut
+
+from pipeman.dataset import MetadataRegistry
+
+
+class TestDatasetMemory(ut.TestCase):
+
+    def setUp(self):
+        self.reg = MetadataRegistry()
+        self.reg._profiles._type_map["test"] = {
+            "display": {"en": "Test"},
+            "fields": {"title": {}, "abstract": {}},
+            "validation": {"required": ["title"]},
+        }
+        self.reg._fields._type_map["title"] = {"data_type": "text", "label": {"en": "Title"}}
+        self.reg._fields._type_map["abstract"] = {"data_type": "text", "label": {"en": "Abstract"}}
+
+    def _build_and_discard(self, count):
+        for i in range(count):
+            ds = self.reg.build_dataset(["test"], field_values={"title": f"Dataset {i}", "abstract": "Lorem ipsum"})
+            self.assertEqual(ds.data("title"), f"Dataset {i}")
+            ds.data("abstract", lang=None)
+
+    def test_data_memo_is_per_instance(self):
+        ds = self.reg.build_dataset(["test"], field_values={"title": "One"})
+        self.assertEqual(ds.data("title"), "One")
+        ds.get_field("title").set_from_raw("Two")
+        self.assertEqual(ds.data("title"), "Two")
+
+    def test_building_datasets_does_not_leak(self):
+        # Warm up caches (compiled schema, injector, etc.) before measuring
+        self._build_and_discard(500)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            self._build_and_discard(100)
+            gc.collect()
+            baseline, _ = tracemalloc.get_traced_memory()
+            self._build_and_discard(10000)
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # Keeping every dataset alive would cost tens of megabytes here
+        self.assertLess(current - baseline, 1024 * 1024)
@@ -0,0 +1,70 @@
+import json
+
+from autoinject import injector
+
+from tests import DatabaseTestCase
+import pipeman.db.orm as orm
+from pipeman.entity import EntityController, EntityRegistry
+from pipeman.entity.entity_field import EntityReferenceField
+
+
+class TestEntityReferenceField(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reg = injector.get(EntityRegistry)
+        self.reg._type_map["test_contact"] = {
+            "display": {"en": "Contact"},
+            "fields": {"name": {"data_type": "text", "label": {"en": "Name"}}},
+        }
+        self.addCleanup(self.reg._type_map.pop, "test_contact", None)
+        with self.db as session:
+            self.ids = []
+            for i in range(3):
+                entity = orm.Entity(entity_type="test_contact", is_deprecated=False, latest_revision_no=2)
+                session.add(entity)
+                session.flush()
+                for rev_no in (1, 2):
+                    session.add(orm.EntityData(
+                        entity_id=entity.id,
+                        revision_no=rev_no,
+                        data=json.dumps({"name": f"Contact {i} rev {rev_no}"})
+                    ))
+                self.ids.append(entity.id)
+            session.commit()
+        self.ec = EntityController()
+        self.calls = {"load_entity": 0, "load_entities": 0}
+        for name in self.calls:
+            self._count(name)
+
+    def _count(self, name):
+        original = getattr(self.ec, name)
+
+        def _counted(*args, **kwargs):
+            self.calls[name] += 1
+            return original(*args, **kwargs)
+
+        setattr(self.ec, name, _counted)
+
+    def _field(self, value):
+        field = EntityReferenceField("contacts", {"data_type": "entity_ref", "entity_type": "test_contact", "repeatable": True})
+        field.ec = self.ec
+        field.value = value
+        return field
+
+    def test_loads_references_in_bulk(self):
+        a, b, c = self.ids
+        field = self._field([str(a), f"{b}|1", f"{a}|1", f"{a}|2", f"{c}|1", str(c)])
+        names = [entity.data("name") for entity in field.data()]
+        self.assertEqual(names, [
+            "Contact 0 rev 2",
+            "Contact 1 rev 1",
+            "Contact 0 rev 1",
+            "Contact 0 rev 2",
+            "Contact 2 rev 1",
+            "Contact 2 rev 2",
+        ])
+        # One call for the latest revisions, and one per revision of the entity referenced most often
+        self.assertEqual(self.calls, {"load_entity": 0, "load_entities": 3})
+        field.data()
+        self.assertEqual(self.calls, {"load_entity": 0, "load_entities": 3})
@@ -0,0 +1,74 @@
+import jinja2
+from autoinject import injector
+
+from tests import AppTestCase
+import pipeman.db.orm as orm
+from pipeman.dataset import MetadataRegistry
+
+
+class TestMetadataConditionalGet(AppTestCase):
+    """Requests generated metadata files with If-None-Match, through the full application."""
+
+    def setUp(self):
+        super().setUp()
+        reg = injector.get(MetadataRegistry)
+        reg._profiles._type_map["test_profile"] = {
+            "display": {"en": "Test"},
+            "formatters": {"text": {"template": "test_metadata.txt", "label": {"en": "Text"}}}
+        }
+        self.addCleanup(reg._profiles._type_map.pop, "test_profile", None)
+        self.web_app.jinja_env.loader = jinja2.ChoiceLoader([
+            jinja2.DictLoader({"test_metadata.txt": "Dataset {{ dataset.dataset_id }}"}),
+            self.web_app.jinja_env.loader,
+        ])
+        with self.db as session:
+            ds = orm.Dataset(
+                is_deprecated=False,
+                profiles="test_profile",
+                pub_workflow="default",
+                act_workflow="default",
+                status="ACTIVE",
+                security_level="unclassified",
+                guid="guid",
+                latest_revision_no=1
+            )
+            session.add(ds)
+            session.flush()
+            session.add(orm.MetadataEdition(dataset_id=ds.id, revision_no=1, data="{}"))
+            session.commit()
+            self.dataset_id = ds.id
+        self.path = f"/api/datasets/{self.dataset_id}/1/test_profile/text/live"
+        self.reader = self.create_api_user("reader", ["datasets.view", "datasets.view.all"])
+        self.outsider = self.create_api_user("outsider", ["datasets.view"])
+
+    def _get(self, headers, etag=None):
+        headers = dict(headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.web_app.test_client().get(self.path, headers=headers)
+
+    def test_matching_etag(self):
+        resp = self._get(self.reader)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_data(as_text=True), f"Dataset {self.dataset_id}")
+        etag = resp.headers["ETag"]
+        resp = self._get(self.reader, etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.get_data(), b"")
+        self.assertEqual(resp.headers["ETag"], etag)
+
+    def test_stale_etag(self):
+        etag = self._get(self.reader).headers["ETag"]
+        with self.db as session:
+            session.query(orm.MetadataEdition).filter_by(dataset_id=self.dataset_id).one().data = '{"changed": true}'
+            session.commit()
+        resp = self._get(self.reader, etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(self._get(self.reader, '"something-else"').status_code, 200)
+
+    def test_no_access(self):
+        etag = self._get(self.reader).headers["ETag"]
+        self.assertEqual(self._get(self.outsider).status_code, 403)
+        self.assertEqual(self._get(self.outsider, etag).status_code, 403)
+        self.assertEqual(self._get({}, etag).status_code, 403)
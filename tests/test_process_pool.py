@@ -0,0 +1,117 @@
+import os
+import pathlib
+import threading
+import time
+
+from tests import WorkerProcessTestCase
+import pipeman.db.orm as orm
+from pipeman.workflow import WorkflowRegistry
+from pipeman.workflow.process_pool import StepProcessPool
+from pipeman.workflow.steps import ItemResult
+
+
+def double_value(step, context):
+    context["value"] = context["value"] * 2
+    step.output.append(f"doubled in {os.getpid()}")
+    return ItemResult.SUCCESS
+
+
+def sleep_forever(step, context):
+    if "started" in context:
+        pathlib.Path(context["started"]).write_text(str(os.getpid()), encoding="utf-8")
+    time.sleep(60)
+
+
+def double_when_ready(step, context):
+    ready = pathlib.Path(context.pop("wait_for"))
+    deadline = time.monotonic() + 30
+    while not ready.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return double_value(step, context)
+
+
+class TestStepProcessPool(WorkerProcessTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reg = WorkflowRegistry()
+        self.reg.register_steps_from_dict({
+            "double": {"step_type": "batch", "action": "tests.test_process_pool.double_value", "execution": "process"},
+            "sleep": {"step_type": "batch", "action": "tests.test_process_pool.sleep_forever", "execution": "process"},
+            "wait": {"step_type": "batch", "action": "tests.test_process_pool.double_when_ready", "execution": "process"},
+        })
+        with self.db as session:
+            item = orm.WorkflowItem(workflow_type="test", workflow_name="double", status="BATCH_IN_PROGRESS")
+            session.add(item)
+            session.commit()
+            self.item_id = item.id
+        self.pool = StepProcessPool()
+        self.pool._size = 1
+        self.pool._config_files = []
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_runs_step_in_worker(self):
+        step = self.reg.construct_step("double")
+        context = {"value": 21}
+        self.assertEqual(self.pool.run_batch(step, self.item_id, context), ItemResult.SUCCESS)
+        self.assertEqual(context["value"], 42)
+        self.assertEqual(len(step.output), 1)
+        self.assertNotEqual(step.output[0], f"doubled in {os.getpid()}")
+
+    def test_timeout(self):
+        self.pool._timeout = 3
+        step = self.reg.construct_step("sleep")
+        start = time.monotonic()
+        self.assertEqual(self.pool.run_batch(step, self.item_id, {}), ItemResult.FAILURE)
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertIn("timed out", step.output[-1])
+        # A new worker is started for the next step
+        step = self.reg.construct_step("double")
+        context = {"value": 1}
+        self.assertEqual(self.pool.run_batch(step, self.item_id, context), ItemResult.SUCCESS)
+        self.assertEqual(context["value"], 2)
+
+    def test_timeout_only_stops_its_worker(self):
+        self.pool._size = 2
+        # Start both workers before timing anything
+        warm_up = [
+            threading.Thread(target=self.pool.run_batch, args=(self.reg.construct_step("double"), self.item_id, {"value": 1}))
+            for _ in range(2)
+        ]
+        for thread in warm_up:
+            thread.start()
+        for thread in warm_up:
+            thread.join()
+        self.assertEqual(len(self.pool._idle), 2)
+        self.pool._timeout = 4
+        started = pathlib.Path(self.dir.name) / "started"
+        timed_out = pathlib.Path(self.dir.name) / "timed_out"
+        results = {}
+
+        def _run(name, step_name, context):
+            step = self.reg.construct_step(step_name)
+            results[name] = (self.pool.run_batch(step, self.item_id, context), step.output, context)
+
+        sleeper = threading.Thread(target=_run, args=("sleep", "sleep", {"started": str(started)}))
+        sleeper.start()
+        while not started.exists():
+            time.sleep(0.05)
+        # Started later, this step is still running when the other one times out, and only finishes afterwards
+        time.sleep(1.5)
+        waiter = threading.Thread(target=_run, args=("wait", "wait", {"value": 21, "wait_for": str(timed_out)}))
+        waiter.start()
+        sleeper.join()
+        timed_out.touch()
+        waiter.join()
+        self.assertEqual(results["sleep"][0], ItemResult.FAILURE)
+        self.assertIn("timed out", results["sleep"][1][-1])
+        result, output, context = results["wait"]
+        self.assertEqual(result, ItemResult.SUCCESS)
+        self.assertEqual(context, {"value": 42})
+        # The worker that ran the second step is still in the pool, the other one was stopped
+        self.assertEqual(len(self.pool._idle), 1)
+        self.assertTrue(self.pool._idle[0].process.is_alive())
+        self.assertEqual(output, [f"doubled in {self.pool._idle[0].process.pid}"])
+        self.assertNotEqual(started.read_text(encoding="utf-8"), str(self.pool._idle[0].process.pid))
@@ -0,0 +1,216 @@
+import gc
+import json
+import pathlib
+import tempfile
+import threading
+import time
+
+import flask
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+from tests import DatabaseTestCase, benchmark
+from pipeman.db import BaseObjectRegistry
+from pipeman.db.obj_registry import GlobalObjectRegistry, ObjectController, RegistrySnapshot
+from pipeman.dbconfig import ValueController
+from pipeman.vocab import VocabularyRegistry
+from pipeman.vocab.vocab import VocabularyTermController
+import pipeman.db.orm as orm
+
+
+class _Cache:
+
+    def __init__(self):
+        self.reloads = 0
+
+    def reload_types(self):
+        self.reloads += 1
+
+
+class TestRegistryVersions(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.gor = GlobalObjectRegistry()
+        self.cache = _Cache()
+        self.gor.register(self.cache)
+        self.registries = {}
+        for obj_type in ("alpha", "beta", "gamma"):
+            reg = BaseObjectRegistry(obj_type)
+            # Keep these away from the process-wide registry used by other tests
+            reg.__cleanup__()
+            self.gor.register(reg)
+            self.registries[obj_type] = reg
+
+    def tearDown(self):
+        for reg in self.registries.values():
+            self.gor.unregister(reg)
+
+    def _populate(self, count):
+        for obj_type, reg in self.registries.items():
+            reg.register_from_dict({f"{obj_type}{i}": {"display": {"en": f"Object {i}"}, "order": i} for i in range(count)})
+
+    def _count_reloads(self):
+        counts = {}
+        for obj_type, reg in self.registries.items():
+            original = reg.reload_types
+
+            def _wrapped(_original=original, _obj_type=obj_type):
+                counts[_obj_type] = counts.get(_obj_type, 0) + 1
+                _original()
+
+            reg.reload_types = _wrapped
+        return counts
+
+    def test_reloads_only_changed_types(self):
+        self._populate(3)
+        self.gor.mark_versions()
+        counts = self._count_reloads()
+        self.assertEqual(self.gor.check_all(), [])
+        self.assertEqual(counts, {})
+        self.assertEqual(self.cache.reloads, 0)
+        other = BaseObjectRegistry("beta")
+        other.__cleanup__()
+        other.register("beta_new", display={"en": "New"})
+        self.assertEqual(self.gor.check_all(), ["beta"])
+        self.assertEqual(counts, {"beta": 1})
+        self.assertEqual(self.cache.reloads, 1)
+        self.assertIn("beta_new", self.registries["beta"])
+
+    def test_clear_bumps_version(self):
+        self._populate(2)
+        self.gor.mark_versions()
+        self.registries["gamma"].remove_all()
+        self.assertEqual(self.gor.check_all(), ["gamma"])
+        self.assertNotIn("gamma0", self.registries["gamma"])
+        self.assertIn("alpha0", self.registries["alpha"])
+
+    def test_concurrent_bumps(self):
+        with tempfile.TemporaryDirectory() as d:
+            engine = sa.create_engine(f"sqlite:///{(pathlib.Path(d) / 'pipeman.sqlite').as_posix()}")
+            orm.Base.metadata.create_all(engine)
+            start = threading.Barrier(4)
+            errors = []
+
+            def _bump_many(count):
+                start.wait()
+                try:
+                    for _ in range(count):
+                        with sa.orm.Session(engine) as session:
+                            ObjectController.bump_version(session, "delta")
+                            session.commit()
+                except Exception as ex:
+                    errors.append(ex)
+
+            threads = [threading.Thread(target=_bump_many, args=(25,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with sa.orm.Session(engine) as session:
+                value = session.query(orm.KeyValue).filter_by(key="registry_version.delta").one().value
+            engine.dispose()
+        self.assertEqual(errors, [])
+        self.assertEqual(json.loads(value), 100)
+
+    def test_bulk_import_skips_unchanged_files(self):
+        reg = self.registries["alpha"]
+        with tempfile.TemporaryDirectory() as d:
+            path = pathlib.Path(d) / "alpha.yaml"
+            path.write_text("one:\n  display:\n    en: One\ntwo:\n  order: 2\n", encoding="utf-8")
+            reg.register_from_yaml(path)
+            self.gor.mark_versions()
+            reg.register_from_yaml(path)
+            self.assertEqual(self.gor.check_all(), [])
+            reg.register("two", order=3)
+            # The type changed since the file was imported, so it is applied again
+            reg.register_from_yaml(path)
+            self.assertEqual(reg["two"]["order"], 2)
+            path.write_text("one:\n  display:\n    fr: Un\n", encoding="utf-8")
+            reg.register_from_yaml(path)
+            self.assertEqual(reg["one"]["display"], {"en": "One", "fr": "Un"})
+        reg.reload_types()
+        self.assertEqual(reg["one"]["display"], {"en": "One", "fr": "Un"})
+        self.assertEqual(reg["two"]["order"], 2)
+
+    def test_bulk_vocabulary_terms(self):
+        vreg = VocabularyRegistry()
+        vreg.__cleanup__()
+        vtc = VocabularyTermController()
+        vreg.register_from_dict({
+            "colours": {"display": {"en": "Colours"}, "terms": {
+                "red": {"display": {"en": "Red"}},
+                "blue": {"display": {"en": "Blue"}, "description": {"en": "Sky"}},
+            }},
+        })
+        vreg.register_from_dict({
+            "colours": {"terms": {
+                "red": {"display": {"fr": "Rouge"}},
+                "green": None,
+            }},
+        })
+        self.assertEqual({term[0] for term in vtc.list_terms("colours")}, {"red", "blue", "green"})
+        self.assertNotIn("terms", vreg["colours"])
+        term = vtc.cache.find_term("colours", "red")
+        self.assertEqual(term.display_names, {"en": "Red", "fr": "Rouge"})
+        self.assertEqual(vtc.cache.find_term("colours", "blue").descriptions, {"en": "Sky"})
+
+    def test_snapshot(self):
+        self._populate(3)
+        with tempfile.TemporaryDirectory() as d:
+            snapshot = RegistrySnapshot()
+            snapshot.path = pathlib.Path(d) / "registries.pickle"
+            versions = self.gor.mark_versions()
+            self.assertIsNone(snapshot.read(versions))
+            snapshot.write(versions, self.gor.type_maps())
+            type_maps = snapshot.read(versions)
+            self.assertEqual(type_maps["beta"]["beta1"], {"display": {"en": "Object 1"}, "order": 1})
+            self.registries["alpha"].register("alpha_new", order=10)
+            self.assertIsNone(snapshot.read(self.gor.mark_versions()))
+            self.gor.load_type_maps(type_maps)
+            self.assertNotIn("alpha_new", self.registries["alpha"])
+            self.assertIn("gamma2", self.registries["gamma"])
+
+    @benchmark
+    def test_teardown_overhead(self):
+        """Compares the per-request teardown work before and after moving registry checks to a background thread."""
+        self._populate(200)
+        self.gor.mark_versions()
+        vc = ValueController()
+        vc.set_value("setup_last_run", "2024-01-01 00:00:00")
+        requests = 50
+
+        def _legacy_check():
+            # Previously every request ran gc.collect() and, at most once a minute, a setup_last_run lookup that
+            # reloaded every registry when it changed
+            vc.get_value("setup_last_run")
+            gc.collect()
+
+        app = flask.Flask("bench")
+
+        @app.route("/")
+        def index():
+            return "ok"
+
+        def _time_requests(teardown):
+            app.teardown_request_funcs[None] = [teardown] if teardown else []
+            client = app.test_client()
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get("/")
+            return (time.perf_counter() - start) / requests
+
+        before = _time_requests(lambda exc: _legacy_check())
+        after = _time_requests(None)
+        start = time.perf_counter()
+        for _ in range(requests):
+            self.gor.check_all()
+        check_time = (time.perf_counter() - start) / requests
+        start = time.perf_counter()
+        for reg in self.registries.values():
+            reg.reload_types()
+        full_reload = time.perf_counter() - start
+        print(
+            f"\nper request: before {before * 1000:.3f}ms, after {after * 1000:.3f}ms; "
+            f"background version check {check_time * 1000:.3f}ms; full reload {full_reload * 1000:.3f}ms"
+        )
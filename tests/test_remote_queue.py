@@ -0,0 +1,166 @@
+from autoinject import injector
+
+from tests import AppTestCase, DatabaseTestCase
+import pipeman.db.orm as orm
+from pipeman.util.errors import RemoteLeaseError
+from pipeman.workflow import WorkflowController, WorkflowRegistry
+from pipeman.workflow.remote import LocalRemoteQueue, RemoteWorker
+
+
+class TestRemoteQueue(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reg = WorkflowRegistry()
+        self.reg._steps._type_map["scan"] = {"step_type": "remote", "pipeline": "netcdf", "parameters": {"deep": True}}
+        self.reg._steps._type_map["after"] = {"step_type": "action", "action": "pipeman.workflow.steps.noop"}
+        self.reg._workflows._type_map["test__scan"] = {"steps": ["scan", "after"]}
+        self.wc = WorkflowController()
+        self.wc.db = self.db
+        self.wc.reg = self.reg
+
+    def _start(self):
+        status, item_id = self.wc.start_workflow("test", "scan", {"file": "a.nc"}, 1)
+        self.assertEqual(status, "REMOTE_EXEC_QUEUED")
+        return item_id
+
+    def test_lease_is_filtered_by_pipeline(self):
+        item_id = self._start()
+        self.assertIsNone(self.wc.lease_remote_item("erddap"))
+        info = self.wc.lease_remote_item("netcdf")
+        self.assertEqual(info["item_id"], item_id)
+        self.assertEqual(info["parameters"], {"deep": True})
+        self.assertEqual(info["context"]["file"], "a.nc")
+        self.assertIsNone(self.wc.lease_remote_item("netcdf"))
+
+    def test_renew_and_release(self):
+        self._start()
+        info = self.wc.lease_remote_item("netcdf")
+        self.wc.renew_remote_item(info["item_id"], info["lease_token"])
+        with self.assertRaises(RemoteLeaseError):
+            self.wc.renew_remote_item(info["item_id"], "other")
+        self.assertFalse(self.wc.release_remote_item(info["item_id"], "other"))
+        self.assertTrue(self.wc.release_remote_item(info["item_id"], info["lease_token"]))
+        with self.assertRaises(RemoteLeaseError):
+            self.wc.renew_remote_item(info["item_id"], info["lease_token"])
+        self.assertEqual(self.wc.lease_remote_item("netcdf")["item_id"], info["item_id"])
+
+    def test_expired_leases_are_reset(self):
+        self._start()
+        info = self.wc.lease_remote_item("netcdf", lease_seconds=-1)
+        self.assertEqual(self.wc.reset_remote_items(), 1)
+        with self.assertRaises(RemoteLeaseError):
+            self.wc.complete_remote_item(info["item_id"], info["lease_token"], True)
+
+    def test_completion_is_idempotent(self):
+        item_id = self._start()
+        info = self.wc.lease_remote_item("netcdf")
+        result = self.wc.complete_remote_item(item_id, info["lease_token"], True, ["scanned"], {"variables": 3})
+        self.assertEqual(result["status"], "COMPLETED")
+        self.assertFalse(result["already_completed"])
+        again = self.wc.complete_remote_item(item_id, info["lease_token"], True)
+        self.assertTrue(again["already_completed"])
+        with self.assertRaises(RemoteLeaseError):
+            self.wc.complete_remote_item(item_id, info["lease_token"], False)
+        with self.db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            self.assertIn('"variables": 3', item.context)
+            self.assertIn("scanned", item.step_output)
+            self.assertEqual(session.query(orm.WorkflowDecision).filter_by(workflow_item_id=item_id).count(), 1)
+
+    def test_local_worker(self):
+        item_ids = [self._start(), self._start()]
+        seen = []
+
+        def handler(item):
+            seen.append(item.item_id)
+            item.output.append("done")
+            return item.item_id == item_ids[0]
+
+        worker = RemoteWorker(LocalRemoteQueue(self.wc), "netcdf", handler)
+        self.assertTrue(worker.run_once())
+        self.assertTrue(worker.run_once())
+        self.assertFalse(worker.run_once())
+        self.assertEqual(seen, item_ids)
+        with self.db as session:
+            statuses = [session.query(orm.WorkflowItem).filter_by(id=x).first().status for x in item_ids]
+        self.assertEqual(statuses, ["COMPLETED", "CANCELLED"])
+
+    def test_worker_releases_on_error(self):
+        item_id = self._start()
+
+        def handler(item):
+            raise ValueError("bad file")
+
+        worker = RemoteWorker(LocalRemoteQueue(self.wc), "netcdf", handler)
+        # Released items are not leased again right away
+        self.assertFalse(worker.run_once())
+        with self.db as session:
+            self.assertEqual(session.query(orm.WorkflowItem).filter_by(id=item_id).first().status, "REMOTE_EXEC_QUEUED")
+
+    def test_worker_cancels_after_repeated_errors(self):
+        item_id = self._start()
+        calls = []
+
+        def handler(item):
+            calls.append(item.item_id)
+            raise ValueError("bad file")
+
+        worker = RemoteWorker(LocalRemoteQueue(self.wc), "netcdf", handler, max_failures=3)
+        self.assertFalse(worker.run_once())
+        self.assertFalse(worker.run_once())
+        self.assertTrue(worker.run_once())
+        self.assertFalse(worker.run_once())
+        self.assertEqual(calls, [item_id] * 3)
+        with self.db as session:
+            item = session.query(orm.WorkflowItem).filter_by(id=item_id).first()
+            self.assertEqual(item.status, "CANCELLED")
+            self.assertIn("failed 3 times", item.step_output)
+
+
+class TestRemoteItemRoutes(AppTestCase):
+    """Calls the remote item API the same way as HttpRemoteQueue, through the full application."""
+
+    def setUp(self):
+        super().setUp()
+        self.reg = injector.get(WorkflowRegistry)
+        self.reg._steps._type_map["scan"] = {"step_type": "remote", "pipeline": "netcdf"}
+        self.reg._workflows._type_map["test__scan"] = {"steps": ["scan"]}
+        self.addCleanup(self.reg._steps._type_map.pop, "scan", None)
+        self.addCleanup(self.reg._workflows._type_map.pop, "test__scan", None)
+        self.auth = self.create_api_user("worker", ["remote_items.access"])
+        wc = WorkflowController()
+        wc.db = self.db
+        wc.reg = self.reg
+        _, self.item_id = wc.start_workflow("test", "scan", {"file": "a.nc"}, 1)
+
+    def _post(self, client, path, lease_token=None, body=None):
+        headers = dict(self.auth)
+        if lease_token:
+            headers["X-Lease-Token"] = lease_token
+        return client.post(path, json=body or {}, headers=headers)
+
+    def test_lease_renew_complete(self):
+        client = self.web_app.test_client()
+        self.assertEqual(client.post("/api/pop-remote-item/netcdf", json={}).status_code, 403)
+        resp = self._post(client, "/api/pop-remote-item/netcdf")
+        self.assertEqual(resp.status_code, 200)
+        info = resp.get_json()
+        self.assertEqual(info["item_id"], self.item_id)
+        self.assertEqual(self._post(client, "/api/pop-remote-item/netcdf").status_code, 204)
+        resp = self._post(client, f"/api/renew-remote-item/{self.item_id}", info["lease_token"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._post(client, f"/api/renew-remote-item/{self.item_id}", "other").status_code, 409)
+        self.assertEqual(self._post(client, f"/api/renew-remote-item/{self.item_id}").status_code, 400)
+        resp = self._post(
+            client,
+            f"/api/complete-remote-item/{self.item_id}",
+            info["lease_token"],
+            {"output": ["scanned"], "context": {"variables": 3}}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()["status"], "COMPLETED")
+        with self.db as session:
+            item = session.get(orm.WorkflowItem, self.item_id)
+            self.assertEqual(item.status, "COMPLETED")
+            self.assertIn("scanned", item.step_output)
@@ -0,0 +1,191 @@
+import datetime
+import os
+import pathlib
+import time
+
+import jinja2
+from autoinject import injector
+
+from tests import DatabaseTestCase
+from pipeman.db.obj_registry import GlobalObjectRegistry
+from pipeman.dataset.render_cache import DiskRenderCache, MemoryRenderCache, RenderedMetadataCache, TieredRenderCache
+
+
+class TestRenderedMetadataCache(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.templates = {"test.xml": "<test>{{ dataset.dataset_id }}</test>"}
+        self.app.jinja_env.loader = jinja2.DictLoader(self.templates)
+        self.cache = RenderedMetadataCache()
+        self.addCleanup(injector.get(GlobalObjectRegistry).unregister, self.cache)
+        self.cache.backend = MemoryRenderCache()
+        self.modified = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+    def _key(self, **kwargs):
+        args = {
+            "dataset_id": 1,
+            "metadata_id": 10,
+            "modified_date": self.modified,
+            "metadata_modified_date": self.modified,
+            "profile_name": "test",
+            "format_name": "xml",
+            "environment": "live",
+            "formatter": {"template": "test.xml"},
+            "template_name": "test.xml",
+        }
+        args.update(kwargs)
+        return self.cache.build_key(**args)
+
+    def _set_template_version(self, version):
+        self.cache.config.deep_update({"pipeman": {"metadata_cache": {"template_version": version}}})
+
+    def test_key_changes(self):
+        key = self._key()
+        self.assertEqual(self._key(), key)
+        keys = {key}
+        for changed in (
+                {"modified_date": self.modified + datetime.timedelta(seconds=1)},
+                {"metadata_modified_date": self.modified + datetime.timedelta(seconds=1)},
+                {"metadata_id": 11},
+                {"environment": "test"},
+                {"formatter": {"template": "test.xml", "content_type": "text/xml"}}):
+            keys.add(self._key(**changed))
+        self.assertEqual(len(keys), 6)
+
+    def test_entity_change(self):
+        key = self._key()
+        with self.db as session:
+            self.cache.entity_changes.mark_changed(session)
+            session.commit()
+        self.assertNotEqual(self._key(), key)
+
+    def test_vocabulary_change(self):
+        key = self._key()
+        with self.db as session:
+            self.cache.term_cache.mark_changed(session)
+            session.commit()
+        self.assertNotEqual(self._key(), key)
+
+    def test_template_version(self):
+        key = self._key()
+        self.addCleanup(self._set_template_version, "")
+        self._set_template_version("2")
+        configured_key = self._key()
+        self.assertNotEqual(configured_key, key)
+        self.templates["test.xml"] = "<test id='{{ dataset.dataset_id }}' />"
+        self.assertNotEqual(self._key(), configured_key)
+
+    def test_generation_change_clears_entries(self):
+        key = self._key()
+        self.cache.backend.put(1, key, ("<test />", "text/xml", "utf-8", "xml"))
+        self.assertIsNotNone(self.cache.backend.get(1, key))
+        with self.db as session:
+            self.cache.term_cache.mark_changed(session)
+            session.commit()
+        self.cache.generation()
+        self.assertIsNone(self.cache.backend.get(1, key))
+
+    def test_get_or_render(self):
+        class _Dataset:
+            dataset_id = 1
+
+        calls = []
+
+        def _render():
+            calls.append(1)
+            return "<test />", "text/xml", "utf-8", "xml"
+
+        key = self._key()
+        self.assertEqual(self.cache.get_or_render(_Dataset(), key, _render)[0], "<test />")
+        self.assertEqual(self.cache.get_or_render(_Dataset(), key, _render)[0], "<test />")
+        self.assertEqual(len(calls), 1)
+        self.cache.invalidate_dataset(1)
+        self.cache.get_or_render(_Dataset(), key, _render)
+        self.assertEqual(len(calls), 2)
+
+    def test_invalidate_dataset(self):
+        value = ("<test />", "text/xml", "utf-8", "xml")
+        self.cache.backend.put(1, "a", value)
+        self.cache.backend.put(1, "b", value)
+        self.cache.backend.put(2, "a", value)
+        self.cache.invalidate_dataset(1)
+        self.assertIsNone(self.cache.backend.get(1, "a"))
+        self.assertIsNone(self.cache.backend.get(1, "b"))
+        self.assertEqual(self.cache.backend.get(2, "a"), value)
+
+
+class TestRenderCacheBackends(DatabaseTestCase):
+
+    value = ("<test />", "text/xml", "utf-8", "xml")
+
+    def _disk(self, **kwargs):
+        return DiskRenderCache(pathlib.Path(self.dir.name) / "render_cache", **kwargs)
+
+    def _check_backend(self, backend):
+        self.assertIsNone(backend.get(1, "a"))
+        backend.put(1, "a", self.value)
+        backend.put(1, "b", self.value)
+        backend.put(2, "a", ("<other />", "text/xml", "utf-8", "xml"))
+        self.assertEqual(backend.get(1, "a"), self.value)
+        self.assertEqual(backend.get(2, "a")[0], "<other />")
+        backend.invalidate_dataset(1)
+        self.assertIsNone(backend.get(1, "a"))
+        self.assertIsNone(backend.get(1, "b"))
+        self.assertIsNotNone(backend.get(2, "a"))
+        backend.clear()
+        self.assertIsNone(backend.get(2, "a"))
+
+    def test_memory(self):
+        self._check_backend(MemoryRenderCache())
+
+    def test_memory_evicts_oldest(self):
+        backend = MemoryRenderCache(max_entries=2)
+        backend.put(1, "a", self.value)
+        backend.put(1, "b", self.value)
+        backend.get(1, "a")
+        backend.put(1, "c", self.value)
+        self.assertIsNone(backend.get(1, "b"))
+        self.assertIsNotNone(backend.get(1, "a"))
+
+    def test_disk(self):
+        backend = self._disk()
+        self._check_backend(backend)
+        backend.put(3, "a", self.value)
+        # Entries are shared with other workers on the same host through the directory
+        self.assertEqual(self._disk().get(3, "a"), self.value)
+        self.assertEqual(list((pathlib.Path(self.dir.name) / "render_cache").glob("**/*.tmp")), [])
+
+    def test_disk_expiry(self):
+        backend = self._disk(max_age_seconds=60)
+        backend.put(1, "a", self.value)
+        path = pathlib.Path(self.dir.name) / "render_cache" / "1" / "a.json"
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        self.assertIsNone(backend.get(1, "a"))
+        self.assertFalse(path.exists())
+
+    def test_disk_unreadable_entry(self):
+        backend = self._disk()
+        backend.put(1, "a", self.value)
+        (pathlib.Path(self.dir.name) / "render_cache" / "1" / "a.json").write_text("{", encoding="utf-8")
+        self.assertIsNone(backend.get(1, "a"))
+
+    def test_tiered(self):
+        self._check_backend(TieredRenderCache(MemoryRenderCache(), self._disk()))
+
+    def test_tiered_fills_front(self):
+        front = MemoryRenderCache()
+        back = self._disk()
+        backend = TieredRenderCache(front, back)
+        backend.put(1, "a", self.value)
+        self.assertEqual(front.get(1, "a"), self.value)
+        self.assertEqual(back.get(1, "a"), self.value)
+        # Another worker only has the shared copy
+        other_front = MemoryRenderCache()
+        other = TieredRenderCache(other_front, self._disk())
+        self.assertEqual(other.get(1, "a"), self.value)
+        self.assertEqual(other_front.get(1, "a"), self.value)
+        other.invalidate_dataset(1)
+        self.assertIsNone(other_front.get(1, "a"))
+        self.assertIsNone(back.get(1, "a"))
@@ -0,0 +1,45 @@
+import unittest as ut
+
+from tests import WorkerProcessTestCase
+import pipeman.db.orm as orm
+from pipeman.dataset.republish import BulkRepublisher, RepublishReport
+from pipeman.workflow.steps import StepStatus
+
+
+class TestRepublishReport(ut.TestCase):
+
+    def test_record(self):
+        report = RepublishReport()
+        report.record(1, StepStatus.COMPLETED.value)
+        report.record(2, StepStatus.BATCH_EXECUTE.value)
+        report.record(3, StepStatus.FAILURE.value)
+        report.record(4, None)
+        report.record(5, None, "ValueError: bad")
+        self.assertEqual(
+            (report.processed, report.published, report.in_progress, report.not_published, len(report.failures)),
+            (5, 1, 1, 1, 2)
+        )
+
+
+class TestProcessRepublish(WorkerProcessTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.db as session:
+            for i in range(3):
+                session.add(orm.Dataset(
+                    is_deprecated=False,
+                    profiles="",
+                    pub_workflow="default",
+                    act_workflow="default",
+                    status="ACTIVE",
+                    security_level="unclassified",
+                    guid=f"guid{i}"
+                ))
+            session.commit()
+
+    def test_process_mode(self):
+        republisher = BulkRepublisher(workers=2, mode="process")
+        report = republisher.run()
+        # None of the datasets have a published revision, but each one was handled by a worker process
+        self.assertEqual((report.processed, report.not_published, len(report.failures)), (3, 3, 0), report.failures)
@@ -0,0 +1,24 @@
+import unittest as ut
+
+from pipeman.workflow.steps import RetryPolicy
+
+
+class TestRetryPolicy(ut.TestCase):
+
+    def test_backoff(self):
+        policy = RetryPolicy(initial_delay_seconds=60, max_delay_seconds=3600, multiplier=2, jitter=0)
+        self.assertEqual([policy.next_delay(a) for a in range(1, 9)], [60, 120, 240, 480, 960, 1920, 3600, 3600])
+
+    def test_large_attempt_counts(self):
+        policy = RetryPolicy(jitter=0)
+        for attempt in (1030, 100000, 10 ** 12):
+            self.assertEqual(policy.next_delay(attempt), 3600)
+        self.assertEqual(RetryPolicy(initial_delay_seconds=0, jitter=0).next_delay(5000), 0)
+        self.assertEqual(RetryPolicy(initial_delay_seconds=10, max_delay_seconds=5, jitter=0).next_delay(5000), 5)
+        delay = RetryPolicy(jitter=0.1).next_delay(5000)
+        self.assertTrue(3240 <= delay <= 3960)
+
+    def test_max_attempts(self):
+        policy = RetryPolicy(max_attempts=3, jitter=0)
+        self.assertEqual(policy.next_delay(3), 240)
+        self.assertIsNone(policy.next_delay(4))
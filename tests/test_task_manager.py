@@ -0,0 +1,84 @@
+import threading
+import unittest as ut
+
+import flask
+
+from pipeman.util.cron import UniqueTaskThreadManager, TaskState
+
+
+class TestUniqueTaskThreadManager(ut.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask("test")
+        self.halt = threading.Event()
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.started = threading.Semaphore(0)
+
+    def tearDown(self):
+        self.release.set()
+
+    def _task(self, st):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.started.release()
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+
+    def test_caps_concurrency(self):
+        tasks = UniqueTaskThreadManager(self.app, self.halt, 2, name="test_cap")
+        for i in range(5):
+            tasks.execute(f"task{i}", self._task)
+        tasks.sow()
+        self.assertEqual(tasks.queue_depth(), 3)
+        self.assertEqual(tasks.job_state("task0"), TaskState.EXECUTING)
+        self.assertEqual(tasks.job_state("task4"), TaskState.QUEUED)
+        tasks.sow()
+        self.assertEqual(tasks.queue_depth(), 3)
+        # Let both threads start before releasing them
+        self.assertTrue(self.started.acquire(timeout=5))
+        self.assertTrue(self.started.acquire(timeout=5))
+        self.release.set()
+        tasks.wait_for_all(5)
+        while tasks.queue_depth():
+            tasks.sow()
+            tasks.wait_for_all(5)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(tasks.job_state("task4"), TaskState.NONE)
+        tasks.shutdown(wait=True)
+
+    def test_unique_names(self):
+        calls = []
+        tasks = UniqueTaskThreadManager(self.app, self.halt, 2, name="test_unique")
+        tasks.execute("job", lambda st: calls.append(1))
+        tasks.execute("job", lambda st: calls.append(2))
+        tasks.sow()
+        tasks.wait_for_all(5)
+        tasks.shutdown(wait=True)
+        self.assertEqual(calls, [1])
+
+    def test_reserved_lane(self):
+        tasks = UniqueTaskThreadManager(self.app, self.halt, 3, {"interactive": 1}, name="test_lane")
+        tasks.execute("a", self._task)
+        tasks.execute("b", self._task)
+        self.assertEqual(tasks.available_slots(), 0)
+        self.assertEqual(tasks.available_slots("interactive"), 1)
+        tasks.execute("c", self._task, "interactive")
+        self.assertEqual(tasks.available_slots("interactive"), 0)
+        tasks.shutdown()
+
+    def test_halt_stops_new_tasks(self):
+        tasks = UniqueTaskThreadManager(self.app, self.halt, 2, name="test_halt")
+        seen = []
+        tasks.execute("first", lambda st: seen.append(st.halt.is_set()))
+        self.halt.set()
+        tasks.sow()
+        self.assertEqual(tasks.job_state("first"), TaskState.QUEUED)
+        self.assertTrue(tasks.cancel("first"))
+        self.assertEqual(tasks.job_state("first"), TaskState.NONE)
+        tasks.shutdown()
+        self.assertEqual(seen, [])
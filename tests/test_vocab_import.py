@@ -0,0 +1,52 @@
+import pathlib
+
+from tests import DatabaseTestCase
+from pipeman.vocab.importer import VocabularyImporter, parse_term_row
+
+
+class TestVocabularyImporter(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.importer = VocabularyImporter(chunk_size=3)
+
+    def _write(self, name, content):
+        path = pathlib.Path(self.dir.name) / name
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def _terms(self, vocab_name):
+        return {term.short_name: (term.display_names, term.descriptions) for term in self.importer.cache.get(vocab_name).terms}
+
+    def test_parse_descriptions(self):
+        name, displays, descriptions = parse_term_row(
+            ["display__en", "description__en", "description__fr"],
+            ["Sea Ice", "Frozen", "Gelé"]
+        )
+        self.assertEqual(name, "sea_ice")
+        self.assertEqual(displays, {"en": "Sea Ice"})
+        self.assertEqual(descriptions, {"en": "Frozen", "fr": "Gelé"})
+
+    def test_csv_in_chunks(self):
+        lines = ["short_name,display__en,description__en"] + [f"t{i},Term {i},Desc {i}" for i in range(8)] + ["t1,,Again"]
+        report = self.importer.import_csv("test", self._write("terms.csv", "\n".join(lines) + "\n"))
+        self.assertEqual((report.rows, report.inserted, report.updated), (9, 8, 1))
+        terms = self._terms("test")
+        self.assertEqual(len(terms), 8)
+        self.assertEqual(terms["t1"], ({"en": "Term 1"}, {"en": "Again"}))
+        report = self.importer.import_csv("test", self._write("terms.csv", "\n".join(lines[:9]) + "\n"))
+        self.assertEqual((report.inserted, report.updated, report.unchanged), (0, 1, 7))
+
+    def test_yaml_merge_and_replace(self):
+        self.importer.import_yaml("test", self._write("terms.yaml", "a:\n  display:\n    en: A\nb:\n  display:\n    en: B\n"))
+        self.importer.import_yaml("test", self._write("terms.yaml", "a:\n  display:\n    fr: Ah\n"))
+        self.assertEqual(self._terms("test")["a"][0], {"en": "A", "fr": "Ah"})
+        report = self.importer.import_yaml(
+            "test",
+            self._write("terms.yaml", "terms:\n  a:\n    display:\n      fr: Ah\n  c: ~\n"),
+            replace=True
+        )
+        self.assertEqual((report.inserted, report.updated, report.deleted), (1, 1, 1))
+        terms = self._terms("test")
+        self.assertEqual(set(terms), {"a", "c"})
+        self.assertEqual(terms["a"][0], {"fr": "Ah"})
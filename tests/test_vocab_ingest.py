@@ -0,0 +1,127 @@
+import io
+import json
+import pathlib
+import time
+
+import sqlalchemy as sa
+from click.testing import CliRunner
+from autoinject import injector
+
+from tests import DatabaseTestCase, benchmark
+import pipeman.db.orm as orm
+from pipeman.vocab.ingest import VocabularyIngester, iter_json_array, iter_xml_elements
+from pipeman.vocab.importer import VocabularyImporter
+from pipeman.builtins.netcdf.util import CFVocabularyManager
+from pipeman.plugins.cioos.vocab_fetch import CIOOSVocabularyManager
+import pipeman.plugins.cioos.cli as cioos_cli
+
+
+def _cf_table(count, prefix="name"):
+    entries = "".join(
+        f'<entry id="{prefix}_{i}"><canonical_units>m</canonical_units><grib></grib>'
+        f'<description>Description of {prefix} {i}</description></entry>'
+        for i in range(count)
+    )
+    return (
+        '<?xml version="1.0"?><standard_name_table><version_number>1</version_number>'
+        f'{entries}<alias id="old_{prefix}_0"><entry_id>{prefix}_0</entry_id></alias></standard_name_table>'
+    )
+
+
+class TestVocabularyIngest(DatabaseTestCase):
+
+    def _write(self, name, content):
+        path = pathlib.Path(self.dir.name) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def _terms(self, vocab_name):
+        return {term.short_name: term for term in injector.get(VocabularyImporter).cache.get(vocab_name).terms}
+
+    def test_iter_json_array(self):
+        doc = '{"other": [1], "eovs": [{"value": "a", "n": 12345}, {"value": "b]"}\n], "after": []}'
+        items = list(iter_json_array(io.BytesIO(doc.encode("utf-8")), "eovs", read_size=4))
+        self.assertEqual(items, [{"value": "a", "n": 12345}, {"value": "b]"}])
+        self.assertEqual(list(iter_json_array(io.BytesIO(b"[1, 22, 333]"), read_size=2)), [1, 22, 333])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(b'{"other": 1}'), "eovs"))
+
+    def test_iter_xml_elements(self):
+        names = [e.get("id") for e in iter_xml_elements(io.BytesIO(_cf_table(3).encode("utf-8")), "entry")]
+        self.assertEqual(names, ["name_0", "name_1", "name_2"])
+
+    def test_merge_and_skip(self):
+        ingester = VocabularyIngester()
+        staged = ingester.stage("test")
+        staged.add("a", {"en": "A"}, {"en": ""})
+        staged.add("a", {"fr": "Ah"})
+        staged.add("b", {"en": "B"})
+        report = ingester.apply(staged)
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(self._terms("test")["a"].display_names, {"en": "A", "fr": "Ah"})
+        self.assertEqual(self._terms("test")["a"].descriptions, {})
+        self.assertEqual(ingester.apply(staged).rows, 0)
+        # Removing a term from the database applies the source again
+        with self.db as session:
+            session.execute(sa.delete(orm.VocabularyTerm).where(orm.VocabularyTerm.short_name == "b"))
+            session.commit()
+        self.assertEqual(ingester.apply(staged).inserted, 1)
+        replaced = ingester.stage("test")
+        replaced.add("a", {"en": "A"})
+        report = ingester.apply(replaced, replace=True)
+        self.assertEqual((report.updated, report.deleted), (1, 1))
+        self.assertEqual(set(self._terms("test")), {"a"})
+
+    def test_cf_standard_names_from_file(self):
+        """Loads a local copy of a CF standard name table, then a changed copy."""
+        path = self._write("cf-standard-name-table.xml", _cf_table(20))
+        manager = CFVocabularyManager()
+        manager.fetch_cf_standard_names(path)
+        terms = self._terms("cf_standard_names")
+        self.assertEqual(len(terms), 20)
+        self.assertEqual(terms["name_7"].descriptions, {"en": "Description of name 7"})
+        self.assertNotIn("old_name_0", terms)
+        path = self._write("cf-standard-name-table.xml", _cf_table(20).replace("name 7<", "name seven<"))
+        manager.fetch_cf_standard_names(path)
+        self.assertEqual(self._terms("cf_standard_names")["name_7"].descriptions, {"en": "Description of name seven"})
+
+    @benchmark
+    def test_cf_standard_names_timing(self):
+        """Times the first load of a large CF standard name table against an unchanged and a changed reload."""
+        count = 5000
+        path = self._write("cf-standard-name-table.xml", _cf_table(count))
+        manager = CFVocabularyManager()
+        start = time.perf_counter()
+        manager.fetch_cf_standard_names(path)
+        first_load = time.perf_counter() - start
+        self.assertEqual(len(self._terms("cf_standard_names")), count)
+        start = time.perf_counter()
+        manager.fetch_cf_standard_names(path)
+        unchanged = time.perf_counter() - start
+        path = self._write("cf-standard-name-table.xml", _cf_table(count).replace("name 7<", "name seven<"))
+        start = time.perf_counter()
+        manager.fetch_cf_standard_names(path)
+        one_change = time.perf_counter() - start
+        print(
+            f"\n{count} CF standard names: first load {first_load * 1000:.0f}ms, "
+            f"unchanged {unchanged * 1000:.0f}ms, one change {one_change * 1000:.0f}ms"
+        )
+
+    def test_cioos_eovs(self):
+        manager = CIOOSVocabularyManager()
+        manager.ingester.importer.import_terms("cioos_eovs", [("oxygen", {"en": "Oxygen"}, {})])
+        result = CliRunner().invoke(cioos_cli.cioos, ["update"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("--eovs", result.output)
+        self.assertEqual(set(self._terms("cioos_eovs")), {"oxygen"})
+        path = self._write("eovs.json", json.dumps({"eovs": [{
+            "value": "seaIce",
+            "label EN": "Sea ice",
+            "label FR": "Glace de mer",
+            "definition EN": "Ice",
+            "definition FR": "Glace",
+        }]}))
+        manager.fetch_eovs(path)
+        terms = self._terms("cioos_eovs")
+        self.assertEqual(set(terms), {"oxygen", "seaIce"})
+        self.assertEqual(terms["seaIce"].display_names, {"en": "Sea ice", "fr": "Glace de mer"})
@@ -0,0 +1,120 @@
+import datetime
+import gzip
+import json
+import pathlib
+import threading
+
+import sqlalchemy as sa
+
+from tests import DatabaseTestCase
+import pipeman.db.orm as orm
+from pipeman.workflow.archive import WorkflowItemArchiver
+
+
+class TestWorkflowItemArchiver(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        old = datetime.datetime.now() - datetime.timedelta(days=200)
+        recent = datetime.datetime.now() - datetime.timedelta(days=1)
+        with self.db as session:
+            def _item(name, status, created):
+                item = orm.WorkflowItem(
+                    workflow_type="test",
+                    workflow_name=name,
+                    status=status,
+                    created_date=created,
+                    context="{}"
+                )
+                session.add(item)
+                session.flush()
+                return item.id
+
+            self.old_ids = [_item(f"old{i}", "COMPLETED", old + datetime.timedelta(minutes=i)) for i in range(4)]
+            self.old_ids.append(_item("failed", "FAILURE", old))
+            session.add(orm.WorkflowDecision(
+                workflow_item_id=self.old_ids[0],
+                step_name="review",
+                decider_id="1",
+                decision=True,
+                comments="ok"
+            ))
+            self.keep_ids = {
+                "activated": _item("activated", "COMPLETED", old),
+                "approval": _item("approval", "COMPLETED", old),
+                "unfinished": _item("unfinished", "BATCH_EXECUTE", old),
+                "recent": _item("recent", "COMPLETED", recent),
+            }
+            dataset = orm.Dataset(
+                is_deprecated=False,
+                pub_workflow="default",
+                act_workflow="default",
+                status="ACTIVE",
+                security_level="unclassified",
+                guid="guid",
+                activated_item_id=self.keep_ids["activated"]
+            )
+            session.add(dataset)
+            session.flush()
+            session.add(orm.MetadataEdition(
+                dataset_id=dataset.id,
+                revision_no=1,
+                data="{}",
+                approval_item_id=self.keep_ids["approval"]
+            ))
+            session.commit()
+
+    def _archiver(self, mode="table", batch_size=2):
+        archiver = WorkflowItemArchiver()
+        archiver.mode = mode
+        archiver.batch_size = batch_size
+        archiver.directory = pathlib.Path(self.dir.name) / "archive"
+        return archiver
+
+    def _remaining_ids(self):
+        with self.db as session:
+            return set(session.execute(sa.select(orm.WorkflowItem.id)).scalars())
+
+    def _cutoff(self):
+        return datetime.datetime.now().astimezone() - datetime.timedelta(days=90)
+
+    def test_table_mode(self):
+        archiver = self._archiver()
+        self.assertEqual(archiver.archive_batch(self._cutoff()), 2)
+        self.assertEqual(len(self._remaining_ids()), 7)
+        self.assertEqual(archiver.archive_old_items(), 3)
+        self.assertEqual(self._remaining_ids(), set(self.keep_ids.values()))
+        with self.db as session:
+            archived = {row.id: row for row in session.query(orm.WorkflowItemArchive)}
+            self.assertEqual(set(archived), set(self.old_ids))
+            self.assertEqual(archived[self.old_ids[4]].status, "FAILURE")
+            decisions = json.loads(archived[self.old_ids[0]].decisions)
+            self.assertEqual([(d["step_name"], d["comments"]) for d in decisions], [("review", "ok")])
+            self.assertEqual(session.query(orm.WorkflowDecision).count(), 0)
+
+    def test_file_mode(self):
+        archiver = self._archiver("file")
+        self.assertEqual(archiver.archive_old_items(), 5)
+        self.assertEqual(self._remaining_ids(), set(self.keep_ids.values()))
+        files = sorted(archiver.directory.glob("*.jsonl.gz"))
+        self.assertEqual(len(files), 3)
+        lines = []
+        for file in files:
+            with gzip.open(file, "rt", encoding="utf-8") as h:
+                batch = [json.loads(line) for line in h]
+            self.assertLessEqual(len(batch), 2)
+            lines.extend(batch)
+        self.assertEqual({line["id"] for line in lines}, set(self.old_ids))
+        self.assertEqual(next(line for line in lines if line["id"] == self.old_ids[0])["decisions"][0]["comments"], "ok")
+        self.assertEqual(list(archiver.directory.glob("*.tmp")), [])
+        with self.db as session:
+            self.assertEqual(session.query(orm.WorkflowItemArchive).count(), 0)
+
+    def test_halt_and_retention(self):
+        halt = threading.Event()
+        halt.set()
+        self.assertEqual(self._archiver().archive_old_items(halt), 0)
+        archiver = self._archiver()
+        archiver.retention_days = 0
+        self.assertEqual(archiver.archive_old_items(), 0)
+        self.assertEqual(len(self._remaining_ids()), 9)
@@ -0,0 +1,105 @@
+import datetime
+import threading
+
+from tests import DatabaseTestCase
+import pipeman.db.orm as orm
+from pipeman.workflow.controller import WorkflowCronThread
+
+
+class TestBootLeaseRelease(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = datetime.datetime.now().astimezone()
+        self.items = {}
+        with self.db as session:
+            for name, expiry in (
+                    ("live", now + datetime.timedelta(minutes=10)),
+                    ("expired", now - datetime.timedelta(minutes=1)),
+                    ("legacy", None)):
+                item = orm.WorkflowItem(
+                    workflow_type="test",
+                    workflow_name=name,
+                    status="BATCH_IN_PROGRESS",
+                    locked_by="other-node",
+                    locked_since=now - datetime.timedelta(minutes=1),
+                    lock_expiry=expiry
+                )
+                session.add(item)
+                session.commit()
+                self.items[name] = item.id
+
+    def _statuses(self):
+        with self.db as session:
+            return {
+                name: session.get(orm.WorkflowItem, item_id).status
+                for name, item_id in self.items.items()
+            }
+
+    def test_boot_keeps_unexpired_leases(self):
+        thread = WorkflowCronThread(self.app)
+        thread._release_expired_leases(thread._lock_time, on_boot=True)
+        self.assertEqual(self._statuses(), {
+            "live": "BATCH_IN_PROGRESS",
+            "expired": "BATCH_EXECUTE",
+            "legacy": "BATCH_EXECUTE",
+        })
+
+    def test_reset_all_on_boot(self):
+        thread = WorkflowCronThread(self.app)
+        thread._reset_all_on_boot = True
+        thread._release_expired_leases(thread._lock_time, on_boot=True)
+        self.assertEqual(set(self._statuses().values()), {"BATCH_EXECUTE"})
+
+    def test_periodic_release_keeps_recent_legacy_locks(self):
+        thread = WorkflowCronThread(self.app)
+        thread._release_expired_leases(thread._lock_time)
+        self.assertEqual(self._statuses(), {
+            "live": "BATCH_IN_PROGRESS",
+            "expired": "BATCH_EXECUTE",
+            "legacy": "BATCH_IN_PROGRESS",
+        })
+
+
+class TestIdleWait(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.thread = WorkflowCronThread(self.app)
+        self.thread._sleep_interval = 5
+        self.thread._idle_wait = 60
+
+    def _delay_item(self, seconds):
+        with self.db as session:
+            session.add(orm.WorkflowItem(
+                workflow_type="test",
+                workflow_name="delayed",
+                status="BATCH_DELAY",
+                next_attempt_at=datetime.datetime.now().astimezone() + datetime.timedelta(seconds=seconds)
+            ))
+            session.commit()
+
+    def _listen(self):
+        stop = threading.Event()
+        listener = threading.Thread(target=stop.wait, daemon=True)
+        listener.start()
+        old_listener = self.thread.notifier._listener
+        self.thread.notifier._listener = listener
+        self.addCleanup(setattr, self.thread.notifier, "_listener", old_listener)
+        self.addCleanup(stop.set)
+
+    def test_polls_without_listener(self):
+        self.assertEqual(self.thread._idle_wait_time(), 5)
+
+    def test_waits_longer_with_listener(self):
+        self._listen()
+        self.assertEqual(self.thread._idle_wait_time(), 60)
+
+    def test_wakes_for_delayed_item(self):
+        self._listen()
+        self._delay_item(20)
+        self.assertTrue(15 < self.thread._idle_wait_time() <= 20)
+
+    def test_due_delayed_item(self):
+        self._delay_item(-20)
+        self.assertEqual(self.thread._idle_wait_time(), 1)